@@ -7,14 +7,33 @@ import numpy as np
 from plotly.subplots import make_subplots
 import warnings
 import folium
-from streamlit_folium import folium_static
 from datetime import datetime
 import json
+import os
+import time
+from chargement import FICHIER_DONNEES, ErreurChargement, charger_centroides, codes_insee
+from geometrie import (cadrage, charger_contours, contours_simplifies, ecrire_statique, emprise,
+                        niveau_affichage, version_contours)
+from historique import chronologie, comptes_par_commune, depuis_quand, enregistrer_evaluation
+from indicateurs import (BENCHMARKS_DEFAUT, INDICATEURS, REGLES_SENSIBILITE, SEUILS_ALERTES_DEFAUT, SUFFIXE_PERCENTILE,
+                         agreger_groupes, alertes_dette, alertes_epargne, balayage_seuils, classement, classer_services,
+                         comparaison_benchmarks, comparer_aux_pairs, evolution_rangs, fiche_commune, grille_seuils,
+                         index_classements, index_communes, index_pairs, kpi_principaux, rang_commune, table_annexes)
+from magasin import REPERTOIRE_MAGASIN, lire_departement, magasin_a_jour
+from memoire import cache
+from projection import HYPOTHESES_DEFAUT, PLAFOND_DESENDETTEMENT, projeter
+from profils import (COULEURS_PROFILS, LIBELLES_PROFIL, VARIABLES_PROFIL, communes_similaires, index_similarite,
+                     profils_financiers)
+from rechargement import (TYPES_BUDGET_ANALYSE, SurveillantDonnees, load_consolide, load_index_departements,
+                          load_index_groupes, load_ratios)
+from rendu import (TAILLES_PAGE, afficher_carte, afficher_figure, afficher_tableau, empreinte, page_explorateur,
+                   positions_explorateur)
+from validation import MOTIFS_QUARANTAINE
 warnings.filterwarnings('ignore')
 
 # Configuration de la page
 st.set_page_config(
-    page_title="Dashboard Financier Communal - La Réunion",
+    page_title="Dashboard Financier Communal",
     page_icon="📊",
     layout="wide",
     initial_sidebar_state="expanded"
@@ -76,56 +95,24 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ============================================
-# DONNÉES DE RÉFÉRENCE ET COORDONNÉES GÉOGRAPHIQUES
+# DONNÉES DE RÉFÉRENCE
 # ============================================
 
-# Coordonnées approximatives des communes de La Réunion (latitude, longitude)
-COORDONNEES_COMMUNES = {
-    'LES AVIRONS': (-21.2409, 55.3389),
-    'BRAS-PANON': (-21.0016, 55.6773),
-    'ENTRE-DEUX': (-21.2469, 55.4742),
-    "L'ÉTANG-SALÉ": (-21.2771, 55.3852),
-    'PETITE-ILE': (-21.3533, 55.5662),
-    'LA PLAINE-DES-PALMISTES': (-21.1339, 55.6367),
-    'LE PORT': (-20.9393, 55.2871),
-    'LA POSSESSION': (-20.9284, 55.3341),
-    'SAINT-ANDRÉ': (-20.9633, 55.6503),
-    'SAINT-BENOÎT': (-21.0372, 55.7153),
-    'SAINT-DENIS': (-20.8789, 55.4481),
-    'SAINT-JOSEPH': (-21.3778, 55.6192),
-    'SAINT-LEU': (-21.1706, 55.2881),
-    'SAINT-LOUIS': (-21.2861, 55.4114),
-    'SAINT-PAUL': (-21.0097, 55.2694),
-    'SAINT-PIERRE': (-21.3419, 55.4778),
-    'SAINT-PHILIPPE': (-21.3594, 55.7675),
-    'SAINTE-MARIE': (-20.8978, 55.5492),
-    'SAINTE-ROSE': (-21.1297, 55.7953),
-    'SAINTE-SUZANNE': (-20.9069, 55.6089),
-    'SALAZIE': (-21.0275, 55.5386),
-    'LE TAMPON': (-21.2781, 55.5183),
-    'LES TROIS-BASSINS': (-21.1011, 55.2858),
-    'CILAOS': (-21.1342, 55.4722),
-    'LA RÉUNION': (47.2079, -1.5561)  # Pour la commune métropolitaine
-}
+# Fichier OFGL ou répertoire de fichiers surveillé (variable d'environnement OFGL_SOURCE)
+SOURCE_DONNEES = os.environ.get('OFGL_SOURCE', FICHIER_DONNEES)
 
-# Benchmarks nationaux/régionaux (valeurs fictives - à remplacer par des données réelles)
-BENCHMARKS = {
-    'epargne_brute_moyenne_nationale': 150,  # €/habitant
-    'depenses_moyennes_nationales': 1200,    # €/habitant
-    'recettes_moyennes_nationales': 1350,    # €/habitant
-    'taux_epargne_moyen_national': 11.1,     # %
-    'ratio_depenses_recettes_moyen': 88.9,   # %
-}
+# Magasin Parquet partitionné (magasin.py, variable d'environnement OFGL_MAGASIN) : lu par département s'il est à jour
+MAGASIN_DONNEES = os.environ.get('OFGL_MAGASIN', REPERTOIRE_MAGASIN)
 
-# Seuils d'alerte pour les indicateurs financiers
-SEUILS_ALERTES = {
-    'epargne_brute_seuil_bas': -100,        # €/habitant
-    'epargne_brute_seuil_haut': 300,        # €/habitant
-    'depenses_habitant_seuil_bas': 800,     # €/habitant
-    'depenses_habitant_seuil_haut': 2000,   # €/habitant
-    'ratio_depenses_recettes_seuil': 100,   # %
-    'solde_seuil_negatif': -50,             # €/habitant
-}
+# Département affiché au démarrage
+DEPARTEMENT_DEFAUT = '974'
+
+# Nombre de profils de la typologie affiché au démarrage (carte)
+NB_PROFILS_DEFAUT = 5
+
+# Benchmarks et seuils d'alerte : copies propres à chaque exécution, modifiées par la barre latérale
+BENCHMARKS = dict(BENCHMARKS_DEFAUT)
+SEUILS_ALERTES = dict(SEUILS_ALERTES_DEFAUT)
 
 # ============================================
 # FONCTIONS UTILITAIRES
@@ -163,36 +150,52 @@ def format_population(value):
         return "-"
     return f"{value:,.0f}"
 
-def get_coordonnees(commune):
-    """Récupère les coordonnées d'une commune"""
-    commune_upper = str(commune).upper().strip()
-    return COORDONNEES_COMMUNES.get(commune_upper, (-21.1151, 55.5364))  # Centre de La Réunion par défaut
+def format_annees(value):
+    """Formate une durée en années (capacité de désendettement)"""
+    if pd.isna(value):
+        return "-"
+    if np.isinf(value):
+        return "∞"
+    return f"{value:,.1f} ans"
+
+def couleur_percentile(percentile, sens):
+    """Couleur de marqueur selon le percentile de strate, orienté par le sens de l'indicateur"""
+    if pd.isna(percentile):
+        return 'gray'
+    score = percentile if sens > 0 else 100 - percentile
+    if score < 25:
+        return 'red'
+    elif score < 50:
+        return 'orange'
+    elif score < 75:
+        return 'lightgreen'
+    return 'green'
+
+def classes_carte(donnees, indicateur):
+    """Classe de couleur de chaque commune (mêmes règles que les marqueurs) et couleurs des classes"""
+    if indicateur == 'Profil':
+        return donnees['numero_profil'].to_numpy(dtype=np.float64), COULEURS_PROFILS
+    couleurs = ['red', 'orange', 'lightgreen', 'green']
+    if indicateur == 'epargne_hab':
+        valeurs, bornes = donnees['epargne_hab'].to_numpy(dtype=np.float64), [0, 100, 300]
+    else:
+        percentiles = donnees[indicateur + SUFFIXE_PERCENTILE].to_numpy(dtype=np.float64)
+        valeurs, bornes = (percentiles if INDICATEURS[indicateur]['sens'] > 0 else 100 - percentiles), [25, 50, 75]
+    return np.where(np.isnan(valeurs), np.nan, np.digitize(valeurs, bornes)), couleurs
 
-def analyser_alertes(df_analyse):
+def echelle_discrete(couleurs):
+    """Échelle Plotly en paliers : la classe i (z = i) prend la couleur i"""
+    n = len(couleurs)
+    return [[borne, couleur] for i, couleur in enumerate(couleurs) for borne in (i / n, (i + 1) / n)]
+
+def analyser_alertes(df_analyse, ratios=None):
     """Analyse les données et génère des alertes"""
-    alertes = []
-    
     # Analyse de l'épargne brute
-    if 'Montant_par_habitant' in df_analyse.columns and 'Agregat' in df_analyse.columns:
-        df_epargne = df_analyse[df_analyse['Agregat'] == 'Epargne brute']
-        if not df_epargne.empty:
-            for _, row in df_epargne.iterrows():
-                epargne = row['Montant_par_habitant']
-                if pd.notnull(epargne):
-                    if epargne < SEUILS_ALERTES['epargne_brute_seuil_bas']:
-                        alertes.append({
-                            'type': 'danger',
-                            'commune': row.get('Commune', 'Inconnue'),
-                            'message': f"Épargne brute très faible : {epargne:,.0f} €/hab",
-                            'indicateur': 'Épargne brute'
-                        })
-                    elif epargne > SEUILS_ALERTES['epargne_brute_seuil_haut']:
-                        alertes.append({
-                            'type': 'positive',
-                            'commune': row.get('Commune', 'Inconnue'),
-                            'message': f"Épargne brute exceptionnelle : {epargne:,.0f} €/hab",
-                            'indicateur': 'Épargne brute'
-                        })
+    alertes = alertes_epargne(df_analyse, SEUILS_ALERTES)
+    
+    # Analyse de l'endettement (table des ratios précalculée)
+    if ratios is not None:
+        alertes.extend(alertes_dette(ratios, SEUILS_ALERTES))
     
     return alertes
 
@@ -200,102 +203,222 @@ def analyser_alertes(df_analyse):
 # CHARGEMENT DES DONNÉES
 # ============================================
 
-@st.cache_data
 def load_data():
-    try:
-        df = pd.read_csv('ofgl-base-communes.csv', sep=';', low_memory=False, encoding='utf-8')
-    except:
+    """Version courante du fichier OFGL et son rapport de lecture (rechargée en arrière-plan si le fichier change)"""
+    surveillant = surveillant_donnees()
+    courant = surveillant.courant
+    if courant is None:
+        st.error(f"Impossible de lire le fichier CSV : {surveillant.erreur}")
+        return pd.DataFrame(), {}
+    # Les artefacts des versions remplacées sont libérés du cache
+    cache.invalider(courant[1]['version'])
+    return courant
+
+@cache.en_cache('tables')
+def load_departement(version, departement, magasin, _df_national, _positions):
+    """Lignes du département : sa seule partition du magasin (s'il contient cette version), sinon le fichier national"""
+    if magasin is not None:
         try:
-            df = pd.read_csv('ofgl-base-communes.csv', sep=';', low_memory=False, encoding='latin-1')
-        except:
-            st.error("Impossible de lire le fichier CSV. Vérifiez le format et l'encodage.")
-            return pd.DataFrame()
-    
-    # Nettoyage des colonnes
-    df.columns = df.columns.str.strip()
-    
-    # Standardisation des noms de colonnes
-    column_mapping = {
-        'Exercice': 'Exercice',
-        'Outre-mer': 'Outre_mer',
-        'Code Insee 2024 Région': 'Code_Region',
-        'Nom 2024 Région': 'Nom_Region',
-        'Code Insee 2024 Département': 'Code_Departement',
-        'Nom 2024 Département': 'Nom_Departement',
-        'Code Siren 2024 EPCI': 'Code_EPCI',
-        'Nom 2024 EPCI': 'Nom_EPCI',
-        'Strate population 2024': 'Strate_population',
-        'Commune rurale': 'Commune_rurale',
-        'Commune de montagne': 'Commune_montagne',
-        'Commune touristique': 'Commune_touristique',
-        'Tranche revenu par habitant': 'Tranche_revenu',
-        'Présence QPV': 'Presence_QPV',
-        'Code Insee 2024 Commune': 'Code_Commune',
-        'Nom 2024 Commune': 'Commune',
-        'Catégorie': 'Categorie',
-        'Code Siren Collectivité': 'Code_Siren_Collectivite',
-        'Code Insee Collectivité': 'Code_Insee_Collectivite',
-        'Siret Budget': 'Siret_Budget',
-        'Libellé Budget': 'Libelle_Budget',
-        'Type de budget': 'Type_budget',
-        'Nomenclature': 'Nomenclature',
-        'Agrégat': 'Agregat',
-        'Montant': 'Montant',
-        'Montant en millions': 'Montant_millions',
-        'Population totale': 'Population',
-        'Montant en € par habitant': 'Montant_par_habitant',
-        'Compte 2024 Disponible': 'Compte_disponible',
-        'code_type_budget': 'code_type_budget',
-        'ordre_analyse1_section1': 'ordre_analyse1_section1',
-        'Population totale du dernier exercice': 'Population_dernier_exercice'
+            lignes = lire_departement(departement, magasin, _df_national)
+        except (ErreurChargement, OSError):
+            pass
+        else:
+            if 'Type_service' in _df_national.columns:
+                lignes['Type_service'] = classer_services(lignes)
+            return lignes[list(_df_national.columns)], 'magasin'
+    return _df_national.take(_positions), 'fichier'
+
+@cache.en_cache('index')
+def load_index_communes(version, _df_national):
+    """Positions des lignes de chaque commune et nom affiché, par code commune"""
+    index = index_communes(_df_national)
+    noms = {code: f"{_df_national['Commune'].iat[positions[0]]} ({code})" for code, positions in index.items()}
+    return index, noms
+
+@st.cache_data
+def load_centroides():
+    """Centroïdes INSEE des communes, indexés par code commune"""
+    try:
+        return charger_centroides()
+    except ErreurChargement:
+        return pd.DataFrame(columns=['Latitude', 'Longitude'])
+
+@cache.en_cache('contours')
+def load_contours(version_geometrie, niveau, perimetre, version, _codes):
+    """Contours simplifiés du périmètre, calculés une fois par niveau ; URL du fichier statique si servi"""
+    collection = contours_simplifies(load_contours_bruts(version_geometrie), niveau, _codes)
+    return {
+        'collection': collection,
+        'codes': {entite['properties']['code'] for entite in collection['features']},
+        'url': ecrire_statique(collection, f"contours-{niveau}") if st.get_option('server.enableStaticServing') else None,
+        'cadrage': cadrage(emprise(collection)) if collection['features'] else None,
+        'taille_ko': len(json.dumps(collection, separators=(',', ':'))) / 1000,
     }
-    
-    existing_columns = {}
-    for old_name, new_name in column_mapping.items():
-        if old_name in df.columns:
-            existing_columns[old_name] = new_name
-    
-    df = df.rename(columns=existing_columns)
-    
-    # Conversion des colonnes numériques
-    numeric_cols = ['Montant', 'Montant_millions', 'Population', 
-                    'Montant_par_habitant', 'Population_dernier_exercice',
-                    'Strate_population', 'Tranche_revenu']
-    
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-    
-    # Nettoyage des colonnes texte
-    text_cols = ['Commune_rurale', 'Commune_montagne', 'Commune_touristique', 'Presence_QPV']
-    for col in text_cols:
-        if col in df.columns:
-            df[col] = df[col].astype(str).str.strip().str.upper()
-    
-    # Filtre pour La Réunion
-    if 'Code_Departement' in df.columns:
-        df = df[df['Code_Departement'] == 974]
-    
-    return df
+
+@st.cache_resource
+def load_contours_bruts(version_geometrie):
+    """Contours détaillés des communes (fichier livré), lus une fois par version"""
+    return charger_contours()
+
+@cache.en_cache('tables')
+def load_annexes(version, _df_national):
+    """Montants des budgets annexes pré-agrégés par commune, type de service et agrégat"""
+    return table_annexes(_df_national)
+
+@cache.en_cache('index')
+def load_classements(version, _ratios_national, budgets='principal'):
+    """Rangs, percentiles et ordres de tri de chaque indicateur par exercice"""
+    return index_classements(_ratios_national)
+
+@cache.en_cache('index')
+def load_index_pairs(version, _ratios_national, budgets='principal'):
+    """Quantiles des indicateurs par (exercice, strate, tranche de revenu) sur le fichier national"""
+    return index_pairs(_ratios_national)
+
+@cache.en_cache('index')
+def load_index_similarite(version, exercice, _ratios_national, budgets='principal'):
+    """Matrice standardisée et arbre KD des profils communaux d'un exercice"""
+    return index_similarite(_ratios_national, exercice)
+
+@cache.en_cache('profils')
+def load_profils(version, nb_profils, _ratios_national, budgets='principal'):
+    """Typologie k-means de toutes les (commune, exercice) : affectations et centres"""
+    return profils_financiers(_ratios_national, nb_profils)
+
+@cache.en_cache('projections')
+def load_projection(version, departement, annee, seuil_desendettement, hypotheses, _ratios, budgets='principal'):
+    """Bandes de percentiles Monte Carlo pour toutes les communes d'un exercice (le département identifie _ratios)"""
+    return projeter(_ratios, seuil_desendettement=seuil_desendettement, **hypotheses)
+
+@cache.en_cache('historique')
+def load_historique(version, seuils, _df_national, _ratios_national, budgets='principal'):
+    """Alertes des (commune, exercice) nouvelles ou modifiées ajoutées à l'historique, une fois par version et seuils"""
+    # L'historique SQLite ne distingue pas les vues : seuls les ratios des budgets principaux y entrent
+    return enregistrer_evaluation(_df_national, _ratios_national, dict(seuils), version)
+
+@cache.en_cache('sensibilite')
+def load_sensibilite(version, perimetre, periode, seuil_x, grille_x, seuil_y, grille_y, _ratios,
+                     budgets='principal'):
+    """Balayage des couples de seuils sur les ratios du périmètre et de la période, chronométré"""
+    debut = time.perf_counter()
+    resultat = balayage_seuils(_ratios, seuil_x, grille_seuils(*grille_x), seuil_y, grille_seuils(*grille_y))
+    return resultat, time.perf_counter() - debut
+
+@cache.en_cache('explorateur')
+def load_positions_explorateur(version, perimetre, recherche, colonnes_recherche, tri, croissant, _df):
+    """Lignes retenues et triées de l'explorateur (le périmètre identifie le contenu de _df)"""
+    return positions_explorateur(_df, recherche, colonnes_recherche, tri, croissant)
+
+def prechauffer_caches(df_national, rapport):
+    """Tables dérivées d'une nouvelle version calculées avant qu'elle ne soit servie"""
+    version = rapport['version']
+    # Les deux vues (budgets principaux, consolidés) : basculer de l'une à l'autre ne recalcule rien
+    consolide = load_consolide(version, df_national)
+    for budgets, lignes in [('principal', df_national), ('consolide', consolide)]:
+        ratios = load_ratios(version, lignes, budgets)
+        load_index_pairs(version, ratios, budgets)
+        load_index_groupes(version, None, ratios, budgets)
+        load_classements(version, ratios, budgets)
+        load_index_departements(version, lignes, budgets)
+        # Typologie k-means et arbre KD du dernier exercice, aux réglages par défaut des onglets
+        load_profils(version, NB_PROFILS_DEFAUT, ratios, budgets)
+        if len(ratios):
+            load_index_similarite(version, ratios['Exercice'].max(), ratios, budgets)
+    load_annexes(version, df_national)
+    load_index_communes(version, df_national)
+    # Évaluation incrémentale de l'historique aux seuils par défaut (budgets principaux)
+    load_historique(version, tuple(sorted(SEUILS_ALERTES_DEFAUT.items())), df_national,
+                    load_ratios(version, df_national, 'principal'), 'principal')
+
+@st.cache_resource
+def surveillant_donnees():
+    """Données partagées par toutes les sessions ; la source est surveillée et rechargée à chaud"""
+    return SurveillantDonnees(SOURCE_DONNEES, prechauffer=prechauffer_caches).demarrer()
 
 # ============================================
 # INTERFACE STREAMLIT
 # ============================================
 
-# Titre principal
-st.markdown('<h1 class="main-header">📊 Dashboard Financier des Communes de La Réunion</h1>', unsafe_allow_html=True)
-st.markdown("***Analyse budgétaire - Données OFGL***")
-
 # Chargement des données
-df = load_data()
+df_national, rapport_chargement = load_data()
 
-if df.empty:
+if df_national.empty:
     st.error("Aucune donnée chargée. Vérifiez votre fichier CSV.")
     st.stop()
 
+# Partitions départementales : changer de département n'extrait que les lignes de sa partition
+partitions_departements = load_index_departements(rapport_chargement['version'], df_national)
+noms_departements = {
+    code: str(df_national['Nom_Departement'].iat[positions[0]]) if 'Nom_Departement' in df_national.columns else str(code)
+    for code, positions in partitions_departements.items()
+}
+options_departements = [None] + list(partitions_departements)
+departement_defaut = next((code for code in partitions_departements if str(code) == DEPARTEMENT_DEFAUT), None)
+
+with st.sidebar:
+    departement_selectionne = st.selectbox(
+        "Département",
+        options=options_departements,
+        index=options_departements.index(departement_defaut),
+        format_func=lambda code: "France entière" if code is None else f"{code} - {noms_departements[code]}"
+    )
+    budgets_consolides = st.toggle(
+        "Budgets consolidés (principal + annexes)",
+        value=False,
+        help="Additionne budget principal et budgets annexes de chaque commune (eau, assainissement, transports...) "
+             "pour les ratios, KPI, classements et tendances. Les flux entre budgets ne sont pas neutralisés."
+    )
+
+budgets = 'consolide' if budgets_consolides else 'principal'
+TYPE_BUDGET_ANALYSE = TYPES_BUDGET_ANALYSE[budgets]
+
+if departement_selectionne is None:
+    df, origine_perimetre = df_national, 'fichier'
+    nom_perimetre = "France entière"
+else:
+    # Magasin lu seulement s'il contient exactement la version chargée (contrôle par date et taille des fichiers)
+    magasin = MAGASIN_DONNEES if magasin_a_jour(rapport_chargement['fichiers'], MAGASIN_DONNEES) else None
+    df, origine_perimetre = load_departement(rapport_chargement['version'], departement_selectionne, magasin,
+                                             df_national, partitions_departements[departement_selectionne])
+    nom_perimetre = noms_departements[departement_selectionne]
+
+if df.empty:
+    st.error("Aucune donnée pour ce département.")
+    st.stop()
+
+# Lignes analysées : celles du fichier, ou leur vue consolidée précalculée (même partitionnement)
+if budgets_consolides:
+    df_budgets_national = load_consolide(rapport_chargement['version'], df_national)
+    if departement_selectionne is None:
+        df_budgets = df_budgets_national
+    else:
+        partitions_consolidees = load_index_departements(rapport_chargement['version'], df_budgets_national, budgets)
+        df_budgets = df_budgets_national.take(partitions_consolidees[departement_selectionne])
+else:
+    df_budgets_national = df_national
+    df_budgets = df
+
+# Titre principal
+st.markdown(f'<h1 class="main-header">📊 Dashboard Financier des Communes - {nom_perimetre}</h1>', unsafe_allow_html=True)
+st.markdown(f"***Analyse budgétaire ({'budgets consolidés' if budgets_consolides else 'budgets principaux'}) - Données OFGL***")
+
+ratios_national = load_ratios(rapport_chargement['version'], df_budgets_national, budgets)
+pairs_national = load_index_pairs(rapport_chargement['version'], ratios_national, budgets)
+
 # Sidebar - Filtres et configuration
 with st.sidebar:
     st.markdown("## 🔧 Filtres et Configuration")
+    st.caption(
+        f"📂 {rapport_chargement['lignes_lues']:,} lignes lues, {len(df):,} pour {nom_perimetre} "
+        f"en {rapport_chargement['duree_lecture_s']:.2f} s ({rapport_chargement['encodage']}, {rapport_chargement['moteur']})"
+    )
+    if origine_perimetre == 'magasin':
+        st.caption(f"🗄️ {nom_perimetre} lu dans sa partition du magasin Parquet ({MAGASIN_DONNEES})")
+    surveillant = surveillant_donnees()
+    if surveillant.rechargement_en_cours:
+        st.caption("🔄 Nouvelle version des données en préparation : la version actuelle reste affichée")
+    if surveillant.erreur:
+        st.warning(f"Rechargement impossible, version précédente conservée : {surveillant.erreur}")
     
     # Onglets dans la sidebar
     sidebar_tab1, sidebar_tab2, sidebar_tab3 = st.tabs(["Filtres", "Benchmarks", "Alertes"])
@@ -410,12 +533,30 @@ with st.sidebar:
                 step=5.0
             )
         
+        st.markdown("#### Seuils d'endettement")
+        col_alert3, col_alert4 = st.columns(2)
+        with col_alert3:
+            SEUILS_ALERTES['capacite_desendettement_seuil'] = st.number_input(
+                "Capacité de désendettement seuil (ans)",
+                value=12.0,
+                min_value=0.0,
+                step=1.0
+            )
+        with col_alert4:
+            SEUILS_ALERTES['annuite_recettes_seuil'] = st.number_input(
+                "Annuité/recettes seuil (%)",
+                value=15.0,
+                min_value=0.0,
+                max_value=100.0,
+                step=1.0
+            )
+        
         # Bouton pour analyser les alertes
         if st.button("🔍 Analyser les alertes", type="secondary"):
             st.session_state['analyse_alertes'] = True
 
 # Application des filtres
-filtered_df = df.copy()
+filtered_df = df_budgets.copy()
 
 if 'Exercice' in filtered_df.columns:
     filtered_df = filtered_df[filtered_df['Exercice'] == selected_year]
@@ -426,6 +567,12 @@ if selected_epci:
 if selected_communes:
     filtered_df = filtered_df[filtered_df['Commune'].isin(selected_communes)]
 
+# Ratios d'endettement de la sélection
+ratios_filtres = ratios_national[
+    (ratios_national['Exercice'] == selected_year)
+    & ratios_national['Code_Commune'].isin(filtered_df['Code_Commune'].unique())
+]
+
 # ============================================
 # SECTION PRINCIPALE - KPI ET ALERTES
 # ============================================
@@ -434,7 +581,7 @@ st.markdown('<h2 class="sub-header">📈 Vue d\'ensemble - Santé Financière</h
 
 # Section d'alertes
 if 'analyse_alertes' in st.session_state and st.session_state['analyse_alertes']:
-    alertes = analyser_alertes(filtered_df)
+    alertes = analyser_alertes(filtered_df, ratios_filtres)
     if alertes:
         st.markdown("### ⚠️ Alertes Financières")
         for alerte in alertes:
@@ -460,48 +607,44 @@ if 'analyse_alertes' in st.session_state and st.session_state['analyse_alertes']
         st.success("✅ Aucune alerte financière critique détectée")
 
 # KPI Principaux
-df_principal = filtered_df[filtered_df['Type_budget'] == 'Budget principal']
+df_principal = filtered_df[filtered_df['Type_budget'] == TYPE_BUDGET_ANALYSE]
 
 if not df_principal.empty:
+    kpi = kpi_principaux(filtered_df, TYPE_BUDGET_ANALYSE)
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
         if 'Agregat' in df_principal.columns and 'Montant' in df_principal.columns:
-            total_epargne = df_principal[df_principal['Agregat'] == 'Epargne brute']['Montant'].sum() / 1_000_000
             st.markdown(f"""
             <div class="kpi-card">
-                <div class="kpi-value">{total_epargne:.1f} M€</div>
+                <div class="kpi-value">{kpi['epargne_brute_totale_meur']:.1f} M€</div>
                 <div class="kpi-label">Épargne brute totale</div>
             </div>
             """, unsafe_allow_html=True)
     
     with col2:
         if 'Commune' in df_principal.columns:
-            communes_count = df_principal['Commune'].nunique()
             st.markdown(f"""
             <div class="kpi-card">
-                <div class="kpi-value">{communes_count}</div>
+                <div class="kpi-value">{kpi['nb_communes']}</div>
                 <div class="kpi-label">Communes analysées</div>
             </div>
             """, unsafe_allow_html=True)
     
     with col3:
         if 'Population' in df_principal.columns:
-            total_population = df_principal['Population'].sum()
             st.markdown(f"""
             <div class="kpi-card">
-                <div class="kpi-value">{total_population:,.0f}</div>
+                <div class="kpi-value">{kpi['population_totale']:,.0f}</div>
                 <div class="kpi-label">Population totale</div>
             </div>
             """, unsafe_allow_html=True)
     
     with col4:
         if 'Agregat' in df_principal.columns and 'Montant' in df_principal.columns:
-            df_recettes = df_principal[df_principal['Agregat'] == 'Recettes totales hors emprunts']
-            total_recettes = df_recettes['Montant'].sum() / 1_000_000 if not df_recettes.empty else 0
             st.markdown(f"""
             <div class="kpi-card">
-                <div class="kpi-value">{total_recettes:.1f} M€</div>
+                <div class="kpi-value">{kpi['recettes_totales_meur']:.1f} M€</div>
                 <div class="kpi-label">Recettes totales</div>
             </div>
             """, unsafe_allow_html=True)
@@ -510,129 +653,312 @@ if not df_principal.empty:
 # ONGLETS PRINCIPAUX
 # ============================================
 
-tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
+tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9, tab10, tab11, tab12 = st.tabs([
     "🗺️ Carte Géographique",
     "📈 Tendances Multi-années",
     "📊 Benchmarks",
     "🏛️ Santé Financière",
     "💧 Budgets Annexes",
-    "📋 Rapport PDF"
+    "📋 Rapport PDF",
+    "🔮 Projections",
+    "🔎 Explorateur",
+    "🏘️ Fiche Commune",
+    "🧪 Qualité des Données",
+    "📜 Historique des Alertes",
+    "🎚️ Sensibilité des Seuils"
 ])
 
 # TAB 1: CARTE GÉOGRAPHIQUE
 with tab1:
     try:
-        st.markdown("### 🗺️ Carte Géographique des Communes de La Réunion")
+        st.markdown(f"### 🗺️ Carte Géographique des Communes - {nom_perimetre}")
         
-        # Création de la carte centrée sur La Réunion
-        m = folium.Map(location=[-21.1151, 55.5364], zoom_start=10)
+        # Indicateur représenté par la couleur des marqueurs
+        col_carte1, col_carte2 = st.columns([3, 1])
+        with col_carte1:
+            indicateur_carte = st.selectbox(
+                "Indicateur affiché sur la carte",
+                options=['epargne_hab', 'encours_hab', 'capacite_desendettement', 'annuite_recettes', 'Profil'],
+                format_func=lambda nom: INDICATEURS[nom]['libelle'] if nom in INDICATEURS else "Profil financier (typologie)"
+            )
+        with col_carte2:
+            nb_profils = st.slider("Nombre de profils", min_value=2, max_value=len(COULEURS_PROFILS), value=NB_PROFILS_DEFAUT)
         
-        # Préparation des données pour la carte
-        if 'Agregat' in df_principal.columns and 'Montant_par_habitant' in df_principal.columns:
-            df_epargne = df_principal[df_principal['Agregat'] == 'Epargne brute']
+        # Typologie calculée une fois pour toutes les communes et années du fichier national
+        affectations_profils, centres_profils = load_profils(rapport_chargement['version'], nb_profils, ratios_national, budgets)
+        donnees_carte = ratios_filtres
+        if not affectations_profils.empty:
+            donnees_carte = ratios_filtres.merge(
+                affectations_profils[['Exercice', 'Code_Commune', 'numero_profil', 'Profil']],
+                on=['Exercice', 'Code_Commune'],
+                how='left'
+            )
+        
+        # Contours des communes : géométrie simplifiée une fois par niveau, seules les classes changent ensuite
+        version_geometrie = version_contours()
+        representation = st.radio("Représentation", options=['Contours', 'Marqueurs'], horizontal=True,
+                                  index=0 if version_geometrie else 1)
+        
+        if representation == 'Contours' and version_geometrie:
+            codes_carte = codes_insee(donnees_carte['Code_Commune'])
+            codes_perimetre = codes_insee(pd.Series(df['Code_Commune'].dropna().unique()))
+            niveau_contours = niveau_affichage(len(codes_perimetre))
+            contours = load_contours(version_geometrie, niveau_contours, departement_selectionne,
+                                     rapport_chargement['version'], tuple(codes_perimetre))
+            classes, couleurs_classes = classes_carte(donnees_carte, indicateur_carte)
+            if indicateur_carte == 'Profil':
+                valeurs_survol = donnees_carte['Profil'].astype(str)
+            else:
+                valeurs_survol = (INDICATEURS[indicateur_carte]['libelle'] + ' : '
+                                  + donnees_carte[indicateur_carte].map(lambda valeur: format_number_for_display(valeur, 1)))
             
-            # Ajout des marqueurs pour chaque commune
-            for _, row in df_epargne.iterrows():
-                commune = row.get('Commune', '')
-                epargne = row.get('Montant_par_habitant', 0)
-                population = row.get('Population', 0)
+            def construire_fig_contours():
+                fig_contours = go.Figure(go.Choroplethmap(
+                    geojson=contours['url'] or contours['collection'],
+                    featureidkey='properties.code',
+                    locations=codes_carte,
+                    z=classes,
+                    zmin=-0.5,
+                    zmax=len(couleurs_classes) - 0.5,
+                    colorscale=echelle_discrete(couleurs_classes),
+                    showscale=False,
+                    marker_opacity=0.75,
+                    marker_line_width=0.5,
+                    marker_line_color='white',
+                    hovertext=donnees_carte['Commune'].astype(str) + '<br>' + valeurs_survol,
+                    hoverinfo='text'
+                ))
+                centre, zoom = contours['cadrage'] or ({'lat': 46.6, 'lon': 2.4}, 4.5)
+                fig_contours.update_layout(map=dict(style='carto-positron', center=centre, zoom=zoom),
+                                           height=600, margin=dict(l=0, r=0, t=0, b=0))
+                return fig_contours
+            
+            afficher_figure(
+                'carte_contours',
+                donnees_carte[['Code_Commune', 'Commune']].assign(classe=classes, survol=valeurs_survol.to_numpy()),
+                (indicateur_carte, niveau_contours, departement_selectionne, version_geometrie, contours['url']),
+                construire_fig_contours
+            )
+            sans_contour = (~codes_carte.isin(contours['codes'])).sum()
+            st.caption(f"🗺️ Contours niveau « {niveau_contours} » : {len(contours['codes']):,} communes, "
+                       f"{contours['taille_ko']:,.0f} Ko "
+                       + ("(fichier statique mis en cache par le navigateur)" if contours['url'] else "(envoyés avec la figure)")
+                       + (f" ; {sans_contour} commune(s) sans contour non représentée(s)" if sans_contour else ""))
+        else:
+            # Coordonnées issues des centroïdes INSEE ; les communes absentes de la table ne sont pas placées
+            centroides = load_centroides()
+            donnees_carte = donnees_carte.merge(
+                centroides, left_on=codes_insee(donnees_carte['Code_Commune']).to_numpy(), right_index=True, how='left'
+            )
+            sans_coordonnees = donnees_carte['Latitude'].isna().sum()
+            donnees_carte = donnees_carte.dropna(subset=['Latitude', 'Longitude'])
+            
+            def construire_carte_marqueurs():
+                # Création de la carte centrée sur les communes affichées
+                if donnees_carte.empty:
+                    m = folium.Map(location=[46.6, 2.4], zoom_start=5)
+                else:
+                    m = folium.Map(location=[donnees_carte['Latitude'].mean(), donnees_carte['Longitude'].mean()], zoom_start=10)
+                    m.fit_bounds([[donnees_carte['Latitude'].min(), donnees_carte['Longitude'].min()],
+                                  [donnees_carte['Latitude'].max(), donnees_carte['Longitude'].max()]])
                 
-                if pd.notnull(epargne) and commune:
-                    # Déterminer la couleur en fonction de l'épargne
-                    if epargne < 0:
-                        color = 'red'
-                    elif epargne < 100:
-                        color = 'orange'
-                    elif epargne < 300:
-                        color = 'lightgreen'
-                    else:
-                        color = 'green'
-                    
-                    # Récupérer les coordonnées
-                    lat, lon = get_coordonnees(commune)
-                    
-                    # Créer le popup HTML
-                    popup_html = f"""
-                    <div style="width: 250px;">
-                        <h4 style="color: #1E3A8A; margin-bottom: 5px;">{commune}</h4>
-                        <p style="margin: 2px 0;"><strong>Épargne brute:</strong> {epargne:,.0f} €/hab</p>
-                        <p style="margin: 2px 0;"><strong>Population:</strong> {population:,.0f} hab</p>
-                        <p style="margin: 2px 0;"><strong>Épargne totale:</strong> {(epargne * population):,.0f} €</p>
-                    </div>
-                    """
-                    
-                    # Ajouter le marqueur
-                    folium.Marker(
-                        location=[lat, lon],
-                        popup=folium.Popup(popup_html, max_width=300),
-                        tooltip=commune,
-                        icon=folium.Icon(color=color, icon='info-sign')
-                    ).add_to(m)
-        
-        # Affichage de la carte
-        folium_static(m, width=1000, height=600)
+                # Ajout des marqueurs pour chaque commune (une ligne de la table des ratios par commune)
+                for row in donnees_carte.itertuples(index=False):
+                    commune = row.Commune
+                    valeur = getattr(row, indicateur_carte, None) if indicateur_carte != 'Profil' else getattr(row, 'numero_profil', None)
+                    epargne = row.epargne_hab
+                    population = row.Population
+                
+                    if pd.notnull(valeur) and commune:
+                        # Déterminer la couleur : seuils pour l'épargne, profil, percentile de strate pour la dette
+                        if indicateur_carte == 'Profil':
+                            color = COULEURS_PROFILS[int(valeur)]
+                        elif indicateur_carte == 'epargne_hab':
+                            if epargne < 0:
+                                color = 'red'
+                            elif epargne < 100:
+                                color = 'orange'
+                            elif epargne < 300:
+                                color = 'lightgreen'
+                            else:
+                                color = 'green'
+                        else:
+                            color = couleur_percentile(
+                                getattr(row, indicateur_carte + SUFFIXE_PERCENTILE),
+                                INDICATEURS[indicateur_carte]['sens']
+                            )
+                
+                        lat, lon = row.Latitude, row.Longitude
+                
+                        # Créer le popup HTML
+                        ligne_percentile = ""
+                        if indicateur_carte in INDICATEURS:
+                            ligne_percentile = f"""<p style="margin: 2px 0;"><strong>Percentile strate ({INDICATEURS[indicateur_carte]['libelle']}):</strong> {format_number_for_display(getattr(row, indicateur_carte + SUFFIXE_PERCENTILE), 0)}</p>"""
+                        popup_html = f"""
+                        <div style="width: 250px;">
+                            <h4 style="color: #1E3A8A; margin-bottom: 5px;">{commune}</h4>
+                            <p style="margin: 2px 0;"><strong>Épargne brute:</strong> {epargne:,.0f} €/hab</p>
+                            <p style="margin: 2px 0;"><strong>Population:</strong> {population:,.0f} hab</p>
+                            <p style="margin: 2px 0;"><strong>Épargne totale:</strong> {(epargne * population):,.0f} €</p>
+                            <p style="margin: 2px 0;"><strong>Encours de dette:</strong> {format_number_for_display(row.encours_hab, 0)} €/hab</p>
+                            <p style="margin: 2px 0;"><strong>Annuité/recettes:</strong> {format_number_for_display(row.annuite_recettes)}%</p>
+                            <p style="margin: 2px 0;"><strong>Capacité de désendettement:</strong> {format_annees(row.capacite_desendettement)}</p>
+                            {ligne_percentile}
+                            <p style="margin: 2px 0;"><strong>Profil financier:</strong> {getattr(row, 'Profil', '-')}</p>
+                        </div>
+                        """
+                
+                        # Ajouter le marqueur
+                        folium.Marker(
+                            location=[lat, lon],
+                            popup=folium.Popup(popup_html, max_width=300),
+                            tooltip=commune,
+                            icon=folium.Icon(color=color, icon='info-sign')
+                        ).add_to(m)
+                return m
+            
+            # Affichage de la carte (HTML en cache : les marqueurs ne sont reconstruits que si les données changent)
+            afficher_carte('carte_marqueurs', donnees_carte, (indicateur_carte, nb_profils), construire_carte_marqueurs,
+                           width=1000, height=600)
+            if sans_coordonnees:
+                st.caption(f"📍 {sans_coordonnees} commune(s) absente(s) de la table des centroïdes INSEE non placée(s)")
         
         # Légende
         col_leg1, col_leg2, col_leg3, col_leg4 = st.columns(4)
-        with col_leg1:
-            st.markdown("🔴 **< 0 €/hab** - Déficit")
-        with col_leg2:
-            st.markdown("🟠 **0-100 €/hab** - Faible")
-        with col_leg3:
-            st.markdown("🟢 **100-300 €/hab** - Bonne")
-        with col_leg4:
-            st.markdown("🟢 **> 300 €/hab** - Excellente")
+        if indicateur_carte == 'Profil':
+            for numero, profil in enumerate(centres_profils.index):
+                with [col_leg1, col_leg2, col_leg3, col_leg4][numero % 4]:
+                    st.markdown(
+                        f'<span style="color: {COULEURS_PROFILS[numero]}; font-size: 1.2rem;">●</span> **{profil}**',
+                        unsafe_allow_html=True
+                    )
+        elif indicateur_carte == 'epargne_hab':
+            with col_leg1:
+                st.markdown("🔴 **< 0 €/hab** - Déficit")
+            with col_leg2:
+                st.markdown("🟠 **0-100 €/hab** - Faible")
+            with col_leg3:
+                st.markdown("🟢 **100-300 €/hab** - Bonne")
+            with col_leg4:
+                st.markdown("🟢 **> 300 €/hab** - Excellente")
+        else:
+            with col_leg1:
+                st.markdown("🔴 **Quart le plus endetté** de la strate")
+            with col_leg2:
+                st.markdown("🟠 **2e quart** de la strate")
+            with col_leg3:
+                st.markdown("🟢 **3e quart** de la strate")
+            with col_leg4:
+                st.markdown("🟢 **Quart le moins endetté** de la strate")
         
         # Statistiques géographiques
         st.markdown("### 📊 Statistiques par zone géographique")
         
-        # Définir les zones géographiques approximatives
-        zones = {
-            'Nord': ['SAINT-DENIS', 'SAINTE-MARIE', 'SAINTE-SUZANNE'],
-            'Est': ['SAINT-ANDRÉ', 'SAINT-BENOÎT', 'BRAS-PANON', 'SAINTE-ROSE', 'LA PLAINE-DES-PALMISTES'],
-            'Sud': ['SAINT-PIERRE', 'SAINT-LOUIS', 'SAINT-JOSEPH', 'LE TAMPON', 'PETITE-ILE', "L'ÉTANG-SALÉ", 'LES AVIRONS', 'SAINT-PHILIPPE', 'ENTRE-DEUX'],
-            'Ouest': ['SAINT-PAUL', 'LE PORT', 'LA POSSESSION', 'SAINT-LEU', 'LES TROIS-BASSINS'],
-            'Cirques': ['CILAOS', 'SALAZIE']
-        }
+        col_groupe1, col_groupe2, col_groupe3 = st.columns(3)
+        with col_groupe1:
+            dimension_groupe = st.radio(
+                "Regroupement",
+                options=['Zone', 'Nom_EPCI'],
+                format_func=lambda nom: {'Zone': 'Zone géographique', 'Nom_EPCI': 'EPCI'}[nom],
+                horizontal=True
+            )
+        with col_groupe2:
+            indicateur_groupe = st.selectbox(
+                "Indicateur par groupe",
+                options=list(INDICATEURS),
+                format_func=lambda nom: INDICATEURS[nom]['libelle']
+            )
+        with col_groupe3:
+            ponderation_groupe = st.radio(
+                "Moyenne",
+                options=['ponderee', 'moyenne'],
+                format_func=lambda nom: {'ponderee': 'Pondérée par la population', 'moyenne': 'Simple'}[nom],
+                horizontal=True
+            )
         
-        zone_data = []
-        for zone, communes_zone in zones.items():
-            df_zone = df_epargne[df_epargne['Commune'].str.upper().isin(communes_zone)]
-            if not df_zone.empty:
-                avg_epargne = df_zone['Montant_par_habitant'].mean()
-                total_pop = df_zone['Population'].sum()
-                zone_data.append({
-                    'Zone': zone,
-                    'Nombre de communes': len(df_zone),
-                    'Population totale': total_pop,
-                    'Épargne moyenne/hab': avg_epargne
-                })
+        # Agrégats précalculés du périmètre si toutes ses communes sont retenues, sinon un regroupement sur la sélection
+        if ratios_filtres['Code_Commune'].nunique() == df['Code_Commune'].nunique():
+            ratios_perimetre = ratios_national if departement_selectionne is None else \
+                ratios_national[ratios_national['Code_Commune'].isin(df['Code_Commune'].unique())]
+            groupes = load_index_groupes(rapport_chargement['version'], departement_selectionne, ratios_perimetre,
+                                         budgets)[dimension_groupe]
+            groupes = groupes[groupes.index.get_level_values('Exercice') == selected_year]
+        else:
+            groupes = agreger_groupes(ratios_filtres, dimension_groupe)
+        
+        zone_df = groupes.reset_index().rename(columns={
+            dimension_groupe: 'Zone' if dimension_groupe == 'Zone' else 'EPCI',
+            'nb_communes': 'Nombre de communes',
+            'population': 'Population totale',
+            f"{indicateur_groupe}_moyenne": f"{INDICATEURS[indicateur_groupe]['libelle']} (moyenne simple)",
+            f"{indicateur_groupe}_ponderee": f"{INDICATEURS[indicateur_groupe]['libelle']} (moyenne pondérée)"
+        })
+        libelle_groupe = 'Zone' if dimension_groupe == 'Zone' else 'EPCI'
+        libelle_valeur = f"{INDICATEURS[indicateur_groupe]['libelle']} ({'moyenne pondérée' if ponderation_groupe == 'ponderee' else 'moyenne simple'})"
         
-        if zone_data:
-            zone_df = pd.DataFrame(zone_data)
+        if not zone_df.empty:
+            # Graphique comparatif par groupe
+            def construire_fig_zone():
+                fig_zone = px.bar(
+                    zone_df,
+                    x=libelle_groupe,
+                    y=libelle_valeur,
+                    color=libelle_valeur,
+                    color_continuous_scale='RdYlGn' if INDICATEURS[indicateur_groupe]['sens'] > 0 else 'RdYlGn_r',
+                    title=f"{INDICATEURS[indicateur_groupe]['libelle']} par {libelle_groupe.lower()}",
+                    text_auto='.0f'
+                )
+                fig_zone.update_layout(height=400)
+                return fig_zone
             
-            # Graphique comparatif par zone
-            fig_zone = px.bar(
-                zone_df,
-                x='Zone',
-                y='Épargne moyenne/hab',
-                color='Épargne moyenne/hab',
-                color_continuous_scale='RdYlGn',
-                title="Épargne brute moyenne par zone géographique",
-                text_auto='.0f'
-            )
-            fig_zone.update_layout(height=400)
-            st.plotly_chart(fig_zone, use_container_width=True)
+            afficher_figure('zone', zone_df, (libelle_groupe, libelle_valeur, indicateur_groupe), construire_fig_zone)
             
-            # Tableau des zones
-            st.dataframe(
-                zone_df.style.format({
+            # Tableau des groupes
+            colonnes_valeurs = [f"{INDICATEURS[indicateur_groupe]['libelle']} (moyenne simple)",
+                                f"{INDICATEURS[indicateur_groupe]['libelle']} (moyenne pondérée)"]
+            afficher_tableau(
+                zone_df[[libelle_groupe, 'Nombre de communes', 'Population totale'] + colonnes_valeurs],
+                formats={
                     'Population totale': '{:,.0f}',
-                    'Épargne moyenne/hab': '{:,.0f} €'
-                }),
-                use_container_width=True
+                    **{colonne: '{:,.1f}' for colonne in colonnes_valeurs}
+                }
             )
         
+        # Synthèse par profil financier (typologie k-means)
+        if not centres_profils.empty:
+            st.markdown("### 🧬 Statistiques par profil financier")
+            
+            profils_selection = donnees_carte.dropna(subset=['Profil'])
+            if not profils_selection.empty:
+                profil_df = profils_selection.groupby('Profil', observed=True).agg(
+                    nb_communes=('Commune', 'nunique'),
+                    population=('Population', 'sum'),
+                    epargne=('epargne_hab', 'mean'),
+                    recettes=('recettes_hab', 'mean'),
+                    encours=('encours_hab', 'mean')
+                ).reset_index().rename(columns={
+                    'nb_communes': 'Nombre de communes',
+                    'population': 'Population totale',
+                    'epargne': 'Épargne moyenne/hab',
+                    'recettes': 'Recettes moyennes/hab',
+                    'encours': 'Encours moyen/hab'
+                })
+                afficher_tableau(
+                    profil_df,
+                    formats={
+                        'Population totale': '{:,.0f}',
+                        'Épargne moyenne/hab': '{:,.0f} €',
+                        'Recettes moyennes/hab': '{:,.0f} €',
+                        'Encours moyen/hab': '{:,.0f} €'
+                    }
+                )
+            
+            with st.expander("Centres des profils (toutes communes et années du fichier)"):
+                afficher_tableau(
+                    centres_profils.rename(columns={**LIBELLES_PROFIL, 'effectif': 'Effectif'}),
+                    formats={LIBELLES_PROFIL[nom]: '{:,.1f}' for nom in VARIABLES_PROFIL}
+                )
+        
     except Exception as e:
         st.error(f"Erreur dans la carte géographique : {str(e)}")
 
@@ -645,16 +971,16 @@ with tab2:
         st.info("ℹ️ Pour une analyse multi-années complète, chargez des données pour plusieurs années")
         
         # Création de données simulées pour démonstration
-        if 'Exercice' in df.columns:
-            annees = sorted(df['Exercice'].dropna().unique())
+        if 'Exercice' in df_budgets.columns:
+            annees = sorted(df_budgets['Exercice'].dropna().unique())
             
             if len(annees) > 1:
                 # Analyse par année
                 trends_data = []
                 
                 for annee in annees:
-                    df_annee = df[df['Exercice'] == annee]
-                    df_principal_annee = df_annee[df_annee['Type_budget'] == 'Budget principal']
+                    df_annee = df_budgets[df_budgets['Exercice'] == annee]
+                    df_principal_annee = df_annee[df_annee['Type_budget'] == TYPE_BUDGET_ANALYSE]
                     
                     if not df_principal_annee.empty:
                         # Calcul des indicateurs par année
@@ -678,41 +1004,43 @@ with tab2:
                     trends_df = pd.DataFrame(trends_data)
                     
                     # Graphique d'évolution
-                    fig_trends = go.Figure()
+                    def construire_fig_trends():
+                        fig_trends = go.Figure()
                     
-                    fig_trends.add_trace(go.Scatter(
-                        x=trends_df['Année'],
-                        y=trends_df['Épargne brute/hab'],
-                        name='Épargne brute/hab',
-                        mode='lines+markers',
-                        line=dict(color='#10B981', width=3)
-                    ))
+                        fig_trends.add_trace(go.Scatter(
+                            x=trends_df['Année'],
+                            y=trends_df['Épargne brute/hab'],
+                            name='Épargne brute/hab',
+                            mode='lines+markers',
+                            line=dict(color='#10B981', width=3)
+                        ))
                     
-                    fig_trends.add_trace(go.Scatter(
-                        x=trends_df['Année'],
-                        y=trends_df['Recettes/hab'],
-                        name='Recettes/hab',
-                        mode='lines+markers',
-                        line=dict(color='#3B82F6', width=3)
-                    ))
+                        fig_trends.add_trace(go.Scatter(
+                            x=trends_df['Année'],
+                            y=trends_df['Recettes/hab'],
+                            name='Recettes/hab',
+                            mode='lines+markers',
+                            line=dict(color='#3B82F6', width=3)
+                        ))
                     
-                    fig_trends.add_trace(go.Scatter(
-                        x=trends_df['Année'],
-                        y=trends_df['Capacité financement/hab'],
-                        name='Capacité financement/hab',
-                        mode='lines+markers',
-                        line=dict(color='#8B5CF6', width=3)
-                    ))
+                        fig_trends.add_trace(go.Scatter(
+                            x=trends_df['Année'],
+                            y=trends_df['Capacité financement/hab'],
+                            name='Capacité financement/hab',
+                            mode='lines+markers',
+                            line=dict(color='#8B5CF6', width=3)
+                        ))
                     
-                    fig_trends.update_layout(
-                        title="Évolution des indicateurs financiers par année",
-                        height=500,
-                        xaxis_title="Année",
-                        yaxis_title="€ par habitant",
-                        hovermode="x unified"
-                    )
+                        fig_trends.update_layout(
+                            title="Évolution des indicateurs financiers par année",
+                            height=500,
+                            xaxis_title="Année",
+                            yaxis_title="€ par habitant",
+                            hovermode="x unified"
+                        )
+                        return fig_trends
                     
-                    st.plotly_chart(fig_trends, use_container_width=True)
+                    afficher_figure('tendances', trends_df, (), construire_fig_trends)
                     
                     # Calcul des variations
                     st.markdown("### 📊 Analyse des Variations")
@@ -749,18 +1077,16 @@ with tab2:
                             )
                         
                         # Tableau des tendances
-                        st.dataframe(
-                            trends_df.style.format({
+                        afficher_tableau(
+                            trends_df,
+                            formats={
                                 'Épargne brute/hab': '{:,.0f} €',
                                 'Recettes/hab': '{:,.0f} €',
                                 'Capacité financement/hab': '{:,.0f} €',
                                 'Var_epargne_%': '{:+.1f}%',
                                 'Var_recettes_%': '{:+.1f}%'
-                            }).background_gradient(
-                                subset=['Var_epargne_%', 'Var_recettes_%'],
-                                cmap='RdYlGn'
-                            ),
-                            use_container_width=True
+                            },
+                            degrades={'Var_epargne_%': 'RdYlGn', 'Var_recettes_%': 'RdYlGn'}
                         )
             else:
                 st.info("Une seule année de données disponible. Chargez des données multi-années pour l'analyse des tendances.")
@@ -796,70 +1122,27 @@ with tab3:
             df_recettes = df_principal[df_principal['Agregat'] == 'Recettes totales hors emprunts']
             
             if not df_epargne.empty and not df_recettes.empty:
-                # Calcul des moyennes locales
-                epargne_moyenne_locale = df_epargne['Montant_par_habitant'].mean()
-                recettes_moyenne_locale = df_recettes['Montant_par_habitant'].mean()
-                
-                # Estimation des dépenses moyennes locales
-                depenses_moyenne_locale = recettes_moyenne_locale - epargne_moyenne_locale
-                taux_epargne_local = (epargne_moyenne_locale / recettes_moyenne_locale * 100) if recettes_moyenne_locale > 0 else 0
-                ratio_depenses_local = (depenses_moyenne_locale / recettes_moyenne_locale * 100) if recettes_moyenne_locale > 0 else 0
-                
-                # Tableau de comparaison
-                comparison_data = {
-                    'Indicateur': ['Épargne brute/hab', 'Recettes/hab', 'Dépenses/hab', 'Taux d\'épargne', 'Ratio dépenses/recettes'],
-                    'Moyenne La Réunion': [
-                        f"{epargne_moyenne_locale:,.0f} €",
-                        f"{recettes_moyenne_locale:,.0f} €",
-                        f"{depenses_moyenne_locale:,.0f} €",
-                        f"{taux_epargne_local:.1f}%",
-                        f"{ratio_depenses_local:.1f}%"
-                    ],
-                    'Benchmark National': [
-                        f"{BENCHMARKS['epargne_brute_moyenne_nationale']:,.0f} €",
-                        f"{BENCHMARKS['recettes_moyennes_nationales']:,.0f} €",
-                        f"{BENCHMARKS['depenses_moyennes_nationales']:,.0f} €",
-                        f"{BENCHMARKS['taux_epargne_moyen_national']:.1f}%",
-                        f"{BENCHMARKS['ratio_depenses_recettes_moyen']:.1f}%"
-                    ],
-                    'Écart': [
-                        f"{epargne_moyenne_locale - BENCHMARKS['epargne_brute_moyenne_nationale']:+,.0f} €",
-                        f"{recettes_moyenne_locale - BENCHMARKS['recettes_moyennes_nationales']:+,.0f} €",
-                        f"{depenses_moyenne_locale - BENCHMARKS['depenses_moyennes_nationales']:+,.0f} €",
-                        f"{taux_epargne_local - BENCHMARKS['taux_epargne_moyen_national']:+.1f}%",
-                        f"{ratio_depenses_local - BENCHMARKS['ratio_depenses_recettes_moyen']:+.1f}%"
-                    ]
-                }
-                
-                comparison_df = pd.DataFrame(comparison_data)
+                # Moyennes locales face aux benchmarks (calcul partagé avec l'API JSON)
+                comparaison = comparaison_benchmarks(df_principal, BENCHMARKS, TYPE_BUDGET_ANALYSE)
+                (epargne_moyenne_locale, recettes_moyenne_locale, depenses_moyenne_locale,
+                 taux_epargne_local, ratio_depenses_local) = comparaison['valeur_locale']
                 
-                # Affichage du tableau avec mise en forme conditionnelle
-                def color_ecart(val):
-                    try:
-                        num = float(str(val).replace(' €', '').replace('%', '').replace('+', '').replace(',', ''))
-                        if '€' in str(val):
-                            if num > 0:
-                                return 'background-color: #D1FAE5'
-                            elif num < 0:
-                                return 'background-color: #FEE2E2'
-                        elif '%' in str(val):
-                            if 'Taux' in comparison_df.loc[comparison_df['Écart'] == val, 'Indicateur'].values[0]:
-                                if num > 0:
-                                    return 'background-color: #D1FAE5'
-                                elif num < 0:
-                                    return 'background-color: #FEE2E2'
-                            else:  # Ratio dépenses/recettes
-                                if num < 0:
-                                    return 'background-color: #D1FAE5'
-                                elif num > 0:
-                                    return 'background-color: #FEE2E2'
-                    except:
-                        pass
-                    return ''
+                # Tableau de comparaison : valeurs numériques, sens de lecture issu des métadonnées
+                comparison_df = pd.DataFrame({
+                    'Indicateur': [f"{INDICATEURS[nom]['libelle']} ({INDICATEURS[nom]['unite']})"
+                                   for nom in comparaison.index],
+                    f'Moyenne {nom_perimetre}': comparaison['valeur_locale'].to_numpy(),
+                    'Benchmark National': comparaison['benchmark'].to_numpy(),
+                    'Sens': comparaison['sens'].to_numpy(),
+                    'Écart': comparaison['ecart'].to_numpy()
+                })
                 
-                st.dataframe(
-                    comparison_df.style.applymap(color_ecart, subset=['Écart']),
-                    use_container_width=True
+                # Affichage du tableau avec mise en forme conditionnelle (écart favorable / défavorable)
+                afficher_tableau(
+                    comparison_df,
+                    formats={f'Moyenne {nom_perimetre}': '{:,.1f}', 'Benchmark National': '{:,.1f}', 'Écart': '{:+,.1f}'},
+                    couleurs={'Écart': ('Sens', 'Écart')},
+                    masquer=['Sens']
                 )
                 
                 # Graphique radar pour la comparaison
@@ -884,37 +1167,39 @@ with tab3:
                     (100 - BENCHMARKS['ratio_depenses_recettes_moyen']) / 100
                 ]
                 
-                fig_radar = go.Figure()
+                def construire_fig_radar():
+                    fig_radar = go.Figure()
                 
-                fig_radar.add_trace(go.Scatterpolar(
-                    r=valeurs_reunion,
-                    theta=categories,
-                    fill='toself',
-                    name='La Réunion',
-                    line_color='#3B82F6'
-                ))
+                    fig_radar.add_trace(go.Scatterpolar(
+                        r=valeurs_reunion,
+                        theta=categories,
+                        fill='toself',
+                        name=nom_perimetre,
+                        line_color='#3B82F6'
+                    ))
                 
-                fig_radar.add_trace(go.Scatterpolar(
-                    r=valeurs_national,
-                    theta=categories,
-                    fill='toself',
-                    name='Moyenne Nationale',
-                    line_color='#10B981'
-                ))
+                    fig_radar.add_trace(go.Scatterpolar(
+                        r=valeurs_national,
+                        theta=categories,
+                        fill='toself',
+                        name='Moyenne Nationale',
+                        line_color='#10B981'
+                    ))
                 
-                fig_radar.update_layout(
-                    polar=dict(
-                        radialaxis=dict(
-                            visible=True,
-                            range=[0, 1]
-                        )
-                    ),
-                    showlegend=True,
-                    height=500,
-                    title="Profil financier comparatif"
-                )
+                    fig_radar.update_layout(
+                        polar=dict(
+                            radialaxis=dict(
+                                visible=True,
+                                range=[0, 1]
+                            )
+                        ),
+                        showlegend=True,
+                        height=500,
+                        title="Profil financier comparatif"
+                    )
+                    return fig_radar
                 
-                st.plotly_chart(fig_radar, use_container_width=True)
+                afficher_figure('radar', [], (categories, valeurs_reunion, valeurs_national), construire_fig_radar)
                 
                 # Analyse détaillée par commune vs benchmark
                 st.markdown("#### 🏛️ Analyse Communale vs Benchmarks")
@@ -947,33 +1232,71 @@ with tab3:
                     commune_df = pd.DataFrame(commune_benchmarks)
                     
                     # Graphique de dispersion
-                    fig_scatter = px.scatter(
-                        commune_df,
-                        x='Recettes/hab',
-                        y='Épargne/hab',
-                        size='Dépenses/hab',
-                        color='Catégorie',
-                        hover_name='Commune',
-                        title="Épargne vs Recettes par commune (vs benchmark national)",
-                        labels={
-                            'Recettes/hab': 'Recettes par habitant (€)',
-                            'Épargne/hab': 'Épargne par habitant (€)',
-                            'Dépenses/hab': 'Dépenses par habitant (€)',
-                            'Catégorie': 'Comparaison benchmark'
-                        },
-                        color_discrete_map={'Supérieur': '#10B981', 'Inférieur': '#EF4444'}
-                    )
+                    def construire_fig_scatter():
+                        fig_scatter = px.scatter(
+                            commune_df,
+                            x='Recettes/hab',
+                            y='Épargne/hab',
+                            size='Dépenses/hab',
+                            color='Catégorie',
+                            hover_name='Commune',
+                            title="Épargne vs Recettes par commune (vs benchmark national)",
+                            labels={
+                                'Recettes/hab': 'Recettes par habitant (€)',
+                                'Épargne/hab': 'Épargne par habitant (€)',
+                                'Dépenses/hab': 'Dépenses par habitant (€)',
+                                'Catégorie': 'Comparaison benchmark'
+                            },
+                            color_discrete_map={'Supérieur': '#10B981', 'Inférieur': '#EF4444'}
+                        )
+                    
+                        # Ajouter la ligne du benchmark
+                        fig_scatter.add_hline(
+                            y=BENCHMARKS['epargne_brute_moyenne_nationale'],
+                            line_dash="dash",
+                            line_color="gray",
+                            annotation_text=f"Benchmark national: {BENCHMARKS['epargne_brute_moyenne_nationale']} €/hab"
+                        )
+                    
+                        fig_scatter.update_layout(height=500)
+                        return fig_scatter
                     
-                    # Ajouter la ligne du benchmark
-                    fig_scatter.add_hline(
-                        y=BENCHMARKS['epargne_brute_moyenne_nationale'],
-                        line_dash="dash",
-                        line_color="gray",
-                        annotation_text=f"Benchmark national: {BENCHMARKS['epargne_brute_moyenne_nationale']} €/hab"
-                    )
                     
-                    fig_scatter.update_layout(height=500)
-                    st.plotly_chart(fig_scatter, use_container_width=True)
+                    col_scatter, col_similaires = st.columns([3, 2])
+                    with col_scatter:
+                        afficher_figure('dispersion', commune_df, BENCHMARKS['epargne_brute_moyenne_nationale'],
+                                        construire_fig_scatter)
+                    
+                    # Communes au profil financier le plus proche (arbre KD sur les indicateurs standardisés)
+                    with col_similaires:
+                        st.markdown("##### 🧭 Communes similaires")
+                        index_profils = load_index_similarite(rapport_chargement['version'], selected_year, ratios_national, budgets)
+                        codes_communes = dict(zip(ratios_filtres['Commune'], ratios_filtres['Code_Commune']))
+                        commune_reference = st.selectbox("Commune de référence", options=commune_df['Commune'].tolist())
+                        nb_voisins = st.slider("Nombre de communes similaires", min_value=3, max_value=15, value=5)
+                        
+                        perimetres_voisins = [("France entière", None)]
+                        if departement_selectionne is not None:
+                            perimetres_voisins.insert(0, (nom_perimetre, departement_selectionne))
+                        
+                        colonnes_voisins = {'Distance': '{:.2f}', 'epargne_hab': '{:,.0f} €', 'recettes_hab': '{:,.0f} €'}
+                        duree_recherche = 0.0
+                        for titre, departement_voisins in perimetres_voisins:
+                            voisins, duree = communes_similaires(
+                                index_profils, codes_communes.get(commune_reference), nb_voisins, departement=departement_voisins
+                            )
+                            duree_recherche += duree
+                            st.markdown(f"**{titre}**")
+                            if not voisins.empty:
+                                afficher_tableau(
+                                    voisins[['Commune', 'Code_Departement', 'Distance', 'epargne_hab', 'recettes_hab']]
+                                    .rename(columns=LIBELLES_PROFIL),
+                                    formats={LIBELLES_PROFIL.get(nom, nom): fmt for nom, fmt in colonnes_voisins.items()},
+                                    hide_index=True
+                                )
+                            else:
+                                st.info("Profil incomplet pour cette commune.")
+                        st.caption(f"Recherche : {duree_recherche * 1000:.1f} ms sur {len(index_profils['communes']):,} communes")
                     
                     # Statistiques
                     communes_sup = (commune_df['Catégorie'] == 'Supérieur').sum()
@@ -1008,6 +1331,68 @@ with tab3:
                             delta_color="inverse"
                         )
         
+        # Comparaison aux communes de même strate et tranche de revenu (index national précalculé)
+        st.markdown("#### 👥 Comparaison aux Communes Pairs (strate × tranche de revenu)")
+        
+        if not ratios_filtres.empty and not pairs_national.empty:
+            indicateur_pairs = st.selectbox(
+                "Indicateur comparé aux pairs",
+                options=list(INDICATEURS),
+                format_func=lambda nom: INDICATEURS[nom]['libelle']
+            )
+            comparaison_pairs = comparer_aux_pairs(ratios_filtres, pairs_national, indicateur_pairs)
+            comparaison_pairs = comparaison_pairs.dropna(subset=['pairs_p50']).sort_values('Commune')
+            
+            if not comparaison_pairs.empty:
+                # Intervalle p10-p90 des pairs, médiane et valeur de la commune
+                def construire_fig_pairs():
+                    fig_pairs = go.Figure()
+                    fig_pairs.add_trace(go.Scatter(
+                        x=comparaison_pairs['Commune'],
+                        y=comparaison_pairs['pairs_p50'],
+                        mode='markers',
+                        name='Médiane des pairs (p10-p90)',
+                        marker=dict(color='#9CA3AF', size=10, symbol='line-ew-open'),
+                        error_y=dict(
+                            type='data',
+                            symmetric=False,
+                            array=comparaison_pairs['pairs_p90'] - comparaison_pairs['pairs_p50'],
+                            arrayminus=comparaison_pairs['pairs_p50'] - comparaison_pairs['pairs_p10'],
+                            color='#9CA3AF'
+                        )
+                    ))
+                    fig_pairs.add_trace(go.Scatter(
+                        x=comparaison_pairs['Commune'],
+                        y=comparaison_pairs[indicateur_pairs].replace([np.inf, -np.inf], np.nan),
+                        mode='markers',
+                        name='Commune',
+                        marker=dict(color='#3B82F6', size=12)
+                    ))
+                    fig_pairs.update_layout(
+                        title=f"{INDICATEURS[indicateur_pairs]['libelle']} : communes vs pairs nationaux",
+                        height=500,
+                        xaxis_tickangle=45,
+                        yaxis_title=INDICATEURS[indicateur_pairs]['unite']
+                    )
+                    return fig_pairs
+                
+                afficher_figure('pairs', comparaison_pairs, indicateur_pairs, construire_fig_pairs)
+                
+                afficher_tableau(
+                    comparaison_pairs[['Commune', indicateur_pairs, 'pairs_p10', 'pairs_p25', 'pairs_p50',
+                                       'pairs_p75', 'pairs_p90', 'nb_pairs', 'position']].rename(columns={
+                        indicateur_pairs: INDICATEURS[indicateur_pairs]['libelle'],
+                        'pairs_p10': 'p10', 'pairs_p25': 'p25', 'pairs_p50': 'Médiane',
+                        'pairs_p75': 'p75', 'pairs_p90': 'p90',
+                        'nb_pairs': 'Nombre de pairs', 'position': 'Position'
+                    }),
+                    formats={
+                        INDICATEURS[indicateur_pairs]['libelle']: '{:,.1f}',
+                        'p10': '{:,.1f}', 'p25': '{:,.1f}', 'Médiane': '{:,.1f}',
+                        'p75': '{:,.1f}', 'p90': '{:,.1f}'
+                    }
+                )
+        
     except Exception as e:
         st.error(f"Erreur dans l'analyse des benchmarks : {str(e)}")
 
@@ -1016,25 +1401,109 @@ with tab4:
     try:
         st.markdown("### 🏛️ Santé Financière des Communes")
         
-        if 'Agregat' in df_principal.columns:
-            df_financement = df_principal[df_principal['Agregat'] == 'Capacité ou besoin de financement']
-            
-            if not df_financement.empty:
-                # Graphique simplifié
-                df_financement_clean = df_financement.dropna(subset=['Montant_par_habitant', 'Commune'])
-                df_financement_clean = df_financement_clean.sort_values('Montant_par_habitant', ascending=False)
-                
-                fig = px.bar(
-                    df_financement_clean.head(20),
+        classements = load_classements(rapport_chargement['version'], ratios_national, budgets)
+        
+        col_classement1, col_classement2, col_classement3, col_classement4 = st.columns(4)
+        with col_classement1:
+            indicateur_classement = st.selectbox(
+                "Indicateur classé",
+                options=list(INDICATEURS),
+                index=list(INDICATEURS).index('financement_hab'),
+                format_func=lambda nom: INDICATEURS[nom]['libelle']
+            )
+        with col_classement2:
+            ordre_classement = st.radio("Ordre", options=['Décroissant', 'Croissant'], horizontal=True)
+        with col_classement3:
+            options_perimetre = ['Sélection', 'Département', 'France'] if departement_selectionne is not None else ['Sélection', 'France']
+            perimetre_classement = st.radio(
+                "Périmètre", options=options_perimetre, horizontal=True,
+                format_func=lambda option: nom_perimetre if option == 'Département' else option
+            )
+        with col_classement4:
+            nb_classement = st.slider("Nombre de communes", min_value=5, max_value=50, value=20)
+        
+        codes_perimetre = {
+            'Sélection': set(filtered_df['Code_Commune'].unique()),
+            'Département': set(df['Code_Commune'].unique()),
+            'France': None
+        }[perimetre_classement]
+        tableau_classement = classement(
+            classements, selected_year, indicateur_classement, nb_classement,
+            croissant=(ordre_classement == 'Croissant'), codes_communes=codes_perimetre
+        )
+        
+        if not tableau_classement.empty:
+            libelle_classement = INDICATEURS[indicateur_classement]['libelle']
+            def construire_fig_classement():
+                fig_classement = px.bar(
+                    tableau_classement,
                     x='Commune',
-                    y='Montant_par_habitant',
-                    color='Montant_par_habitant',
-                    color_continuous_scale=['#EF4444', '#FBBF24', '#10B981'],
-                    title="Capacité/Besoin de Financement par Habitant (Top 20)",
-                    labels={'Montant_par_habitant': '€ par habitant'}
+                    y=indicateur_classement,
+                    color=indicateur_classement,
+                    color_continuous_scale=['#EF4444', '#FBBF24', '#10B981'] if INDICATEURS[indicateur_classement]['sens'] > 0
+                    else ['#10B981', '#FBBF24', '#EF4444'],
+                    title=f"{libelle_classement} ({ordre_classement.lower()}, {nb_classement} premières - {perimetre_classement})",
+                    labels={indicateur_classement: f"{libelle_classement} ({INDICATEURS[indicateur_classement]['unite']})"}
                 )
-                fig.update_layout(height=500, xaxis_tickangle=45)
-                st.plotly_chart(fig, use_container_width=True)
+                fig_classement.update_layout(height=500, xaxis_tickangle=45)
+                return fig_classement
+            
+            afficher_figure('classement', tableau_classement,
+                            (indicateur_classement, ordre_classement, nb_classement, perimetre_classement),
+                            construire_fig_classement)
+            
+            afficher_tableau(
+                tableau_classement.rename(columns={
+                    'Code_Departement': 'Département',
+                    indicateur_classement: libelle_classement,
+                    f"{indicateur_classement}_rang": 'Rang national',
+                    f"{indicateur_classement}_percentile": 'Percentile national'
+                }),
+                formats={
+                    libelle_classement: '{:,.1f}',
+                    'Rang national': '{:,.0f}',
+                    'Percentile national': '{:.0f}'
+                },
+                hide_index=True
+            )
+        
+        # Rang d'une commune et évolution sur les exercices disponibles
+        st.markdown("#### 🥇 Rang d'une commune")
+        codes_reunion = dict(zip(ratios_filtres['Commune'], ratios_filtres['Code_Commune']))
+        if codes_reunion:
+            commune_classement = st.selectbox("Commune", options=sorted(codes_reunion), key='commune_classement')
+            rang = rang_commune(classements, selected_year, codes_reunion[commune_classement], indicateur_classement)
+            evolution = evolution_rangs(classements, codes_reunion[commune_classement], indicateur_classement)
+            
+            if rang is not None:
+                col_rang1, col_rang2, col_rang3 = st.columns(3)
+                with col_rang1:
+                    st.metric(INDICATEURS[indicateur_classement]['libelle'], format_number_for_display(rang[indicateur_classement]))
+                with col_rang2:
+                    variation = evolution['variation_rang'].iloc[-1] if len(evolution) > 1 else np.nan
+                    st.metric(
+                        "Rang national",
+                        format_number_for_display(rang[f"{indicateur_classement}_rang"], 0),
+                        delta=f"{variation:+.0f} places" if pd.notnull(variation) else None
+                    )
+                with col_rang3:
+                    st.metric("Percentile national", format_number_for_display(rang[f"{indicateur_classement}_percentile"], 0))
+            
+            if len(evolution) > 1:
+                def construire_fig_rangs():
+                    fig_rangs = px.line(
+                        evolution,
+                        x='Exercice',
+                        y=f"{indicateur_classement}_rang",
+                        markers=True,
+                        title=f"Rang national de {commune_classement} par exercice",
+                        labels={f"{indicateur_classement}_rang": 'Rang national'}
+                    )
+                    fig_rangs.update_yaxes(autorange='reversed')
+                    fig_rangs.update_layout(height=350)
+                    return fig_rangs
+                
+                afficher_figure('rangs', evolution, (indicateur_classement, commune_classement), construire_fig_rangs)
         
     except Exception as e:
         st.error(f"Erreur dans l'analyse de santé financière : {str(e)}")
@@ -1044,36 +1513,69 @@ with tab5:
     try:
         st.markdown("### 💧 Analyse des Budgets Annexes")
         
-        df_annexes = filtered_df[filtered_df['Type_budget'] == 'Budget annexe']
-        
-        if not df_annexes.empty and 'Libelle_Budget' in df_annexes.columns:
-            # Classification simplifiée
-            def classify_service(libelle):
-                if isinstance(libelle, str):
-                    libelle_lower = libelle.lower()
-                    if 'eau' in libelle_lower:
-                        return 'Eau'
-                    elif 'assain' in libelle_lower:
-                        return 'Assainissement'
-                    elif 'pompe' in libelle_lower:
-                        return 'Pompes funèbres'
-                    elif 'spanc' in libelle_lower:
-                        return 'SPANC'
-                return 'Autres'
+        annexes = load_annexes(rapport_chargement['version'], df_national)
+        annexes = annexes[
+            (annexes['Exercice'] == selected_year)
+            & annexes['Code_Commune'].isin(filtered_df['Code_Commune'].unique())
+        ]
+        
+        if not annexes.empty:
+            agregats_annexes = sorted(annexes['Agregat'].unique())
+            agregat_annexes = st.selectbox(
+                "Agrégat des budgets annexes",
+                options=agregats_annexes,
+                index=agregats_annexes.index('Recettes totales hors emprunts') if 'Recettes totales hors emprunts' in agregats_annexes else 0
+            )
+            annexes_agregat = annexes[annexes['Agregat'] == agregat_annexes]
             
-            df_annexes['Type_service'] = df_annexes['Libelle_Budget'].apply(classify_service)
+            # Totaux par type de service ; €/hab rapportés à la population des communes concernées
+            services = annexes_agregat.groupby('Type_service', observed=True).agg(
+                Nombre=('nb_budgets', 'sum'),
+                Communes=('Code_Commune', 'nunique'),
+                Montant=('Montant', 'sum'),
+                Population=('Population', 'sum')
+            ).reset_index().rename(columns={'Type_service': 'Service'})
+            services['Montant/hab'] = services['Montant'] / services['Population'].where(services['Population'] > 0)
             
-            # Graphique des services
-            service_counts = df_annexes['Type_service'].value_counts().reset_index()
-            service_counts.columns = ['Service', 'Nombre']
+            col_annexe1, col_annexe2 = st.columns(2)
+            with col_annexe1:
+                # Graphique des services
+                def construire_fig_services():
+                    fig_services = px.pie(
+                        services,
+                        values='Nombre',
+                        names='Service',
+                        title="Répartition des budgets annexes par type de service"
+                    )
+                    return fig_services
+                
+                afficher_figure('services', services[['Service', 'Nombre']], (), construire_fig_services)
+            with col_annexe2:
+                def construire_fig_montants():
+                    fig_montants = px.bar(
+                        services.sort_values('Montant/hab', ascending=False),
+                        x='Service',
+                        y='Montant/hab',
+                        title=f"{agregat_annexes} des budgets annexes (€/hab)",
+                        text_auto='.0f'
+                    )
+                    return fig_montants
+                
+                afficher_figure('montants_services', services, agregat_annexes, construire_fig_montants)
             
-            fig = px.pie(
-                service_counts,
-                values='Nombre',
-                names='Service',
-                title="Répartition des budgets annexes par type de service"
+            afficher_tableau(
+                services.rename(columns={
+                    'Nombre': 'Nombre de budgets',
+                    'Communes': 'Nombre de communes',
+                    'Montant': 'Montant total',
+                    'Population': 'Population des communes'
+                }),
+                formats={
+                    'Montant total': '{:,.0f} €',
+                    'Population des communes': '{:,.0f}',
+                    'Montant/hab': '{:,.1f} €'
+                }
             )
-            st.plotly_chart(fig, use_container_width=True)
         
     except Exception as e:
         st.error(f"Erreur dans l'analyse des budgets annexes : {str(e)}")
@@ -1089,7 +1591,7 @@ with tab6:
             st.markdown("#### Configuration du Rapport")
             
             # Options du rapport
-            report_title = st.text_input("Titre du rapport", "Rapport Financier des Communes de La Réunion")
+            report_title = st.text_input("Titre du rapport", f"Rapport Financier des Communes - {nom_perimetre}")
             
             include_sections = st.multiselect(
                 "Sections à inclure",
@@ -1118,10 +1620,13 @@ with tab6:
                     if not df_epargne.empty:
                         avg_epargne = df_epargne['Montant_par_habitant'].mean()
                         st.markdown(f"- Épargne brute moyenne: {avg_epargne:,.0f} €/hab")
+                if not ratios_filtres.empty:
+                    st.markdown(f"- Encours de dette moyen: {ratios_filtres['encours_hab'].mean():,.0f} €/hab")
+                    st.markdown(f"- Capacité de désendettement médiane: {format_annees(ratios_filtres['capacite_desendettement'].median())}")
             
             if 'Alertes' in include_sections:
                 st.markdown("✅ **Alertes financières**")
-                alertes = analyser_alertes(filtered_df)
+                alertes = analyser_alertes(filtered_df, ratios_filtres)
                 st.markdown(f"- {len(alertes)} alerte(s) détectée(s)")
             
             if 'Benchmarks' in include_sections:
@@ -1149,15 +1654,21 @@ with tab6:
                 - Épargne brute totale: {df_principal[df_principal['Agregat'] == 'Epargne brute']['Montant'].sum() / 1_000_000 if not df_principal.empty else 0:.1f} M€
                 
                 ### Benchmarks
-                - Épargne moyenne La Réunion: {df_epargne['Montant_par_habitant'].mean() if 'Montant_par_habitant' in df_epargne.columns else 0:,.0f} €/hab
+                - Épargne moyenne {nom_perimetre}: {df_epargne['Montant_par_habitant'].mean() if 'Montant_par_habitant' in df_epargne.columns else 0:,.0f} €/hab
                 - Benchmark national: {BENCHMARKS['epargne_brute_moyenne_nationale']} €/hab
                 - Écart: {(df_epargne['Montant_par_habitant'].mean() if 'Montant_par_habitant' in df_epargne.columns else 0) - BENCHMARKS['epargne_brute_moyenne_nationale']:+,.0f} €/hab
                 
+                ### Endettement
+                - Encours de dette moyen: {ratios_filtres['encours_hab'].mean() if not ratios_filtres.empty else 0:,.0f} €/hab
+                - Annuité moyenne: {ratios_filtres['annuite_recettes'].mean() if not ratios_filtres.empty else 0:.1f}% des recettes
+                - Capacité de désendettement médiane: {format_annees(ratios_filtres['capacite_desendettement'].median() if not ratios_filtres.empty else np.nan)}
+                - Communes au-delà de {SEUILS_ALERTES['capacite_desendettement_seuil']:.0f} ans: {(ratios_filtres['capacite_desendettement'] > SEUILS_ALERTES['capacite_desendettement_seuil']).sum()}
+                
                 ## ⚠️ Alertes Principales
                 """
                 
                 # Ajouter les alertes
-                alertes = analyser_alertes(filtered_df)
+                alertes = analyser_alertes(filtered_df, ratios_filtres)
                 if alertes:
                     for alerte in alertes[:5]:  # Limiter aux 5 premières alertes
                         rapport_content += f"\n- **{alerte['commune']}**: {alerte['message']}"
@@ -1217,6 +1728,529 @@ with tab6:
     except Exception as e:
         st.error(f"Erreur dans la génération du rapport : {str(e)}")
 
+# TAB 7: PROJECTIONS MONTE CARLO
+with tab7:
+    try:
+        st.markdown("### 🔮 Projections de l'Épargne et de la Dette")
+        st.info("ℹ️ Simulation Monte Carlo de toutes les communes du département à partir de l'exercice sélectionné")
+        
+        # Hypothèses du scénario
+        col_proj1, col_proj2, col_proj3 = st.columns(3)
+        with col_proj1:
+            horizon = st.slider("Horizon (années)", min_value=3, max_value=20, value=HYPOTHESES_DEFAUT['horizon'])
+            nb_trajectoires = st.selectbox("Nombre de trajectoires", options=[500, 1000, 2000, 5000], index=2)
+            annees_stagnation = st.slider("Années de stagnation des recettes", min_value=0, max_value=horizon, value=0)
+        with col_proj2:
+            choc_taux = st.number_input("Choc de taux (points de %)", value=0.0, min_value=-2.0, max_value=10.0, step=0.5)
+            taux_interet = st.number_input("Taux moyen de l'encours (%)", value=HYPOTHESES_DEFAUT['taux_interet'] * 100, min_value=0.0, max_value=15.0, step=0.25)
+            part_investissement = st.number_input("Investissement (% des recettes)", value=HYPOTHESES_DEFAUT['part_investissement'] * 100, min_value=0.0, max_value=50.0, step=1.0)
+        with col_proj3:
+            croissance_recettes = st.number_input("Croissance des recettes (%/an)", value=HYPOTHESES_DEFAUT['croissance_recettes'] * 100, step=0.5)
+            croissance_charges = st.number_input("Croissance des charges (%/an)", value=HYPOTHESES_DEFAUT['croissance_charges'] * 100, step=0.5)
+            volatilite = st.number_input("Volatilité annuelle (%)", value=HYPOTHESES_DEFAUT['volatilite'] * 100, min_value=0.0, max_value=20.0, step=0.5)
+        
+        hypotheses = {
+            'horizon': horizon,
+            'nb_trajectoires': nb_trajectoires,
+            'croissance_recettes': croissance_recettes / 100,
+            'croissance_charges': croissance_charges / 100,
+            'volatilite': volatilite / 100,
+            'taux_interet': taux_interet / 100,
+            'choc_taux': choc_taux / 100,
+            'annees_stagnation': annees_stagnation,
+            'part_investissement': part_investissement / 100,
+        }
+        
+        ratios_departement = ratios_national[
+            (ratios_national['Exercice'] == selected_year)
+            & ratios_national['Code_Commune'].isin(df['Code_Commune'].unique())
+        ]
+        bandes_df, synthese_df, duree_projection = load_projection(
+            rapport_chargement['version'], departement_selectionne, selected_year,
+            SEUILS_ALERTES['capacite_desendettement_seuil'], hypotheses, ratios_departement, budgets
+        )
+        
+        if not bandes_df.empty:
+            st.caption(f"{len(synthese_df)} communes × {nb_trajectoires:,} trajectoires × {horizon} ans simulées en {duree_projection:.2f} s")
+            
+            col_choix1, col_choix2 = st.columns(2)
+            with col_choix1:
+                commune_projection = st.selectbox("Commune", options=sorted(synthese_df['Commune'].unique()))
+            with col_choix2:
+                indicateur_projection = st.selectbox(
+                    "Indicateur projeté",
+                    options=['capacite_desendettement', 'epargne_hab', 'encours_hab'],
+                    format_func=lambda nom: INDICATEURS[nom]['libelle']
+                )
+            
+            bandes_commune = bandes_df[
+                (bandes_df['Commune'] == commune_projection) & (bandes_df['Indicateur'] == indicateur_projection)
+            ]
+            
+            # Graphique en éventail : bandes p5-p95 et p25-p75, médiane
+            def construire_fig_projection():
+                fig_projection = go.Figure()
+                for bas, haut, opacite in [('p5', 'p95', 0.15), ('p25', 'p75', 0.3)]:
+                    fig_projection.add_trace(go.Scatter(
+                        x=bandes_commune['Annee'], y=bandes_commune[haut],
+                        mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'
+                    ))
+                    fig_projection.add_trace(go.Scatter(
+                        x=bandes_commune['Annee'], y=bandes_commune[bas],
+                        mode='lines', line=dict(width=0), fill='tonexty',
+                        fillcolor=f'rgba(59, 130, 246, {opacite})', name=f"{bas}-{haut}"
+                    ))
+                fig_projection.add_trace(go.Scatter(
+                    x=bandes_commune['Annee'], y=bandes_commune['p50'],
+                    mode='lines+markers', name='Médiane', line=dict(color='#1E3A8A', width=3)
+                ))
+                if indicateur_projection == 'capacite_desendettement':
+                    fig_projection.add_hline(
+                        y=SEUILS_ALERTES['capacite_desendettement_seuil'],
+                        line_dash="dash",
+                        line_color="red",
+                        annotation_text=f"Seuil d'alerte: {SEUILS_ALERTES['capacite_desendettement_seuil']:.0f} ans"
+                    )
+                fig_projection.update_layout(
+                    title=f"{INDICATEURS[indicateur_projection]['libelle']} projeté(e) - {commune_projection}",
+                    height=500,
+                    xaxis_title="Année",
+                    yaxis_title=INDICATEURS[indicateur_projection]['unite'],
+                    hovermode="x unified"
+                )
+                return fig_projection
+            
+            afficher_figure('projection', bandes_commune,
+                            (indicateur_projection, commune_projection, SEUILS_ALERTES['capacite_desendettement_seuil']),
+                            construire_fig_projection)
+            
+            # Synthèse à l'horizon pour toutes les communes
+            st.markdown(f"#### 📊 Situation médiane à l'horizon {int(bandes_df['Annee'].max())}")
+            colonne_probabilite = f"Probabilité > {SEUILS_ALERTES['capacite_desendettement_seuil']:.0f} ans (%)"
+            synthese_affichee = synthese_df.drop(columns=['Code_Commune']).rename(columns={
+                'epargne_hab_mediane': 'Épargne brute/hab (médiane)',
+                'encours_hab_median': 'Encours/hab (médian)',
+                'capacite_desendettement_mediane': 'Désendettement (ans, médian)',
+                'probabilite_depassement': colonne_probabilite
+            }).sort_values(colonne_probabilite, ascending=False)
+            afficher_tableau(
+                synthese_affichee,
+                formats={
+                    'Épargne brute/hab (médiane)': '{:,.0f} €',
+                    'Encours/hab (médian)': '{:,.0f} €',
+                    'Désendettement (ans, médian)': '{:,.1f}',
+                    colonne_probabilite: '{:.1f}%'
+                }
+            )
+            st.caption(f"Capacité de désendettement plafonnée à {PLAFOND_DESENDETTEMENT:.0f} ans lorsque l'épargne brute est nulle ou négative.")
+        else:
+            st.info("Aucune commune avec recettes et épargne brute renseignées pour cet exercice.")
+        
+    except Exception as e:
+        st.error(f"Erreur dans les projections : {str(e)}")
+
+# TAB 8: EXPLORATEUR DE DONNÉES
+with tab8:
+    try:
+        st.markdown("### 🔎 Explorateur des Données")
+        
+        col_exp1, col_exp2 = st.columns([1, 2])
+        with col_exp1:
+            perimetre_explorateur = st.radio(
+                "Périmètre exploré",
+                options=["Sélection (filtres)", "France entière (tous exercices)"],
+                horizontal=True
+            )
+        donnees_explorateur = filtered_df if perimetre_explorateur.startswith("Sélection") else df_national
+        # Le périmètre « sélection » dépend du département, de la vue des budgets et des filtres :
+        # ils font partie de la clé du cache
+        cle_perimetre = (perimetre_explorateur, departement_selectionne, budgets, selected_year,
+                         tuple(selected_epci), tuple(selected_communes)) \
+            if perimetre_explorateur.startswith("Sélection") else perimetre_explorateur
+        
+        colonnes_disponibles = list(donnees_explorateur.columns)
+        colonnes_defaut = [colonne for colonne in ['Exercice', 'Commune', 'Nom_EPCI', 'Type_budget', 'Libelle_Budget',
+                                                   'Agregat', 'Montant', 'Montant_par_habitant', 'Population']
+                           if colonne in colonnes_disponibles]
+        with col_exp2:
+            colonnes_explorateur = st.multiselect("Colonnes affichées", options=colonnes_disponibles,
+                                                  default=colonnes_defaut)
+        
+        col_exp3, col_exp4, col_exp5, col_exp6 = st.columns([2, 2, 1, 1])
+        with col_exp3:
+            recherche = st.text_input("Recherche texte", value="", placeholder="Commune, budget, agrégat...").strip()
+        with col_exp4:
+            tri_explorateur = st.selectbox("Trier par", options=[None] + colonnes_explorateur,
+                                           format_func=lambda colonne: "(ordre du fichier)" if colonne is None else colonne)
+        with col_exp5:
+            croissant = st.radio("Ordre", options=["Croissant", "Décroissant"]) == "Croissant"
+        with col_exp6:
+            taille_page = st.selectbox("Lignes par page", options=TAILLES_PAGE, index=1)
+        
+        # Recherche dans les colonnes texte affichées
+        colonnes_recherche = tuple(colonne for colonne in colonnes_explorateur
+                                   if not pd.api.types.is_numeric_dtype(donnees_explorateur[colonne]))
+        positions = load_positions_explorateur(
+            rapport_chargement['version'], cle_perimetre, recherche, colonnes_recherche,
+            tri_explorateur, croissant, donnees_explorateur
+        )
+        
+        nb_pages = max(1, -(-len(positions) // taille_page))
+        page = st.number_input(f"Page (sur {nb_pages:,})", min_value=1, max_value=nb_pages, value=1, step=1)
+        
+        if colonnes_explorateur and len(positions):
+            # Seule la page visible est extraite et envoyée au navigateur
+            afficher_tableau(
+                page_explorateur(donnees_explorateur, positions, colonnes_explorateur, int(page), taille_page),
+                hide_index=True
+            )
+            debut_page = (int(page) - 1) * taille_page
+            st.caption(f"Lignes {debut_page + 1:,} à {min(debut_page + taille_page, len(positions)):,} "
+                       f"sur {len(positions):,} retenues ({len(donnees_explorateur):,} dans le périmètre)")
+        else:
+            st.info("Aucune ligne ne correspond à la recherche ou aucune colonne n'est sélectionnée.")
+        
+    except Exception as e:
+        st.error(f"Erreur dans l'explorateur : {str(e)}")
+
+# TAB 9: FICHE COMMUNE
+with tab9:
+    try:
+        st.markdown("### 🏘️ Fiche Commune")
+        
+        # Index construit une fois par version : ouvrir une fiche n'extrait que les lignes de la commune
+        index_fiches, noms_fiches = load_index_communes(rapport_chargement['version'], df_national)
+        codes_fiche = [code for code in pd.unique(df['Code_Commune'].dropna()) if code in index_fiches]
+        codes_selection = filtered_df['Code_Commune'].dropna()
+        code_defaut = codes_selection.iat[0] if not codes_selection.empty else codes_fiche[0]
+        col_fiche1, col_fiche2 = st.columns([2, 1])
+        with col_fiche1:
+            code_fiche = st.selectbox(
+                "Commune consultée",
+                options=codes_fiche,
+                index=codes_fiche.index(code_defaut) if code_defaut in codes_fiche else 0,
+                format_func=lambda code: noms_fiches[code]
+            )
+        
+        debut_fiche = time.perf_counter()
+        fiche = fiche_commune(df_national, index_fiches[code_fiche])
+        duree_fiche = time.perf_counter() - debut_fiche
+        lignes_fiche = fiche['lignes']
+        
+        exercices_fiche = sorted(lignes_fiche['Exercice'].dropna().unique())
+        with col_fiche2:
+            exercice_fiche = st.selectbox(
+                "Exercice des budgets",
+                options=exercices_fiche,
+                index=exercices_fiche.index(selected_year) if selected_year in exercices_fiche else len(exercices_fiche) - 1
+            )
+        
+        # Identité de la commune (dernier exercice disponible)
+        derniere_ligne = lignes_fiche[lignes_fiche['Exercice'] == exercices_fiche[-1]].iloc[0]
+        col_id1, col_id2, col_id3, col_id4 = st.columns(4)
+        with col_id1:
+            st.metric("Population", format_population(derniere_ligne.get('Population')))
+        with col_id2:
+            st.metric("Département", str(derniere_ligne.get('Nom_Departement', derniere_ligne.get('Code_Departement', '-'))))
+        with col_id3:
+            st.metric("EPCI", str(derniere_ligne.get('Nom_EPCI', '-')))
+        with col_id4:
+            st.metric("Budgets", f"{lignes_fiche['Libelle_Budget'].nunique():,}")
+        
+        # Agrégats du budget principal : dernier exercice et évolution €/hab
+        st.markdown("#### 📈 Agrégats du budget principal")
+        agregats_fiche = fiche['agregats']
+        par_habitant_fiche = fiche['par_habitant']
+        if not agregats_fiche.empty:
+            synthese_fiche = pd.DataFrame({
+                'Agrégat': agregats_fiche.index,
+                f'Montant {agregats_fiche.columns[-1]}': agregats_fiche.iloc[:, -1].to_numpy(),
+                f'€/hab {par_habitant_fiche.columns[-1]}': par_habitant_fiche.iloc[:, -1].to_numpy(),
+                'Évolution €/hab': par_habitant_fiche.apply(lambda serie: serie.dropna().tolist(), axis=1).to_numpy()
+            })
+            afficher_tableau(
+                synthese_fiche,
+                formats={f'Montant {agregats_fiche.columns[-1]}': '{:,.0f} €',
+                         f'€/hab {par_habitant_fiche.columns[-1]}': '{:,.0f} €'},
+                column_config={'Évolution €/hab': st.column_config.LineChartColumn("Évolution €/hab")},
+                hide_index=True
+            )
+            
+            st.markdown("#### 🗂️ Montants par exercice")
+            afficher_tableau(
+                agregats_fiche.rename_axis(columns=None).reset_index().rename(columns={'Agregat': 'Agrégat'}),
+                formats={colonne: '{:,.0f} €' for colonne in agregats_fiche.columns},
+                hide_index=True
+            )
+        else:
+            st.info("Aucun budget principal pour cette commune.")
+        
+        # Budget principal et budgets annexes de l'exercice choisi
+        st.markdown(f"#### 💼 Budgets {exercice_fiche}")
+        budgets_fiche = fiche['budgets']
+        if exercice_fiche in budgets_fiche.index.get_level_values('Exercice'):
+            budgets_exercice = budgets_fiche.xs(exercice_fiche, level='Exercice').rename_axis(columns=None).reset_index()
+            afficher_tableau(
+                budgets_exercice.rename(columns={'Type_budget': 'Type de budget', 'Libelle_Budget': 'Budget'}),
+                formats={colonne: '{:,.0f} €' for colonne in budgets_fiche.columns},
+                hide_index=True
+            )
+        
+        st.caption(f"{len(lignes_fiche):,} lignes extraites en {duree_fiche * 1000:.1f} ms "
+                   f"({len(index_fiches):,} communes indexées)")
+        
+    except Exception as e:
+        st.error(f"Erreur dans la fiche commune : {str(e)}")
+
+# TAB 10: QUALITÉ DES DONNÉES
+with tab10:
+    try:
+        st.markdown("### 🧪 Qualité des Données")
+        qualite = rapport_chargement['qualite']
+        
+        col_q1, col_q2, col_q3, col_q4 = st.columns(4)
+        with col_q1:
+            st.metric("Lignes contrôlées", f"{qualite['lignes_controlees']:,}")
+        with col_q2:
+            part_quarantaine = qualite['lignes_quarantaine'] / qualite['lignes_controlees'] * 100 if qualite['lignes_controlees'] else 0
+            st.metric("En quarantaine", f"{qualite['lignes_quarantaine']:,}", f"{part_quarantaine:.2f} %", delta_color="inverse")
+        with col_q3:
+            st.metric("Communes-exercices incomplets", f"{len(qualite['agregats_manquants']):,}")
+        with col_q4:
+            st.metric("Durée des contrôles", f"{qualite['duree_s'] * 1000:,.0f} ms")
+        
+        if qualite['colonnes_manquantes']:
+            st.error(f"Colonnes attendues absentes du fichier : {', '.join(qualite['colonnes_manquantes'])}")
+        
+        col_q5, col_q6 = st.columns(2)
+        with col_q5:
+            st.markdown("#### ✅ Contrôles ligne à ligne")
+            afficher_tableau(
+                qualite['controles'].rename(columns={'controle': 'Contrôle', 'description': 'Description', 'lignes': 'Lignes'}),
+                formats={'Lignes': '{:,.0f}'},
+                hide_index=True
+            )
+        with col_q6:
+            st.markdown("#### 🔢 Valeurs non numériques converties en NaN")
+            if qualite['pertes_conversion']:
+                afficher_tableau(
+                    pd.DataFrame({'Colonne': list(qualite['pertes_conversion']),
+                                  'Valeurs perdues': list(qualite['pertes_conversion'].values())}),
+                    formats={'Valeurs perdues': '{:,.0f}'},
+                    hide_index=True
+                )
+            else:
+                st.success("Aucune valeur numérique perdue à la conversion.")
+        
+        st.markdown("#### 🚧 Lignes en quarantaine")
+        if qualite['lignes_quarantaine']:
+            motif_quarantaine = st.selectbox(
+                "Motif", options=[None] + list(MOTIFS_QUARANTAINE),
+                format_func=lambda motif: "Tous les motifs" if motif is None else MOTIFS_QUARANTAINE[motif]
+            )
+            quarantaine = qualite['quarantaine']
+            if motif_quarantaine is not None:
+                quarantaine = quarantaine[quarantaine['Motif'].str.contains(motif_quarantaine, regex=False)]
+            colonnes_quarantaine = [colonne for colonne in ['Motif', 'Exercice', 'Code_Commune', 'Commune', 'Libelle_Budget',
+                                                            'Agregat', 'Montant', 'Population', 'Montant_par_habitant']
+                                    if colonne in quarantaine.columns]
+            afficher_tableau(quarantaine[colonnes_quarantaine].head(1000), hide_index=True)
+            st.caption(f"{len(quarantaine):,} ligne(s) écartée(s) des calculs"
+                       + (" (1 000 premières affichées)" if len(quarantaine) > 1000 else ""))
+        else:
+            st.success("Aucune ligne en quarantaine.")
+        
+        st.markdown("#### 🧩 Agrégats manquants du budget principal")
+        if not qualite['agregats_manquants'].empty:
+            afficher_tableau(
+                qualite['agregats_manquants'].rename(columns={'Agregats_manquants': 'Agrégats manquants'}),
+                hide_index=True
+            )
+        else:
+            st.success("Toutes les communes ont les agrégats utilisés par les onglets.")
+        
+    except Exception as e:
+        st.error(f"Erreur dans le rapport de qualité : {str(e)}")
+
+# TAB 11: HISTORIQUE DES ALERTES
+with tab11:
+    try:
+        st.markdown("### 📜 Historique des Alertes")
+        
+        # Seules les (commune, exercice) dont les données ont changé sont réévaluées
+        # L'historique porte sur les budgets principaux, quelle que soit la vue choisie
+        evaluation = load_historique(rapport_chargement['version'], tuple(sorted(SEUILS_ALERTES.items())),
+                                     df_national, load_ratios(rapport_chargement['version'], df_national, 'principal'),
+                                     'principal')
+        st.caption(f"Dernière mise à jour : {evaluation['evaluees']:,} (commune, exercice) évaluée(s), "
+                   f"{evaluation['retirees']:,} retirée(s) des données, "
+                   f"{evaluation['alertes']:,} alerte(s) ajoutée(s) en {evaluation['duree_s'] * 1000:,.0f} ms "
+                   f"(configuration de seuils {evaluation['configuration']})")
+        if budgets_consolides:
+            st.caption("ℹ️ L'historique reste calculé sur les budgets principaux : la vue consolidée ne le modifie pas.")
+        
+        # Alertes en vigueur par commune du périmètre
+        comptes = comptes_par_commune(SEUILS_ALERTES, df['Code_Commune'].dropna().unique()
+                                      if departement_selectionne is not None else None)
+        if not comptes.empty:
+            comptes_communes = (
+                comptes.pivot_table(index=['code_commune', 'commune'], columns='type', values='nb_alertes',
+                                    aggfunc='sum', fill_value=0)
+                .reindex(columns=['danger', 'warning', 'positive'], fill_value=0)
+                .reset_index()
+                .sort_values(['danger', 'warning'], ascending=False)
+            )
+            st.markdown(f"#### 🏘️ Alertes par commune - {nom_perimetre}")
+            afficher_tableau(
+                comptes_communes.rename(columns={'code_commune': 'Code', 'commune': 'Commune', 'danger': 'Critiques',
+                                                 'warning': 'Avertissements', 'positive': 'Positives'}).head(100),
+                formats={'Critiques': '{:,.0f}', 'Avertissements': '{:,.0f}', 'Positives': '{:,.0f}'},
+                degrades={'Critiques': 'Reds'},
+                hide_index=True
+            )
+        
+        # Chronologie d'une commune
+        communes_historique = sorted(df['Commune'].dropna().unique())
+        codes_historique = dict(zip(df['Commune'], df['Code_Commune']))
+        commune_historique = st.selectbox("Commune suivie", options=communes_historique)
+        chronologie_commune = chronologie(codes_historique[commune_historique], SEUILS_ALERTES)
+        
+        if not chronologie_commune.empty:
+            series_en_cours = depuis_quand(chronologie_commune)
+            for serie in series_en_cours.itertuples(index=False):
+                st.markdown(f"- **{serie.indicateur}** ({serie.type}) : en alerte depuis **{serie.depuis}** "
+                            f"({serie.nb_exercices} exercice(s) consécutif(s))")
+            
+            def construire_fig_chronologie():
+                fig_chronologie = px.scatter(
+                    chronologie_commune, x='exercice', y='indicateur', color='type',
+                    color_discrete_map={'danger': '#DC2626', 'warning': '#F59E0B', 'positive': '#10B981'},
+                    hover_data=['message'], title=f"Alertes en vigueur - {commune_historique}"
+                )
+                fig_chronologie.update_traces(marker=dict(size=16, symbol='square'))
+                fig_chronologie.update_xaxes(dtick=1)
+                return fig_chronologie
+            
+            afficher_figure('chronologie_alertes', chronologie_commune, commune_historique, construire_fig_chronologie)
+            afficher_tableau(
+                chronologie_commune[['exercice', 'indicateur', 'type', 'message', 'version', 'date']].rename(columns={
+                    'exercice': 'Exercice', 'indicateur': 'Indicateur', 'type': 'Type', 'message': 'Message',
+                    'version': 'Version des données', 'date': 'Évaluée le'}),
+                hide_index=True
+            )
+        else:
+            st.success(f"✅ Aucune alerte enregistrée pour {commune_historique} avec les seuils actuels.")
+        
+    except Exception as e:
+        st.error(f"Erreur dans l'historique des alertes : {str(e)}")
+
+# TAB 12: SENSIBILITÉ DES SEUILS
+with tab12:
+    try:
+        st.markdown("### 🎚️ Sensibilité des Seuils d'Alerte")
+        st.markdown("Nombre d'alertes et de communes concernées pour chaque couple de seuils, calculé en une fois sur toute la grille.")
+        
+        noms_seuils = list(REGLES_SENSIBILITE)
+        col_sens1, col_sens2, col_sens3 = st.columns(3)
+        with col_sens1:
+            seuil_x = st.selectbox("Seuil en ordonnée", options=noms_seuils,
+                                   format_func=lambda nom: REGLES_SENSIBILITE[nom]['libelle'])
+        with col_sens2:
+            options_y = [nom for nom in noms_seuils if nom != seuil_x]
+            seuil_y = st.selectbox("Seuil en abscisse", options=options_y,
+                                   index=options_y.index('ratio_depenses_recettes_seuil')
+                                   if 'ratio_depenses_recettes_seuil' in options_y else 0,
+                                   format_func=lambda nom: REGLES_SENSIBILITE[nom]['libelle'])
+        with col_sens3:
+            mesures_sensibilite = {
+                'communes': "Communes concernées",
+                'communes_exercices': "Communes-exercices en alerte",
+                'alertes': "Alertes",
+            }
+            mesure_sensibilite = st.selectbox("Mesure", options=list(mesures_sensibilite),
+                                              format_func=mesures_sensibilite.get)
+        periode_sensibilite = st.radio("Période", options=['Tous les exercices', f"Exercice {selected_year}"],
+                                       horizontal=True)
+        
+        # Grilles : bornes et pas de chaque seuil
+        grilles = {}
+        with st.expander("Grilles de seuils"):
+            for nom in (seuil_x, seuil_y):
+                debut_defaut, fin_defaut, pas_defaut = REGLES_SENSIBILITE[nom]['grille']
+                col_g1, col_g2, col_g3 = st.columns(3)
+                with col_g1:
+                    debut_grille = st.number_input(f"{REGLES_SENSIBILITE[nom]['libelle']} : début",
+                                                   value=float(debut_defaut), key=f"grille_debut_{nom}")
+                with col_g2:
+                    fin_grille = st.number_input("Fin", value=float(fin_defaut), key=f"grille_fin_{nom}")
+                with col_g3:
+                    pas_grille = st.number_input("Pas", value=float(pas_defaut), min_value=0.01,
+                                                 key=f"grille_pas_{nom}")
+                # Au plus 500 valeurs par axe
+                pas_grille = max(pas_grille, abs(fin_grille - debut_grille) / 499)
+                grilles[nom] = (min(debut_grille, fin_grille), max(debut_grille, fin_grille), pas_grille)
+        
+        ratios_sensibilite = ratios_national
+        if departement_selectionne is not None:
+            ratios_sensibilite = ratios_sensibilite[ratios_sensibilite['Code_Commune'].isin(df['Code_Commune'].unique())]
+        if periode_sensibilite != 'Tous les exercices':
+            ratios_sensibilite = ratios_sensibilite[ratios_sensibilite['Exercice'] == selected_year]
+        
+        if ratios_sensibilite.empty:
+            st.info("Aucune commune pour ce périmètre et cette période.")
+        else:
+            sensibilite, duree_sensibilite = load_sensibilite(
+                rapport_chargement['version'], departement_selectionne, periode_sensibilite,
+                seuil_x, grilles[seuil_x], seuil_y, grilles[seuil_y], ratios_sensibilite, budgets
+            )
+            grille_x, grille_y = sensibilite['grille_x'], sensibilite['grille_y']
+            valeurs_sensibilite = sensibilite[mesure_sensibilite]
+            
+            # Valeur aux seuils actuels (point de grille le plus proche)
+            i_actuel = int(np.abs(grille_x - SEUILS_ALERTES[seuil_x]).argmin())
+            j_actuel = int(np.abs(grille_y - SEUILS_ALERTES[seuil_y]).argmin())
+            col_m1, col_m2, col_m3 = st.columns(3)
+            with col_m1:
+                st.metric(f"{mesures_sensibilite[mesure_sensibilite]} aux seuils actuels",
+                          f"{valeurs_sensibilite[i_actuel, j_actuel]:,}")
+            with col_m2:
+                st.metric("Couples de seuils évalués", f"{len(grille_x) * len(grille_y):,}")
+            with col_m3:
+                st.metric("Durée du balayage", f"{duree_sensibilite * 1000:,.0f} ms",
+                          f"{sensibilite['nb_communes_exercices']:,} communes-exercices", delta_color="off")
+            
+            def construire_fig_sensibilite():
+                fig_sensibilite = go.Figure(go.Heatmap(
+                    x=grille_y, y=grille_x, z=valeurs_sensibilite, colorscale='YlOrRd',
+                    colorbar=dict(title=mesures_sensibilite[mesure_sensibilite]),
+                    hovertemplate=(f"{REGLES_SENSIBILITE[seuil_y]['libelle']} : %{{x}}<br>"
+                                   f"{REGLES_SENSIBILITE[seuil_x]['libelle']} : %{{y}}<br>"
+                                   f"{mesures_sensibilite[mesure_sensibilite]} : %{{z:,}}<extra></extra>")
+                ))
+                fig_sensibilite.add_trace(go.Scatter(
+                    x=[SEUILS_ALERTES[seuil_y]], y=[SEUILS_ALERTES[seuil_x]], mode='markers',
+                    marker=dict(symbol='x', size=14, color='#1E3A8A'), name="Seuils actuels", hoverinfo='name'
+                ))
+                fig_sensibilite.update_layout(
+                    title=f"{mesures_sensibilite[mesure_sensibilite]} - {nom_perimetre}, {periode_sensibilite.lower()}",
+                    xaxis_title=REGLES_SENSIBILITE[seuil_y]['libelle'],
+                    yaxis_title=REGLES_SENSIBILITE[seuil_x]['libelle'],
+                    height=600,
+                    showlegend=False
+                )
+                return fig_sensibilite
+            
+            afficher_figure('sensibilite_seuils', pd.DataFrame(valeurs_sensibilite),
+                            (seuil_x, grilles[seuil_x], seuil_y, grilles[seuil_y], mesure_sensibilite, nom_perimetre,
+                             periode_sensibilite, SEUILS_ALERTES[seuil_x], SEUILS_ALERTES[seuil_y]),
+                            construire_fig_sensibilite)
+            st.caption(f"Règles appliquées à la table des ratios "
+                       f"({'budgets consolidés' if budgets_consolides else 'budget principal'}) ; une commune est concernée "
+                       "si au moins un de ses exercices de la période déclenche l'une des deux alertes.")
+        
+    except Exception as e:
+        st.error(f"Erreur dans l'analyse de sensibilité : {str(e)}")
+
 # ============================================
 # PIED DE PAGE ET EXPORT
 # ============================================
@@ -1228,7 +2262,9 @@ col_export1, col_export2, col_export3 = st.columns(3)
 
 with col_export1:
     if st.button("📄 Exporter données CSV"):
-        csv = filtered_df.to_csv(index=False, encoding='utf-8-sig')
+        csv = cache.obtenir('exports', ('csv', empreinte(filtered_df)),
+                            lambda: filtered_df.to_csv(index=False, encoding='utf-8-sig'),
+                            version=rapport_chargement['version'])
         st.download_button(
             label="Télécharger CSV",
             data=csv,
@@ -1248,9 +2284,27 @@ with col_export3:
 
 # Pied de page
 st.markdown("---")
-st.markdown("""
+st.markdown(f"""
 <div style="text-align: center; color: #6B7280; font-size: 0.9rem;">
-    <p>Dashboard créé avec Streamlit | Données OFGL | La Réunion</p>
+    <p>Dashboard créé avec Streamlit | Données OFGL | {nom_perimetre}</p>
     <p>Version 4.0 - Avec carte géographique, benchmarks, alertes et rapports</p>
 </div>
 """, unsafe_allow_html=True)
+
+# Panneau de débogage : occupation du cache partagé, pour dimensionner les conteneurs
+with st.sidebar:
+    with st.expander("🧰 Cache mémoire"):
+        stats_cache, etat_cache = cache.statistiques()
+        st.metric("Occupation", f"{etat_cache['occupation_mo']:,.1f} Mo",
+                  f"{etat_cache['occupation_mo'] / etat_cache['budget_mo'] * 100:.0f} % de {etat_cache['budget_mo']:,.0f} Mo",
+                  delta_color="off")
+        afficher_tableau(
+            stats_cache[['espace', 'entrees', 'mo', 'succes', 'echecs', 'taux_succes', 'evictions', 'invalidations',
+                         'refus', 'duree_calcul_s']].rename(columns={
+                'espace': 'Espace', 'entrees': 'Entrées', 'mo': 'Mo', 'succes': 'Succès', 'echecs': 'Échecs',
+                'taux_succes': 'Succès (%)', 'evictions': 'Évictions', 'invalidations': 'Invalidations',
+                'refus': 'Refus', 'duree_calcul_s': 'Calcul (s)'}),
+            formats={'Mo': '{:,.2f}', 'Succès (%)': '{:.0f}', 'Calcul (s)': '{:,.2f}'},
+            hide_index=True
+        )
+        st.caption("Budget : variable d'environnement OFGL_BUDGET_CACHE_MO")
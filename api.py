@@ -0,0 +1,302 @@
+# api.py - API JSON locale en lecture seule : KPI, alertes, benchmarks et zones précalculés
+import argparse
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+from chargement import FICHIER_DONNEES, ErreurChargement
+from indicateurs import (BENCHMARKS_DEFAUT, DIMENSIONS_GROUPES, SEUILS_ALERTES_DEFAUT, agreger_groupes,
+                         alertes_dette, alertes_epargne, comparaison_benchmarks, kpi_principaux)
+from memoire import cache
+from rechargement import (TYPES_BUDGET_ANALYSE, charger_source, load_consolide, load_index_groupes, load_ratios,
+                          version_source)
+
+# ============================================
+# PARAMÈTRES DU SERVICE
+# ============================================
+
+HOTE_DEFAUT = '127.0.0.1'
+PORT_DEFAUT = 8502
+NB_THREADS_DEFAUT = 8
+
+# Département servi par défaut (celui du dashboard)
+DEPARTEMENT_DEFAUT = '974'
+
+# Durée maximale d'inactivité d'une connexion persistante avant fermeture
+DELAI_INACTIVITE_S = 5
+
+
+# ============================================
+# DONNÉES PRÉCALCULÉES
+# ============================================
+
+class Instantane:
+    """Une version des données et ses tables dérivées (mêmes chargeurs en cache que le dashboard)"""
+
+    def __init__(self, df, rapport):
+        self.df = df
+        self.rapport = rapport
+        self.version = rapport['version']
+
+    def lignes(self, budgets):
+        """Lignes OFGL de toutes les communes, ou leur vue consolidée"""
+        return self.df if budgets == 'principal' else load_consolide(self.version, self.df)
+
+    def ratios(self, budgets):
+        return load_ratios(self.version, self.lignes(budgets), budgets)
+
+    def groupes(self, budgets):
+        """Agrégats nationaux par zone et par EPCI, tous exercices"""
+        return load_index_groupes(self.version, None, self.ratios(budgets), budgets)
+
+    def selection(self, exercice, departement, budgets):
+        """Lignes OFGL et ratios d'un exercice, éventuellement restreints à un département"""
+        df, ratios = self.lignes(budgets), self.ratios(budgets)
+        df = df[df['Exercice'] == exercice]
+        ratios = ratios[ratios['Exercice'] == exercice]
+        if departement is not None:
+            df = df[df['Code_Departement'].astype(str) == departement]
+            ratios = ratios[ratios['Code_Departement'].astype(str) == departement]
+        return df, ratios
+
+    def reponse(self, cle, calculer):
+        """Corps JSON d'une ressource, sérialisé une fois par version (cache sous budget mémoire)"""
+        return cache.obtenir('reponses', (self.version, cle), lambda: _json(calculer(self)), version=self.version)
+
+
+class Donnees:
+    """Source OFGL (fichier ou répertoire), rechargée uniquement quand sa version change"""
+
+    def __init__(self, source=FICHIER_DONNEES):
+        self.source = source
+        self.courant = None  # Instantane servi, remplacé en une affectation
+        self._verrou = threading.Lock()
+
+    def actualiser(self):
+        """Recharge la source si sa version a changé ; renvoie l'instantané à servir"""
+        version = version_source(self.source)
+        courant = self.courant
+        if courant is not None and courant.version == version:
+            return courant
+        with self._verrou:
+            # Une seule requête recharge, les autres attendent puis réutilisent le résultat
+            if self.courant is None or self.courant.version != version:
+                # Même chaîne que le dashboard : validation, quarantaine, types de service
+                df, rapport = charger_source(self.source)
+                cache.invalider(rapport['version'])
+                self.courant = Instantane(df, rapport)
+            return self.courant
+
+
+# ============================================
+# SÉRIALISATION
+# ============================================
+
+def _enregistrements(frame):
+    """Lignes d'un DataFrame en dictionnaires, valeurs manquantes ou infinies en null"""
+    frame = frame.replace([np.inf, -np.inf], np.nan)
+    return frame.astype(object).where(frame.notna(), None).to_dict(orient='records')
+
+
+def _valeur_json(valeur):
+    """Scalaires numpy convertis ; NaN et infinis non représentables en JSON"""
+    if isinstance(valeur, np.generic):
+        valeur = valeur.item()
+    if isinstance(valeur, float) and not np.isfinite(valeur):
+        return None
+    return valeur
+
+
+def _json(objet):
+    """Encodage UTF-8 d'une réponse (dictionnaires, listes et scalaires numpy)"""
+    def nettoyer(valeur):
+        if isinstance(valeur, dict):
+            return {cle: nettoyer(v) for cle, v in valeur.items()}
+        if isinstance(valeur, (list, tuple)):
+            return [nettoyer(v) for v in valeur]
+        return _valeur_json(valeur)
+    return json.dumps(nettoyer(objet), ensure_ascii=False, allow_nan=False).encode('utf-8')
+
+
+# ============================================
+# RESSOURCES
+# ============================================
+
+def _parametres_selection(instantane, parametres):
+    """Exercice (le plus récent par défaut), département ('tous' : France entière) et vue des budgets"""
+    exercices = instantane.df['Exercice'].dropna()
+    exercice = int(parametres['exercice']) if 'exercice' in parametres else int(exercices.max())
+    departement = parametres.get('departement', DEPARTEMENT_DEFAUT)
+    budgets = parametres.get('budgets', 'principal')
+    if budgets not in TYPES_BUDGET_ANALYSE:
+        raise ValueError(f"budgets inconnus : {budgets} (attendu : {', '.join(TYPES_BUDGET_ANALYSE)})")
+    return exercice, None if departement == 'tous' else departement, budgets
+
+
+def ressource_version(instantane, parametres):
+    """Version des données servies et exercices disponibles"""
+    exercices = sorted(int(annee) for annee in instantane.df['Exercice'].dropna().unique())
+    return {'version': instantane.version, 'exercices': exercices, 'lignes': len(instantane.df)}
+
+
+def ressource_kpi(instantane, parametres):
+    """Indicateurs clés des budgets principaux ou consolidés (cartes KPI du dashboard)"""
+    exercice, departement, budgets = _parametres_selection(instantane, parametres)
+    df, _ = instantane.selection(exercice, departement, budgets)
+    return {'exercice': exercice, 'departement': departement, 'budgets': budgets,
+            **kpi_principaux(df, TYPES_BUDGET_ANALYSE[budgets])}
+
+
+def ressource_alertes(instantane, parametres):
+    """Alertes d'épargne et d'endettement aux seuils par défaut"""
+    exercice, departement, budgets = _parametres_selection(instantane, parametres)
+    df, ratios = instantane.selection(exercice, departement, budgets)
+    alertes = alertes_epargne(df, SEUILS_ALERTES_DEFAUT) + alertes_dette(ratios, SEUILS_ALERTES_DEFAUT)
+    return {'exercice': exercice, 'departement': departement, 'budgets': budgets, 'seuils': SEUILS_ALERTES_DEFAUT,
+            'alertes': alertes}
+
+
+def ressource_benchmarks(instantane, parametres):
+    """Moyennes locales face aux benchmarks nationaux"""
+    exercice, departement, budgets = _parametres_selection(instantane, parametres)
+    df, _ = instantane.selection(exercice, departement, budgets)
+    comparaison = comparaison_benchmarks(df, BENCHMARKS_DEFAUT, TYPES_BUDGET_ANALYSE[budgets])
+    return {'exercice': exercice, 'departement': departement, 'budgets': budgets,
+            'comparaison': _enregistrements(comparaison.reset_index())}
+
+
+def ressource_zones(instantane, parametres):
+    """Agrégats par zone géographique ou par EPCI"""
+    exercice, departement, budgets = _parametres_selection(instantane, parametres)
+    dimension = parametres.get('dimension', 'Zone')
+    if dimension not in DIMENSIONS_GROUPES:
+        raise ValueError(f"dimension inconnue : {dimension} (attendu : {', '.join(DIMENSIONS_GROUPES)})")
+    if departement is None:
+        # Agrégats précalculés sur toutes les communes
+        groupes = instantane.groupes(budgets)[dimension]
+        groupes = groupes[groupes.index.get_level_values('Exercice') == exercice]
+    else:
+        _, ratios = instantane.selection(exercice, departement, budgets)
+        groupes = agreger_groupes(ratios, dimension)
+    return {'exercice': exercice, 'departement': departement, 'budgets': budgets, 'dimension': dimension,
+            'groupes': _enregistrements(groupes.reset_index())}
+
+
+RESSOURCES = {
+    '/api/version': ressource_version,
+    '/api/kpi': ressource_kpi,
+    '/api/alertes': ressource_alertes,
+    '/api/benchmarks': ressource_benchmarks,
+    '/api/zones': ressource_zones,
+}
+
+
+# ============================================
+# SERVEUR HTTP
+# ============================================
+
+class GestionnaireAPI(BaseHTTPRequestHandler):
+    """Requêtes GET en lecture seule ; ETag dérivé de la version des données et de l'URL"""
+    protocol_version = 'HTTP/1.1'  # connexions persistantes
+    timeout = DELAI_INACTIVITE_S      # libère le thread d'une connexion inactive
+    disable_nagle_algorithm = True    # en-têtes et corps envoyés sans attendre l'acquittement
+    donnees = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        calculer = RESSOURCES.get(url.path)
+        if calculer is None:
+            self._envoyer(404, _json({'erreur': f"ressource inconnue : {url.path}",
+                                      'ressources': sorted(RESSOURCES)}))
+            return
+        parametres = dict(parse_qsl(url.query))
+
+        try:
+            # Un seul instantané par requête : ETag, clé de cache et calcul portent sur la même version
+            instantane = self.donnees.actualiser()
+        except (ErreurChargement, OSError) as e:
+            self._envoyer(503, _json({'erreur': str(e)}))
+            return
+
+        cle = (url.path, tuple(sorted(parametres.items())))
+        etag = '"' + hashlib.sha1(f"{instantane.version}|{cle}".encode()).hexdigest()[:20] + '"'
+        if etag in (valeur.strip() for valeur in self.headers.get('If-None-Match', '').split(',')):
+            # Donnée inchangée : ni calcul ni corps
+            self._envoyer(304, b'', etag)
+            return
+
+        try:
+            corps = instantane.reponse(cle, lambda donnees: calculer(donnees, parametres))
+        except (KeyError, ValueError) as e:
+            self._envoyer(400, _json({'erreur': str(e)}))
+            return
+        self._envoyer(200, corps, etag)
+
+    def _envoyer(self, statut, corps, etag=None):
+        self.send_response(statut)
+        if statut != 304:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(corps)))
+        self.send_header('Cache-Control', 'no-cache')
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        if corps:
+            self.wfile.write(corps)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ServeurPool(HTTPServer):
+    """Serveur HTTP dont les connexions sont traitées par un pool de threads de taille fixe"""
+
+    def __init__(self, adresse, gestionnaire, nb_threads=NB_THREADS_DEFAUT):
+        super().__init__(adresse, gestionnaire)
+        self.pool = ThreadPoolExecutor(max_workers=nb_threads, thread_name_prefix='api')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._traiter, request, client_address)
+
+    def _traiter(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+def creer_serveur(source=FICHIER_DONNEES, hote=HOTE_DEFAUT, port=PORT_DEFAUT, nb_threads=NB_THREADS_DEFAUT):
+    """Serveur prêt à l'emploi ; les données sont chargées une fois avant la première requête"""
+    donnees = Donnees(source)
+    donnees.actualiser()
+    gestionnaire = type('Gestionnaire', (GestionnaireAPI,), {'donnees': donnees})
+    return ServeurPool((hote, port), gestionnaire, nb_threads)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="API JSON locale des indicateurs du dashboard")
+    parser.add_argument('--fichier', default=FICHIER_DONNEES, help="fichier OFGL ou répertoire de CSV")
+    parser.add_argument('--hote', default=HOTE_DEFAUT)
+    parser.add_argument('--port', type=int, default=PORT_DEFAUT)
+    parser.add_argument('--threads', type=int, default=NB_THREADS_DEFAUT)
+    args = parser.parse_args()
+
+    serveur = creer_serveur(args.fichier, args.hote, args.port, args.threads)
+    print(f"API disponible sur http://{args.hote}:{args.port} ({', '.join(sorted(RESSOURCES))})")
+    try:
+        serveur.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        serveur.server_close()
@@ -0,0 +1,314 @@
+# banc_charge.py - Banc de charge du dashboard : sessions simultanées simulées en mémoire (sans navigateur ni réseau)
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from chargement import FICHIER_DONNEES
+from indicateurs import (AGREGAT_ANNUITE, AGREGAT_DEPENSES, AGREGAT_ENCOURS, AGREGAT_EPARGNE_BRUTE,
+                         AGREGAT_FINANCEMENT, AGREGAT_RECETTES, ZONES_GEOGRAPHIQUES)
+
+SCRIPT_DASHBOARD = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Dashboard.py')
+
+# ============================================
+# PARAMÈTRES DU BANC
+# ============================================
+
+NB_SESSIONS_DEFAUT = 20
+NB_ITERATIONS_DEFAUT = 3          # répétitions du scénario par session
+NB_COMMUNES_NATIONALES_DEFAUT = 500
+EXERCICES_SYNTHETIQUES = [2017, 2018, 2019]
+DELAI_RERUN_S = 300               # délai maximal d'une exécution du script
+
+QUANTILES_LATENCE = [50, 90, 95, 99]
+
+LIBELLES_ANNEXES = ['EAU POTABLE', 'ASSAINISSEMENT', 'POMPES FUNEBRES', 'SPANC', 'TRANSPORT URBAIN',
+                    'PORT DE PLAISANCE', 'ZONE ACTIVITE', 'CINEMA']
+
+
+# ============================================
+# DONNÉES SYNTHÉTIQUES
+# ============================================
+
+def generer_donnees(chemin, nb_communes_nationales=NB_COMMUNES_NATIONALES_DEFAUT,
+                    exercices=EXERCICES_SYNTHETIQUES, graine=0):
+    """Écrit un fichier au format OFGL : communes de La Réunion et communes métropolitaines fictives"""
+    rng = np.random.default_rng(graine)
+    epcis = ['CINOR', 'CIREST', 'CIVIS', 'CASUD', 'TCO']
+    communes = [(974, 97400 + i, nom, epcis[i % len(epcis)])
+                for i, nom in enumerate(sorted(nom for noms in ZONES_GEOGRAPHIQUES.values() for nom in noms))]
+    for i in range(nb_communes_nationales):
+        departement = [13, 33, 69, 75, 971][i % 5]
+        communes.append((departement, departement * 1000 + i, f"COMMUNE {i}", f"EPCI {departement}"))
+
+    lignes = []
+    for exercice in exercices:
+        for departement, code, nom, epci in communes:
+            population = int(rng.integers(2000, 150000))
+            recettes, epargne = rng.normal(1400, 200), rng.normal(150, 120)
+            montants = {
+                AGREGAT_EPARGNE_BRUTE: epargne,
+                AGREGAT_RECETTES: recettes,
+                AGREGAT_DEPENSES: recettes - epargne,
+                AGREGAT_FINANCEMENT: rng.normal(0, 100),
+                AGREGAT_ENCOURS: rng.normal(900, 300),
+                AGREGAT_ANNUITE: rng.normal(110, 30),
+            }
+            budgets = [('Budget principal', 'COMMUNE DE ' + nom, 1.0)]
+            budgets += [('Budget annexe', LIBELLES_ANNEXES[int(rng.integers(len(LIBELLES_ANNEXES)))], 0.05)
+                        for _ in range(int(rng.integers(0, 3)))]
+            for numero, (type_budget, libelle, part) in enumerate(budgets, start=1):
+                for agregat, par_habitant in montants.items():
+                    lignes.append({
+                        'Exercice': exercice, 'Code Insee 2024 Département': departement, 'Nom 2024 EPCI': epci,
+                        'Strate population 2024': int(np.digitize(population, [3500, 10000, 20000, 50000, 100000])),
+                        'Tranche revenu par habitant': int(rng.integers(1, 6)),
+                        'Code Insee 2024 Commune': code, 'Nom 2024 Commune': nom,
+                        'Siret Budget': f"{code}{numero:05d}", 'Libellé Budget': libelle, 'Type de budget': type_budget,
+                        'Agrégat': agregat, 'Montant': round(par_habitant * part * population, 2),
+                        'Population totale': population, 'Montant en € par habitant': round(par_habitant * part, 2),
+                    })
+    pd.DataFrame(lignes).to_csv(chemin, sep=';', index=False, encoding='utf-8')
+    return len(lignes)
+
+
+# ============================================
+# SCÉNARIO D'UNE SESSION
+# ============================================
+
+def _widget(at, type_widget, libelle):
+    """Premier widget d'un type donné portant ce libellé"""
+    for widget in getattr(at, type_widget):
+        if widget.label == libelle:
+            return widget
+    raise LookupError(f"{type_widget} introuvable : {libelle}")
+
+
+def etapes_scenario(rng):
+    """Interactions d'un utilisateur : (nom de l'étape, action sur l'AppTest avant la réexécution)"""
+    def changer_annee(at):
+        annee = _widget(at, 'selectbox', "Année d'exercice")
+        annee.set_value(annee.options[int(rng.integers(len(annee.options)))])
+
+    def basculer_commune(at):
+        communes = _widget(at, 'multiselect', "Communes")
+        commune = communes.options[int(rng.integers(len(communes.options)))]
+        if commune in communes.value and len(communes.value) > 1:
+            communes.unselect(commune)
+        else:
+            communes.select(commune)
+
+    def changer_classement(at):
+        indicateur = _widget(at, 'selectbox', "Indicateur classé")
+        indicateur.set_value(indicateur.options[int(rng.integers(len(indicateur.options)))])
+
+    def rechercher_explorateur(at):
+        _widget(at, 'text_input', "Recherche texte").set_value(str(rng.choice(['SAINT', 'LE', 'EAU', ''])))
+
+    def generer_rapport(at):
+        _widget(at, 'button', "📄 Générer le Rapport PDF").click()
+
+    return [
+        ('annee', changer_annee),
+        ('communes', basculer_commune),
+        ('classement', changer_classement),
+        ('explorateur', rechercher_explorateur),
+        ('rapport', generer_rapport),
+    ]
+
+
+def preparer_sessions_simultanees():
+    """Partage entre sessions le bytecode du script et le runtime, comme le serveur Streamlit
+
+    AppTest est prévu pour une session à la fois : chaque exécution compile le script dans son
+    propre cache (compilations simultanées instables sous CPython 3.11), remplace puis restaure
+    la configuration globale et remet le runtime global à None en se terminant, ce qui perturbe
+    les exécutions des autres sessions en cours.
+    Renvoie la fonction qui rétablit le comportement d'origine.
+    """
+    import contextlib
+
+    from streamlit import config
+    from streamlit.runtime.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test
+    from streamlit.testing.v1.util import build_mock_config_get_option
+
+    # Configuration de test posée une fois pour toute la durée du banc
+    get_option, patch_config_options = config.get_option, app_test.patch_config_options
+    config.get_option = build_mock_config_get_option({'global.appTest': True})
+    app_test.patch_config_options = lambda options: contextlib.nullcontext()
+
+    cache_partage = ScriptCache()
+    get_bytecode = ScriptCache.get_bytecode
+    ScriptCache.get_bytecode = lambda self, chemin: get_bytecode(cache_partage, chemin)
+
+    instance = Runtime.__dict__['instance']
+    dernier_runtime = []
+
+    def instance_partagee(cls):
+        if cls._instance is not None:
+            dernier_runtime[:] = [cls._instance]
+        elif dernier_runtime:
+            return dernier_runtime[0]
+        return instance.__func__(cls)
+    Runtime.instance = classmethod(instance_partagee)
+
+    def retablir():
+        config.get_option, app_test.patch_config_options = get_option, patch_config_options
+        ScriptCache.get_bytecode = get_bytecode
+        Runtime.instance = instance
+    return retablir
+
+
+def executer_session(numero, nb_iterations, depart, mesures, verrou, graine=0):
+    """Une session : exécution initiale puis le scénario répété, chaque réexécution chronométrée"""
+    from streamlit.testing.v1 import AppTest
+
+    rng = np.random.default_rng(graine + numero)
+    at = AppTest.from_file(SCRIPT_DASHBOARD, default_timeout=DELAI_RERUN_S)
+    depart.wait()
+
+    def chronometrer(etape):
+        debut = time.perf_counter()
+        try:
+            at.run()
+            messages = [str(element.value) for element in list(at.exception) + list(at.error)]
+        except Exception as e:
+            messages = [repr(e)]
+        with verrou:
+            mesures.append({'session': numero, 'etape': etape, 'duree_s': time.perf_counter() - debut,
+                            'erreurs': len(messages), 'message': messages[0] if messages else None})
+
+    chronometrer('initiale')
+    for _ in range(nb_iterations):
+        for etape, action in etapes_scenario(rng):
+            try:
+                action(at)
+            except LookupError as e:
+                with verrou:
+                    mesures.append({'session': numero, 'etape': etape, 'duree_s': np.nan, 'erreurs': 1,
+                                    'message': str(e)})
+                continue
+            chronometrer(etape)
+
+
+# ============================================
+# EXÉCUTION ET RAPPORT
+# ============================================
+
+def memoire_max_mo():
+    """Pic de mémoire résidente du processus (Mo)"""
+    pic = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss : kilo-octets sous Linux, octets sous macOS
+    return pic / (1024 * 1024) if sys.platform == 'darwin' else pic / 1024
+
+
+def lancer_banc(nb_sessions=NB_SESSIONS_DEFAUT, nb_iterations=NB_ITERATIONS_DEFAUT,
+                nb_communes_nationales=NB_COMMUNES_NATIONALES_DEFAUT, graine=0):
+    """Lance les sessions simultanées sur un fichier synthétique et renvoie les mesures et la synthèse"""
+    from streamlit.testing.v1 import AppTest
+
+    repertoire_initial = os.getcwd()
+    with tempfile.TemporaryDirectory() as repertoire:
+        # Le dashboard lit le fichier OFGL dans le répertoire courant
+        os.chdir(repertoire)
+        retablir = preparer_sessions_simultanees()
+        try:
+            nb_lignes = generer_donnees(FICHIER_DONNEES, nb_communes_nationales, graine=graine)
+
+            # Démarrage à froid : chargement du fichier et remplissage des caches partagés
+            debut = time.perf_counter()
+            AppTest.from_file(SCRIPT_DASHBOARD, default_timeout=DELAI_RERUN_S).run()
+            demarrage_froid = time.perf_counter() - debut
+
+            mesures, verrou = [], threading.Lock()
+            depart = threading.Barrier(nb_sessions)
+            sessions = [threading.Thread(target=executer_session,
+                                         args=(numero, nb_iterations, depart, mesures, verrou, graine))
+                        for numero in range(nb_sessions)]
+            debut = time.perf_counter()
+            for session in sessions:
+                session.start()
+            for session in sessions:
+                session.join()
+            duree_totale = time.perf_counter() - debut
+        finally:
+            retablir()
+            os.chdir(repertoire_initial)
+
+    mesures = pd.DataFrame(mesures)
+    durees = mesures['duree_s'].dropna()
+    synthese = {
+        'sessions': nb_sessions,
+        'lignes_fichier': nb_lignes,
+        'demarrage_froid_s': demarrage_froid,
+        'reexecutions': int(len(durees)),
+        'duree_totale_s': duree_totale,
+        'debit_reexecutions_s': len(durees) / duree_totale if duree_totale > 0 else 0.0,
+        **{f"latence_p{q}_s": float(np.percentile(durees, q)) if len(durees) else np.nan
+           for q in QUANTILES_LATENCE},
+        'latence_max_s': float(durees.max()) if len(durees) else np.nan,
+        'erreurs': int(mesures['erreurs'].sum()),
+        'memoire_max_mo': memoire_max_mo(),
+    }
+    return mesures, synthese
+
+
+def afficher_synthese(mesures, synthese):
+    """Synthèse globale et latences par étape du scénario"""
+    print(f"{synthese['sessions']} sessions, {synthese['reexecutions']} réexécutions "
+          f"sur {synthese['lignes_fichier']:,} lignes en {synthese['duree_totale_s']:.1f} s "
+          f"({synthese['debit_reexecutions_s']:.2f} réexécutions/s)")
+    print(f"Démarrage à froid : {synthese['demarrage_froid_s']:.2f} s")
+    print("Latence : " + ", ".join(f"p{q} {synthese[f'latence_p{q}_s']:.2f} s" for q in QUANTILES_LATENCE)
+          + f", max {synthese['latence_max_s']:.2f} s")
+    print(f"Erreurs : {synthese['erreurs']} | Mémoire maximale : {synthese['memoire_max_mo']:,.0f} Mo")
+    par_etape = mesures.groupby('etape')['duree_s'].describe(percentiles=[0.5, 0.95])[['count', '50%', '95%', 'max']]
+    print(par_etape.round(3).to_string())
+    messages = mesures['message'].dropna().value_counts()
+    for message, nombre in messages.head(5).items():
+        print(f"  {nombre} × {message[:200]}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Banc de charge du dashboard (sessions simultanées)")
+    parser.add_argument('--sessions', type=int, default=NB_SESSIONS_DEFAUT)
+    parser.add_argument('--iterations', type=int, default=NB_ITERATIONS_DEFAUT)
+    parser.add_argument('--communes', type=int, default=NB_COMMUNES_NATIONALES_DEFAUT,
+                        help="communes métropolitaines fictives ajoutées aux 24 communes de La Réunion")
+    parser.add_argument('--graine', type=int, default=0)
+    parser.add_argument('--json', help="fichier où écrire la synthèse")
+    # Seuils de validation d'une version : code de sortie 1 si l'un est dépassé
+    parser.add_argument('--p95-max', type=float, help="latence p95 maximale (s)")
+    parser.add_argument('--memoire-max', type=float, help="mémoire résidente maximale (Mo)")
+    parser.add_argument('--erreurs-max', type=int, default=0)
+    args = parser.parse_args()
+
+    # Avertissements de Streamlit hors serveur (runtime absent, options dépréciées) masqués
+    from streamlit.logger import set_log_level
+    set_log_level('error')
+
+    mesures, synthese = lancer_banc(args.sessions, args.iterations, args.communes, args.graine)
+    afficher_synthese(mesures, synthese)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(synthese, f, indent=2)
+
+    depassements = []
+    if args.p95_max is not None and not synthese['latence_p95_s'] <= args.p95_max:
+        depassements.append(f"latence p95 {synthese['latence_p95_s']:.2f} s > {args.p95_max} s")
+    if args.memoire_max is not None and synthese['memoire_max_mo'] > args.memoire_max:
+        depassements.append(f"mémoire {synthese['memoire_max_mo']:,.0f} Mo > {args.memoire_max:,.0f} Mo")
+    if synthese['erreurs'] > args.erreurs_max:
+        depassements.append(f"{synthese['erreurs']} erreurs > {args.erreurs_max}")
+    for depassement in depassements:
+        print(f"ÉCHEC : {depassement}")
+    sys.exit(1 if depassements else 0)
@@ -0,0 +1,243 @@
+# chargement.py - Lecture et normalisation des fichiers OFGL
+import codecs
+import os
+import time
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # pyarrow absent : repli sur le lecteur C de pandas
+    pa = None
+    pa_csv = None
+
+# ============================================
+# CONSTANTES DE LECTURE
+# ============================================
+
+FICHIER_DONNEES = 'ofgl-base-communes.csv'
+
+# Centroïdes INSEE des communes (Code_Commune;Commune;Latitude;Longitude), livrés avec l'application
+FICHIER_CENTROIDES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'communes_centroides.csv')
+SEPARATEUR = ';'
+
+# Échantillonnage pour la détection d'encodage
+TAILLE_BLOC_ECHANTILLON = 64 * 1024  # octets par bloc
+NB_BLOCS_ECHANTILLON = 4              # début, milieu(x) et fin du fichier
+
+# Octets non définis en cp1252 (présents uniquement en latin-1 « pur »)
+OCTETS_INDEFINIS_CP1252 = {0x81, 0x8D, 0x8F, 0x90, 0x9D}
+
+# Standardisation des noms de colonnes
+COLUMN_MAPPING = {
+    'Exercice': 'Exercice',
+    'Outre-mer': 'Outre_mer',
+    'Code Insee 2024 Région': 'Code_Region',
+    'Nom 2024 Région': 'Nom_Region',
+    'Code Insee 2024 Département': 'Code_Departement',
+    'Nom 2024 Département': 'Nom_Departement',
+    'Code Siren 2024 EPCI': 'Code_EPCI',
+    'Nom 2024 EPCI': 'Nom_EPCI',
+    'Strate population 2024': 'Strate_population',
+    'Commune rurale': 'Commune_rurale',
+    'Commune de montagne': 'Commune_montagne',
+    'Commune touristique': 'Commune_touristique',
+    'Tranche revenu par habitant': 'Tranche_revenu',
+    'Présence QPV': 'Presence_QPV',
+    'Code Insee 2024 Commune': 'Code_Commune',
+    'Nom 2024 Commune': 'Commune',
+    'Catégorie': 'Categorie',
+    'Code Siren Collectivité': 'Code_Siren_Collectivite',
+    'Code Insee Collectivité': 'Code_Insee_Collectivite',
+    'Siret Budget': 'Siret_Budget',
+    'Libellé Budget': 'Libelle_Budget',
+    'Type de budget': 'Type_budget',
+    'Nomenclature': 'Nomenclature',
+    'Agrégat': 'Agregat',
+    'Montant': 'Montant',
+    'Montant en millions': 'Montant_millions',
+    'Population totale': 'Population',
+    'Montant en € par habitant': 'Montant_par_habitant',
+    'Compte 2024 Disponible': 'Compte_disponible',
+    'code_type_budget': 'code_type_budget',
+    'ordre_analyse1_section1': 'ordre_analyse1_section1',
+    'Population totale du dernier exercice': 'Population_dernier_exercice'
+}
+
+NUMERIC_COLS = ['Montant', 'Montant_millions', 'Population',
+                'Montant_par_habitant', 'Population_dernier_exercice',
+                'Strate_population', 'Tranche_revenu']
+
+TEXT_COLS = ['Commune_rurale', 'Commune_montagne', 'Commune_touristique', 'Presence_QPV']
+
+
+class ErreurChargement(Exception):
+    """Fichier OFGL introuvable, vide ou illisible"""
+
+
+# ============================================
+# DÉTECTION DE L'ENCODAGE
+# ============================================
+
+def _bloc_est_utf8(bloc, debut_fichier):
+    """Vérifie qu'un bloc d'octets est de l'UTF-8 valide (bords tronqués tolérés)"""
+    if not debut_fichier:
+        # Le bloc peut commencer au milieu d'un caractère multi-octets
+        decalage = 0
+        while decalage < 3 and decalage < len(bloc) and 0x80 <= bloc[decalage] <= 0xBF:
+            decalage += 1
+        bloc = bloc[decalage:]
+    try:
+        # final=False : une séquence incomplète en fin de bloc n'est pas une erreur
+        codecs.getincrementaldecoder('utf-8')().decode(bloc, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def detecter_encodage(chemin, taille_bloc=TAILLE_BLOC_ECHANTILLON, nb_blocs=NB_BLOCS_ECHANTILLON):
+    """Détermine l'encodage du fichier à partir de quelques blocs répartis dans le fichier"""
+    taille = os.path.getsize(chemin)
+    if taille == 0:
+        raise ErreurChargement(f"Le fichier {chemin} est vide")
+
+    positions = sorted({0} | {max(0, int(taille * i / nb_blocs) - taille_bloc // 2) for i in range(1, nb_blocs)}
+                       | {max(0, taille - taille_bloc)})
+    blocs = []
+    with open(chemin, 'rb') as f:
+        for position in positions:
+            f.seek(position)
+            blocs.append((position, f.read(taille_bloc)))
+
+    if blocs[0][1].startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+
+    if all(_bloc_est_utf8(bloc, position == 0) for position, bloc in blocs):
+        return 'utf-8'
+
+    # Fichier 8 bits : cp1252 (export Excel/Windows) sauf octets qu'il ne définit pas
+    octets = set().union(*(set(bloc) for _, bloc in blocs))
+    if octets & OCTETS_INDEFINIS_CP1252:
+        return 'latin-1'
+    return 'cp1252'
+
+
+# ============================================
+# LECTURE ET NORMALISATION
+# ============================================
+
+def lire_csv(chemin, encodage):
+    """Lit le CSV en une seule passe ; lecteur pyarrow multithreadé si disponible"""
+    if pa_csv is not None:
+        try:
+            table = pa_csv.read_csv(
+                chemin,
+                read_options=pa_csv.ReadOptions(
+                    encoding='utf8' if encodage.startswith('utf-8') else encodage,
+                    use_threads=True
+                ),
+                parse_options=pa_csv.ParseOptions(delimiter=SEPARATEUR),
+                convert_options=pa_csv.ConvertOptions(strings_can_be_null=True)
+            )
+        except (pa.ArrowInvalid, UnicodeDecodeError) as e:
+            raise ErreurChargement(f"Format CSV invalide ({encodage}) : {e}") from e
+        return table.to_pandas(), 'pyarrow'
+
+    try:
+        df = pd.read_csv(chemin, sep=SEPARATEUR, low_memory=False, encoding=encodage)
+    except (pd.errors.ParserError, UnicodeDecodeError, ValueError) as e:
+        raise ErreurChargement(f"Format CSV invalide ({encodage}) : {e}") from e
+    return df, 'pandas'
+
+
+def normaliser_colonnes(df, pertes_conversion=None):
+    """Renomme les colonnes OFGL et nettoie les colonnes numériques et texte
+
+    pertes_conversion : dictionnaire complété, par colonne, des étiquettes de lignes
+    dont la valeur non vide n'a pas pu être convertie en nombre
+    """
+    # Nettoyage des colonnes
+    df.columns = df.columns.str.strip()
+
+    existing_columns = {old_name: new_name for old_name, new_name in COLUMN_MAPPING.items()
+                        if old_name in df.columns}
+    df = df.rename(columns=existing_columns)
+
+    # Conversion des colonnes numériques
+    for col in NUMERIC_COLS:
+        if col in df.columns:
+            brut = df[col]
+            df[col] = pd.to_numeric(brut, errors='coerce')
+            if pertes_conversion is not None and not pd.api.types.is_numeric_dtype(brut):
+                renseignees = brut.notna() & (brut.astype(str).str.strip() != '')
+                perdues = renseignees & df[col].isna()
+                if perdues.any():
+                    pertes_conversion[col] = df.index[perdues.to_numpy()]
+
+    # Nettoyage des colonnes texte ; les cellules vides restent manquantes (None pour pyarrow, NaN pour pandas)
+    for col in TEXT_COLS:
+        if col in df.columns:
+            texte = df[col].astype(str).str.strip().str.upper()
+            df[col] = texte.where(df[col].notna() & texte.ne(''))
+
+    return df
+
+
+def version_fichier(chemin):
+    """Identifiant de version du fichier (nom, taille, date de modification)"""
+    stat = os.stat(chemin)
+    return f"{os.path.basename(chemin)}-{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def charger_fichier(chemin=FICHIER_DONNEES, departement=974):
+    """Charge un fichier OFGL et renvoie le DataFrame normalisé et un rapport de lecture"""
+    if not os.path.isfile(chemin):
+        raise ErreurChargement(f"Fichier introuvable : {chemin}")
+
+    debut = time.perf_counter()
+    encodage = detecter_encodage(chemin)
+    df, moteur = lire_csv(chemin, encodage)
+    duree_lecture = time.perf_counter() - debut
+
+    lignes_lues = len(df)
+    pertes_conversion = {}
+    df = normaliser_colonnes(df, pertes_conversion)
+
+    # Filtre départemental (La Réunion par défaut)
+    if departement is not None and 'Code_Departement' in df.columns:
+        df = df[df['Code_Departement'] == departement]
+        pertes_conversion = {col: etiquettes[etiquettes.isin(df.index)] for col, etiquettes in pertes_conversion.items()}
+
+    rapport = {
+        'fichier': chemin,
+        'version': version_fichier(chemin),
+        'encodage': encodage,
+        'moteur': moteur,
+        'duree_lecture_s': duree_lecture,
+        'duree_totale_s': time.perf_counter() - debut,
+        'lignes_lues': lignes_lues,
+        'lignes_retenues': len(df),
+        'pertes_conversion': pertes_conversion,
+    }
+    return df, rapport
+
+
+# ============================================
+# CENTROÏDES DES COMMUNES
+# ============================================
+
+def codes_insee(colonne):
+    """Codes INSEE en texte sur 5 caractères (1001 -> '01001', 97401.0 -> '97401', '2A004' inchangé)"""
+    if pd.api.types.is_numeric_dtype(colonne):
+        colonne = colonne.astype('Int64')
+    return colonne.astype('string').str.strip().str.zfill(5)
+
+
+def charger_centroides(chemin=FICHIER_CENTROIDES):
+    """Table de référence des centroïdes communaux indexée par code INSEE"""
+    if not os.path.isfile(chemin):
+        raise ErreurChargement(f"Fichier introuvable : {chemin}")
+    centroides = pd.read_csv(chemin, sep=SEPARATEUR, dtype={'Code_Commune': str}, encoding='utf-8')
+    centroides['Code_Commune'] = codes_insee(centroides['Code_Commune'])
+    return centroides.drop_duplicates('Code_Commune').set_index('Code_Commune')[['Latitude', 'Longitude']]
@@ -0,0 +1,236 @@
+# geometrie.py - Contours des communes : lecture, simplification par niveau d'affichage et fichiers statiques
+import argparse
+import hashlib
+import json
+import math
+import os
+
+import numpy as np
+
+from chargement import ErreurChargement, version_fichier
+
+# ============================================
+# PARAMÈTRES DES CONTOURS
+# ============================================
+
+REPERTOIRE_MODULE = os.path.dirname(os.path.abspath(__file__))
+
+# GeoJSON des communes livré avec l'application (propriétés 'code' INSEE et 'nom')
+FICHIER_CONTOURS = os.path.join(REPERTOIRE_MODULE, 'communes_contours.geojson')
+
+# Répertoire servi par Streamlit sous app/static/ (server.enableStaticServing)
+REPERTOIRE_STATIQUE = os.path.join(REPERTOIRE_MODULE, 'static')
+URL_STATIQUE = 'app/static'
+
+PROPRIETE_CODE = 'code'
+PROPRIETE_NOM = 'nom'
+
+# Niveaux d'affichage : tolérance de Douglas-Peucker (degrés) et décimales conservées (1e-4° ≈ 11 m)
+NIVEAUX_SIMPLIFICATION = {
+    'national': {'tolerance': 0.01, 'decimales': 3},
+    'departement': {'tolerance': 0.002, 'decimales': 4},
+    'detail': {'tolerance': 0.0003, 'decimales': 5},
+}
+
+# Nombre de communes affichées au-delà duquel on passe au niveau moins détaillé
+SEUILS_NIVEAU = {'detail': 60, 'departement': 1200}
+
+
+# ============================================
+# LECTURE
+# ============================================
+
+def charger_contours(chemin=FICHIER_CONTOURS):
+    """Entités GeoJSON des communes indexées par code INSEE sur 5 caractères"""
+    if not os.path.isfile(chemin):
+        raise ErreurChargement(f"Fichier introuvable : {chemin}")
+    with open(chemin, encoding='utf-8') as f:
+        collection = json.load(f)
+    contours = {}
+    for entite in collection.get('features', []):
+        proprietes = entite.get('properties') or {}
+        if PROPRIETE_CODE not in proprietes or not entite.get('geometry'):
+            continue
+        contours[str(proprietes[PROPRIETE_CODE]).strip().zfill(5)] = entite
+    if not contours:
+        raise ErreurChargement(f"Aucune commune avec la propriété '{PROPRIETE_CODE}' dans {chemin}")
+    return contours
+
+
+def niveau_affichage(nb_communes):
+    """Niveau de simplification adapté à l'emprise affichée (la carte est cadrée sur le périmètre)"""
+    if nb_communes <= SEUILS_NIVEAU['detail']:
+        return 'detail'
+    if nb_communes <= SEUILS_NIVEAU['departement']:
+        return 'departement'
+    return 'national'
+
+
+# ============================================
+# SIMPLIFICATION
+# ============================================
+
+def _douglas_peucker(points, tolerance):
+    """Masque des sommets conservés par Douglas-Peucker (pile explicite, distances vectorisées)"""
+    garder = np.zeros(len(points), dtype=bool)
+    garder[0] = garder[-1] = True
+    pile = [(0, len(points) - 1)]
+    while pile:
+        debut, fin = pile.pop()
+        if fin - debut < 2:
+            continue
+        segment = points[fin] - points[debut]
+        relatifs = points[debut + 1:fin] - points[debut]
+        longueur = math.hypot(segment[0], segment[1])
+        if longueur == 0:  # anneau fermé : distance au point de départ
+            distances = np.hypot(relatifs[:, 0], relatifs[:, 1])
+        else:
+            distances = np.abs(segment[0] * relatifs[:, 1] - segment[1] * relatifs[:, 0]) / longueur
+        plus_loin = int(np.argmax(distances))
+        if distances[plus_loin] > tolerance:
+            milieu = debut + 1 + plus_loin
+            garder[milieu] = True
+            pile.append((debut, milieu))
+            pile.append((milieu, fin))
+    return garder
+
+
+def simplifier_anneau(anneau, tolerance, decimales):
+    """Anneau simplifié puis arrondi ; None s'il dégénère (moins de 4 sommets)"""
+    points = np.asarray(anneau, dtype=np.float64)[:, :2]
+    if len(points) < 4:
+        return None
+    points = np.round(points[_douglas_peucker(points, tolerance)], decimales)
+    # Sommets devenus identiques après arrondi
+    distincts = np.ones(len(points), dtype=bool)
+    distincts[1:] = np.any(points[1:] != points[:-1], axis=1)
+    points = points[distincts]
+    if len(points) < 4:
+        return None
+    return points.tolist()
+
+
+def _simplifier_polygone(anneaux, tolerance, decimales):
+    """Polygone simplifié : un extérieur qui dégénère est gardé arrondi, les trous dégénérés disparaissent"""
+    exterieur = simplifier_anneau(anneaux[0], tolerance, decimales)
+    if exterieur is None:
+        exterieur = simplifier_anneau(anneaux[0], 0, decimales) or np.round(anneaux[0], decimales).tolist()
+    trous = [trou for trou in (simplifier_anneau(anneau, tolerance, decimales) for anneau in anneaux[1:])
+             if trou is not None]
+    return [exterieur] + trous
+
+
+def simplifier_geometrie(geometrie, tolerance, decimales):
+    """Polygon ou MultiPolygon simplifié"""
+    if geometrie['type'] == 'Polygon':
+        return {'type': 'Polygon', 'coordinates': _simplifier_polygone(geometrie['coordinates'], tolerance, decimales)}
+    if geometrie['type'] == 'MultiPolygon':
+        return {'type': 'MultiPolygon',
+                'coordinates': [_simplifier_polygone(polygone, tolerance, decimales)
+                                for polygone in geometrie['coordinates']]}
+    raise ErreurChargement(f"Géométrie non prise en charge : {geometrie['type']}")
+
+
+def contours_simplifies(contours, niveau, codes=None):
+    """FeatureCollection simplifiée au niveau demandé, limitée aux codes INSEE donnés ; seules 'code' et 'nom' sont gardées"""
+    parametres = NIVEAUX_SIMPLIFICATION[niveau]
+    codes = sorted(contours) if codes is None else sorted(set(codes) & set(contours))
+    entites = []
+    for code in codes:
+        entite = contours[code]
+        entites.append({
+            'type': 'Feature',
+            'properties': {PROPRIETE_CODE: code, PROPRIETE_NOM: entite['properties'].get(PROPRIETE_NOM, code)},
+            'geometry': simplifier_geometrie(entite['geometry'], parametres['tolerance'], parametres['decimales']),
+        })
+    return {'type': 'FeatureCollection', 'features': entites}
+
+
+# ============================================
+# EMPRISE ET FICHIERS STATIQUES
+# ============================================
+
+def emprise(collection):
+    """Emprise (lon_min, lat_min, lon_max, lat_max) d'une FeatureCollection"""
+    bornes = np.array([np.inf, np.inf, -np.inf, -np.inf])
+    for entite in collection['features']:
+        geometrie = entite['geometry']
+        polygones = [geometrie['coordinates']] if geometrie['type'] == 'Polygon' else geometrie['coordinates']
+        for polygone in polygones:
+            points = np.asarray(polygone[0])
+            bornes[:2] = np.minimum(bornes[:2], points.min(axis=0))
+            bornes[2:] = np.maximum(bornes[2:], points.max(axis=0))
+    return tuple(bornes.tolist())
+
+
+def cadrage(bornes, largeur_px=1000, hauteur_px=600):
+    """Centre et niveau de zoom (tuiles web de 512 px) qui cadrent l'emprise"""
+    lon_min, lat_min, lon_max, lat_max = bornes
+    centre = {'lon': (lon_min + lon_max) / 2, 'lat': (lat_min + lat_max) / 2}
+    etendue_lon = max(lon_max - lon_min, 1e-6)
+    etendue_lat = max(lat_max - lat_min, 1e-6) / math.cos(math.radians(centre['lat']))
+    zoom = min(math.log2(360 * largeur_px / 512 / etendue_lon), math.log2(180 * hauteur_px / 512 / etendue_lat))
+    return centre, max(0.0, zoom - 0.3)
+
+
+def ecrire_statique(collection, nom, repertoire=REPERTOIRE_STATIQUE):
+    """Écrit la FeatureCollection sous un nom versionné par son contenu ; renvoie son URL relative
+
+    Le navigateur met le fichier en cache : changer d'indicateur ou d'année ne renvoie que les valeurs
+    """
+    texte = json.dumps(collection, separators=(',', ':'), ensure_ascii=False)
+    fichier = f"{nom}-{hashlib.sha1(texte.encode()).hexdigest()[:12]}.geojson"
+    chemin = os.path.join(repertoire, fichier)
+    if not os.path.isfile(chemin):
+        os.makedirs(repertoire, exist_ok=True)
+        temporaire = chemin + '.tmp'
+        with open(temporaire, 'w', encoding='utf-8') as f:
+            f.write(texte)
+        os.replace(temporaire, chemin)
+    return f"{URL_STATIQUE}/{fichier}"
+
+
+def version_contours(chemin=FICHIER_CONTOURS):
+    """Version du fichier de contours (clé des caches de géométrie), None s'il est absent"""
+    return version_fichier(chemin) if os.path.isfile(chemin) else None
+
+
+# ============================================
+# IMPORT D'UN GEOJSON EXTERNE
+# ============================================
+
+def importer(source, sortie=FICHIER_CONTOURS, propriete_code=PROPRIETE_CODE, propriete_nom=PROPRIETE_NOM,
+             departements=None):
+    """Convertit un GeoJSON de communes (ex. ADMIN EXPRESS) au format livré : propriétés 'code'/'nom', détail max"""
+    with open(source, encoding='utf-8') as f:
+        collection = json.load(f)
+    parametres = NIVEAUX_SIMPLIFICATION['detail']
+    entites = []
+    for entite in collection.get('features', []):
+        proprietes = entite.get('properties') or {}
+        code = str(proprietes.get(propriete_code, '')).strip().zfill(5)
+        if not entite.get('geometry') or code == '00000':
+            continue
+        if departements and not any(code.startswith(departement) for departement in departements):
+            continue
+        entites.append({
+            'type': 'Feature',
+            'properties': {PROPRIETE_CODE: code, PROPRIETE_NOM: proprietes.get(propriete_nom, code)},
+            'geometry': simplifier_geometrie(entite['geometry'], parametres['tolerance'], parametres['decimales']),
+        })
+    with open(sortie, 'w', encoding='utf-8') as f:
+        json.dump({'type': 'FeatureCollection', 'features': entites}, f, separators=(',', ':'), ensure_ascii=False)
+    return len(entites)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import d'un GeoJSON de communes au format de l'application")
+    parser.add_argument('source', help="GeoJSON des communes (WGS84)")
+    parser.add_argument('--sortie', default=FICHIER_CONTOURS)
+    parser.add_argument('--propriete-code', default='INSEE_COM', help="propriété portant le code INSEE")
+    parser.add_argument('--propriete-nom', default='NOM', help="propriété portant le nom de la commune")
+    parser.add_argument('--departements', nargs='*', help="préfixes de codes INSEE retenus (ex. 974)")
+    args = parser.parse_args()
+
+    nb = importer(args.source, args.sortie, args.propriete_code, args.propriete_nom, args.departements)
+    print(f"{nb:,} communes écrites dans {args.sortie} ({os.path.getsize(args.sortie) / 1_000_000:.1f} Mo)")
@@ -0,0 +1,238 @@
+# historique.py - Historique des alertes en SQLite : évaluation incrémentale et chronologies par commune
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from indicateurs import AGREGAT_EPARGNE_BRUTE, alertes_dette, alertes_epargne
+
+# ============================================
+# PARAMÈTRES DE L'HISTORIQUE
+# ============================================
+
+REPERTOIRE_MODULE = os.path.dirname(os.path.abspath(__file__))
+
+# Base partagée par tous les processus quel que soit leur répertoire de lancement (variable OFGL_HISTORIQUE)
+CHEMIN_HISTORIQUE = os.environ.get('OFGL_HISTORIQUE', os.path.join(REPERTOIRE_MODULE, 'historique_alertes.sqlite'))
+
+# Seuils qui déterminent les alertes historisées : une configuration = une valeur de chacun
+SEUILS_HISTORISES = ['epargne_brute_seuil_bas', 'epargne_brute_seuil_haut',
+                     'capacite_desendettement_seuil', 'annuite_recettes_seuil']
+
+# Colonnes lues par les règles d'alerte, seules prises en compte dans l'empreinte d'une (commune, exercice)
+COLONNES_EPARGNE = ['Exercice', 'Code_Commune', 'Commune', 'Montant_par_habitant']
+COLONNES_RATIOS = ['Exercice', 'Code_Commune', 'Commune', 'capacite_desendettement', 'annuite_recettes']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS evaluations (
+    id INTEGER PRIMARY KEY,
+    configuration TEXT NOT NULL,
+    seuils TEXT NOT NULL,
+    version TEXT NOT NULL,
+    date TEXT NOT NULL,
+    nb_evaluees INTEGER NOT NULL,
+    nb_alertes INTEGER NOT NULL
+);
+-- Dernière évaluation de chaque (configuration, exercice, commune) et empreinte de ses données
+CREATE TABLE IF NOT EXISTS etats (
+    configuration TEXT NOT NULL,
+    exercice INTEGER NOT NULL,
+    code_commune TEXT NOT NULL,
+    empreinte TEXT NOT NULL,
+    evaluation_id INTEGER NOT NULL,
+    PRIMARY KEY (configuration, code_commune, exercice)
+) WITHOUT ROWID;
+-- Journal en ajout seul : les alertes d'une réévaluation s'ajoutent, les anciennes restent consultables
+CREATE TABLE IF NOT EXISTS alertes (
+    evaluation_id INTEGER NOT NULL,
+    configuration TEXT NOT NULL,
+    exercice INTEGER NOT NULL,
+    code_commune TEXT NOT NULL,
+    commune TEXT,
+    indicateur TEXT NOT NULL,
+    type TEXT NOT NULL,
+    message TEXT NOT NULL,
+    valeur REAL
+);
+CREATE INDEX IF NOT EXISTS alertes_commune ON alertes (configuration, code_commune, exercice, evaluation_id);
+"""
+
+
+# ============================================
+# CONNEXION ET CONFIGURATION
+# ============================================
+
+def connexion(chemin=CHEMIN_HISTORIQUE):
+    """Connexion SQLite (une par appel, sûre entre sessions) avec le schéma créé si besoin"""
+    base = sqlite3.connect(chemin, timeout=30)
+    base.execute("PRAGMA journal_mode=WAL")
+    base.executescript(SCHEMA)
+    return base
+
+
+def cle_configuration(seuils):
+    """Identifiant d'une configuration de seuils (seuls les seuils des alertes historisées comptent)"""
+    retenus = {nom: float(seuils[nom]) for nom in SEUILS_HISTORISES}
+    return hashlib.sha1(json.dumps(retenus, sort_keys=True).encode()).hexdigest()[:16], retenus
+
+
+# ============================================
+# ÉVALUATION INCRÉMENTALE
+# ============================================
+
+def _avec_cles(table):
+    """Lignes dont l'exercice et le code commune sont renseignés"""
+    return table.dropna(subset=['Exercice', 'Code_Commune'])
+
+
+def _cles_texte(table):
+    """Clés (exercice entier, code commune texte) telles que stockées dans l'historique"""
+    return pd.MultiIndex.from_arrays([table['Exercice'].astype('int64'), table['Code_Commune'].astype(str)],
+                                     names=['exercice', 'code_commune'])
+
+
+def empreintes_combinaisons(df, ratios):
+    """Empreinte des données d'alerte de chaque (exercice, commune), calculée en une passe vectorisée"""
+    epargne = _avec_cles(df.loc[df['Agregat'] == AGREGAT_EPARGNE_BRUTE, COLONNES_EPARGNE])
+    ratios = _avec_cles(ratios[COLONNES_RATIOS])
+    # Somme des empreintes de lignes : indépendante de l'ordre des lignes dans le fichier
+    parties = [
+        pd.Series(pd.util.hash_pandas_object(table, index=False).to_numpy(), index=_cles_texte(table))
+        .groupby(level=[0, 1]).sum()
+        for table in (epargne, ratios)
+    ]
+    # Alignement sur l'union des clés en restant en uint64 (un passage en float64 perdrait des bits)
+    cles = parties[0].index.union(parties[1].index)
+    sommes = parties[0].reindex(cles, fill_value=0).to_numpy(np.uint64) + \
+        parties[1].reindex(cles, fill_value=0).to_numpy(np.uint64)
+    return pd.Series(sommes, index=cles).map('{:016x}'.format)
+
+
+def enregistrer_evaluation(df, ratios, seuils, version, chemin=CHEMIN_HISTORIQUE):
+    """Évalue les alertes des seules (exercice, commune) nouvelles ou modifiées et les ajoute à l'historique
+
+    Les (exercice, commune) sorties des données (quarantaine, fichier corrigé) ne sont plus en vigueur ;
+    leurs alertes restent dans le journal.
+    """
+    debut = time.perf_counter()
+    configuration, retenus = cle_configuration(seuils)
+    empreintes = empreintes_combinaisons(df, ratios)
+
+    base = connexion(chemin)
+    try:
+        connues = pd.read_sql_query("SELECT exercice, code_commune, empreinte FROM etats WHERE configuration = ?",
+                                    base, params=(configuration,))
+        connues = connues.set_index(['exercice', 'code_commune'])['empreinte']
+        a_evaluer = empreintes[empreintes.ne(connues.reindex(empreintes.index)).to_numpy()]
+        retirees = connues.index.difference(empreintes.index)
+        if a_evaluer.empty and retirees.empty:
+            return {'configuration': configuration, 'evaluees': 0, 'retirees': 0, 'alertes': 0,
+                    'duree_s': time.perf_counter() - debut}
+
+        # Règles appliquées aux seules lignes des combinaisons retenues
+        epargne = _avec_cles(df.loc[df['Agregat'] == AGREGAT_EPARGNE_BRUTE])
+        epargne = epargne[_cles_texte(epargne).isin(a_evaluer.index)]
+        ratios = _avec_cles(ratios)
+        ratios = ratios[_cles_texte(ratios).isin(a_evaluer.index)]
+        alertes = alertes_epargne(epargne, retenus) + alertes_dette(ratios, retenus)
+
+        with base:
+            curseur = base.execute(
+                "INSERT INTO evaluations (configuration, seuils, version, date, nb_evaluees, nb_alertes) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (configuration, json.dumps(retenus), version, datetime.now().isoformat(timespec='seconds'),
+                 len(a_evaluer), len(alertes))
+            )
+            evaluation_id = curseur.lastrowid
+            base.executemany(
+                "INSERT INTO alertes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(evaluation_id, configuration, int(alerte['exercice']), str(alerte['code_commune']),
+                  alerte['commune'], alerte['indicateur'], alerte['type'], alerte['message'],
+                  float(alerte['valeur']) if np.isfinite(alerte['valeur']) else None)
+                 for alerte in alertes]
+            )
+            base.executemany(
+                "INSERT OR REPLACE INTO etats VALUES (?, ?, ?, ?, ?)",
+                [(configuration, int(exercice), code, empreinte, evaluation_id)
+                 for (exercice, code), empreinte in a_evaluer.items()]
+            )
+            base.executemany(
+                "DELETE FROM etats WHERE configuration = ? AND code_commune = ? AND exercice = ?",
+                [(configuration, str(code), int(exercice)) for exercice, code in retirees]
+            )
+        return {'configuration': configuration, 'evaluees': len(a_evaluer), 'retirees': len(retirees),
+                'alertes': len(alertes), 'duree_s': time.perf_counter() - debut}
+    finally:
+        base.close()
+
+
+# ============================================
+# CONSULTATION
+# ============================================
+
+# Alertes en vigueur : celles de la dernière évaluation de chaque (exercice, commune)
+REQUETE_EN_VIGUEUR = """
+SELECT a.exercice, a.code_commune, a.commune, a.indicateur, a.type, a.message, a.valeur,
+       e.version, e.date
+FROM etats s
+JOIN alertes a ON a.configuration = s.configuration AND a.code_commune = s.code_commune
+              AND a.exercice = s.exercice AND a.evaluation_id = s.evaluation_id
+JOIN evaluations e ON e.id = s.evaluation_id
+WHERE s.configuration = ?
+"""
+
+
+def chronologie(code_commune, seuils, chemin=CHEMIN_HISTORIQUE):
+    """Alertes en vigueur d'une commune, exercice par exercice"""
+    configuration, _ = cle_configuration(seuils)
+    base = connexion(chemin)
+    try:
+        return pd.read_sql_query(REQUETE_EN_VIGUEUR + " AND s.code_commune = ? ORDER BY a.exercice, a.indicateur",
+                                 base, params=(configuration, str(code_commune)))
+    finally:
+        base.close()
+
+
+def depuis_quand(chronologie_commune):
+    """Premier exercice de la série ininterrompue d'alertes qui se poursuit au dernier exercice, par indicateur"""
+    if chronologie_commune.empty:
+        return pd.DataFrame(columns=['indicateur', 'type', 'depuis', 'dernier_exercice', 'nb_exercices'])
+    dernier = chronologie_commune['exercice'].max()
+    series = []
+    for (indicateur, type_alerte), groupe in chronologie_commune.groupby(['indicateur', 'type']):
+        exercices = np.sort(groupe['exercice'].unique())
+        if exercices[-1] != dernier:
+            continue
+        # Ruptures de la série : remonter tant que les exercices se suivent
+        ruptures = np.flatnonzero(np.diff(exercices) != 1)
+        debut = exercices[ruptures[-1] + 1] if len(ruptures) else exercices[0]
+        series.append({'indicateur': indicateur, 'type': type_alerte, 'depuis': int(debut),
+                       'dernier_exercice': int(dernier), 'nb_exercices': int(dernier - debut + 1)})
+    return pd.DataFrame(series, columns=['indicateur', 'type', 'depuis', 'dernier_exercice', 'nb_exercices'])
+
+
+def comptes_par_commune(seuils, codes_communes=None, chemin=CHEMIN_HISTORIQUE):
+    """Nombre d'alertes en vigueur par commune et type, tous exercices confondus"""
+    configuration, _ = cle_configuration(seuils)
+    requete = (
+        "SELECT a.code_commune, MAX(a.commune) AS commune, a.type, COUNT(*) AS nb_alertes, "
+        "MIN(a.exercice) AS premier_exercice, MAX(a.exercice) AS dernier_exercice "
+        "FROM etats s JOIN alertes a ON a.configuration = s.configuration AND a.code_commune = s.code_commune "
+        "AND a.exercice = s.exercice AND a.evaluation_id = s.evaluation_id WHERE s.configuration = ?"
+    )
+    parametres = [configuration]
+    if codes_communes is not None:
+        # Périmètre restreint : recherche par clé primaire plutôt que parcours de la configuration
+        codes = sorted({str(code) for code in codes_communes})
+        requete += f" AND s.code_commune IN ({', '.join('?' * len(codes))})"
+        parametres += codes
+    base = connexion(chemin)
+    try:
+        return pd.read_sql_query(requete + " GROUP BY a.code_commune, a.type", base, params=parametres)
+    finally:
+        base.close()
@@ -0,0 +1,646 @@
+# indicateurs.py - Moteur d'indicateurs financiers et d'endettement par commune
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# ============================================
+# AGRÉGATS OFGL UTILISÉS
+# ============================================
+
+AGREGAT_EPARGNE_BRUTE = 'Epargne brute'
+AGREGAT_RECETTES = 'Recettes totales hors emprunts'
+AGREGAT_DEPENSES = 'Dépenses totales hors remboursements'
+AGREGAT_FINANCEMENT = 'Capacité ou besoin de financement'
+AGREGAT_ENCOURS = 'Encours de dette'
+AGREGAT_ANNUITE = 'Annuité de la dette'
+
+# Agrégats lus par les indicateurs ; les dépenses n'y figurent pas (convention : dépenses = recettes - épargne)
+AGREGATS_INDICATEURS = [
+    AGREGAT_EPARGNE_BRUTE,
+    AGREGAT_RECETTES,
+    AGREGAT_FINANCEMENT,
+    AGREGAT_ENCOURS,
+    AGREGAT_ANNUITE,
+]
+
+# Clés d'une ligne de la table des ratios
+CLES_RATIOS = ['Exercice', 'Code_Commune']
+
+# Attributs descriptifs repris du fichier OFGL
+ATTRIBUTS_COMMUNE = ['Commune', 'Code_Departement', 'Nom_EPCI', 'Strate_population',
+                     'Tranche_revenu', 'Population']
+
+# Métadonnées des indicateurs : libellé, unité et sens (+1 : plus c'est haut, mieux c'est)
+INDICATEURS = {
+    'epargne_hab': {'libelle': 'Épargne brute/hab', 'unite': '€', 'sens': 1},
+    'recettes_hab': {'libelle': 'Recettes/hab', 'unite': '€', 'sens': 1},
+    'depenses_hab': {'libelle': 'Dépenses/hab', 'unite': '€', 'sens': -1},
+    'financement_hab': {'libelle': 'Capacité financement/hab', 'unite': '€', 'sens': 1},
+    'taux_epargne': {'libelle': "Taux d'épargne", 'unite': '%', 'sens': 1},
+    'ratio_depenses_recettes': {'libelle': 'Ratio dépenses/recettes', 'unite': '%', 'sens': -1},
+    'encours_hab': {'libelle': 'Encours de dette/hab', 'unite': '€', 'sens': -1},
+    'annuite_recettes': {'libelle': 'Annuité/recettes', 'unite': '%', 'sens': -1},
+    'capacite_desendettement': {'libelle': 'Capacité de désendettement', 'unite': 'ans', 'sens': -1},
+}
+
+SUFFIXE_PERCENTILE = '_pct_strate'
+
+# Zones géographiques approximatives de La Réunion
+ZONES_GEOGRAPHIQUES = {
+    'Nord': ['SAINT-DENIS', 'SAINTE-MARIE', 'SAINTE-SUZANNE'],
+    'Est': ['SAINT-ANDRÉ', 'SAINT-BENOÎT', 'BRAS-PANON', 'SAINTE-ROSE', 'LA PLAINE-DES-PALMISTES'],
+    'Sud': ['SAINT-PIERRE', 'SAINT-LOUIS', 'SAINT-JOSEPH', 'LE TAMPON', 'PETITE-ILE', "L'ÉTANG-SALÉ", 'LES AVIRONS', 'SAINT-PHILIPPE', 'ENTRE-DEUX'],
+    'Ouest': ['SAINT-PAUL', 'LE PORT', 'LA POSSESSION', 'SAINT-LEU', 'LES TROIS-BASSINS'],
+    'Cirques': ['CILAOS', 'SALAZIE']
+}
+
+# Dimensions de regroupement précalculées
+DIMENSIONS_GROUPES = ['Zone', 'Nom_EPCI']
+
+# Types de service des budgets annexes : motifs testés dans l'ordre sur le libellé
+# normalisé (minuscules, sans accents) ; le premier motif reconnu l'emporte
+SERVICES_ANNEXES = [
+    ('SPANC', r"\bspanc\b|non collectif"),
+    ('Assainissement', r"assain|epuration|eaux usees"),
+    ('Eau', r"\beaux?\b|potable"),
+    ('Pompes funèbres', r"pompes? funebres?|funeraire|cimetiere|crematorium"),
+    ('Transport', r"transports?|\bbus\b|mobilite"),
+    ('Ports', r"\bports?\b|portuaire|plaisance|marina"),
+    ("Zones d'activité", r"zones? (?:d.?\s?)?activites?|\bzac\b|\bza\b|lotissement|parc d.?activites?"),
+    ('Déchets', r"dechets|ordures"),
+    ('Culture et loisirs', r"cinema|theatre|camping|piscine|golf|musee"),
+]
+SERVICE_AUTRES = 'Autres'
+
+# Groupes de pairs et quantiles stockés dans l'index
+CLES_PAIRS = ['Exercice', 'Strate_population', 'Tranche_revenu']
+QUANTILES_PAIRS = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+TYPE_BUDGET_PRINCIPAL = 'Budget principal'
+
+# Budget consolidé d'une commune : budget principal et budgets annexes additionnés
+TYPE_BUDGET_CONSOLIDE = 'Budget consolidé'
+
+# Colonnes propres à un budget (Siret) : absentes ou recalculées dans la vue consolidée
+COLONNES_BUDGET = ['Siret_Budget', 'Libelle_Budget', 'Type_budget', 'Nomenclature', 'Compte_disponible',
+                   'code_type_budget', 'Type_service']
+COLONNES_SOMMEES = ['Montant', 'Montant_millions']
+
+# Benchmarks nationaux/régionaux (valeurs fictives - à remplacer par des données réelles)
+BENCHMARKS_DEFAUT = {
+    'epargne_brute_moyenne_nationale': 150,  # €/habitant
+    'depenses_moyennes_nationales': 1200,    # €/habitant
+    'recettes_moyennes_nationales': 1350,    # €/habitant
+    'taux_epargne_moyen_national': 11.1,     # %
+    'ratio_depenses_recettes_moyen': 88.9,   # %
+}
+
+# Benchmark de référence de chaque indicateur comparé
+BENCHMARKS_INDICATEURS = {
+    'epargne_hab': 'epargne_brute_moyenne_nationale',
+    'recettes_hab': 'recettes_moyennes_nationales',
+    'depenses_hab': 'depenses_moyennes_nationales',
+    'taux_epargne': 'taux_epargne_moyen_national',
+    'ratio_depenses_recettes': 'ratio_depenses_recettes_moyen',
+}
+
+# Seuils d'alerte par défaut pour les indicateurs financiers
+SEUILS_ALERTES_DEFAUT = {
+    'epargne_brute_seuil_bas': -100,        # €/habitant
+    'epargne_brute_seuil_haut': 300,        # €/habitant
+    'depenses_habitant_seuil_bas': 800,     # €/habitant
+    'depenses_habitant_seuil_haut': 2000,   # €/habitant
+    'ratio_depenses_recettes_seuil': 100,   # %
+    'solde_seuil_negatif': -50,             # €/habitant
+    'capacite_desendettement_seuil': 12,    # années
+    'annuite_recettes_seuil': 15,           # %
+}
+
+# Seuils balayés par l'analyse de sensibilité : indicateur comparé, sens de déclenchement et grille par défaut
+REGLES_SENSIBILITE = {
+    'epargne_brute_seuil_bas': {'indicateur': 'epargne_hab', 'declenchement': 'inferieur',
+                                'libelle': "Épargne brute seuil bas (€/hab)", 'grille': (-300, 100, 10)},
+    'epargne_brute_seuil_haut': {'indicateur': 'epargne_hab', 'declenchement': 'superieur',
+                                 'libelle': "Épargne brute seuil haut (€/hab)", 'grille': (100, 600, 25)},
+    'ratio_depenses_recettes_seuil': {'indicateur': 'ratio_depenses_recettes', 'declenchement': 'superieur',
+                                      'libelle': "Ratio dépenses/recettes seuil (%)", 'grille': (80, 120, 2)},
+    'depenses_habitant_seuil_haut': {'indicateur': 'depenses_hab', 'declenchement': 'superieur',
+                                     'libelle': "Dépenses seuil haut (€/hab)", 'grille': (1000, 3000, 100)},
+    'capacite_desendettement_seuil': {'indicateur': 'capacite_desendettement', 'declenchement': 'superieur',
+                                      'libelle': "Capacité de désendettement seuil (années)", 'grille': (4, 30, 1)},
+    'annuite_recettes_seuil': {'indicateur': 'annuite_recettes', 'declenchement': 'superieur',
+                               'libelle': "Annuité/recettes seuil (%)", 'grille': (5, 30, 1)},
+}
+
+
+# ============================================
+# TABLE DES RATIOS
+# ============================================
+
+def table_ratios(df, type_budget=TYPE_BUDGET_PRINCIPAL):
+    """Calcule en une passe les indicateurs de chaque (exercice, commune) du budget principal (ou consolidé)"""
+    colonnes = CLES_RATIOS + ATTRIBUTS_COMMUNE + ['Zone'] + list(INDICATEURS) + \
+        [f"{nom}{SUFFIXE_PERCENTILE}" for nom in INDICATEURS]
+    if df.empty or not {'Type_budget', 'Agregat', 'Montant'}.issubset(df.columns):
+        return pd.DataFrame(columns=colonnes)
+
+    principal = df[(df['Type_budget'] == type_budget) & df['Agregat'].isin(AGREGATS_INDICATEURS)]
+    if principal.empty:
+        return pd.DataFrame(columns=colonnes)
+
+    # Un seul regroupement : montants par agrégat en colonnes
+    montants = (
+        principal.groupby(CLES_RATIOS + ['Agregat'], sort=False)['Montant'].sum()
+        .unstack('Agregat')
+        .reindex(columns=AGREGATS_INDICATEURS)
+    )
+    attributs = [col for col in ATTRIBUTS_COMMUNE if col in principal.columns]
+    ratios = principal.groupby(CLES_RATIOS, sort=False)[attributs].first().join(montants)
+
+    population = ratios['Population'].where(ratios['Population'] > 0) if 'Population' in ratios.columns \
+        else pd.Series(np.nan, index=ratios.index)
+    epargne = ratios[AGREGAT_EPARGNE_BRUTE]
+    recettes = ratios[AGREGAT_RECETTES].where(ratios[AGREGAT_RECETTES] > 0)
+    encours = ratios[AGREGAT_ENCOURS]
+
+    ratios['epargne_hab'] = epargne / population
+    ratios['recettes_hab'] = ratios[AGREGAT_RECETTES] / population
+    # Même convention que l'onglet Benchmarks : dépenses = recettes - épargne
+    ratios['depenses_hab'] = ratios['recettes_hab'] - ratios['epargne_hab']
+    ratios['financement_hab'] = ratios[AGREGAT_FINANCEMENT] / population
+    ratios['taux_epargne'] = epargne / recettes * 100
+    ratios['ratio_depenses_recettes'] = (ratios[AGREGAT_RECETTES] - epargne) / recettes * 100
+    ratios['encours_hab'] = encours / population
+    ratios['annuite_recettes'] = ratios[AGREGAT_ANNUITE] / recettes * 100
+    # Encours ÷ épargne brute, en années ; épargne nulle ou négative : désendettement impossible
+    ratios['capacite_desendettement'] = (
+        (encours / epargne.where(epargne > 0))
+        .mask(epargne.le(0) & encours.gt(0), np.inf)
+        .mask(encours.eq(0) & epargne.notna(), 0.0)
+    )
+
+    ratios = ratios.drop(columns=AGREGATS_INDICATEURS).reset_index()
+    ratios = ajouter_percentiles_strate(ratios)
+    ratios = ajouter_zones(ratios)
+    return ratios.reindex(columns=colonnes)
+
+
+def ajouter_zones(ratios):
+    """Ajoute la zone géographique et l'EPCI en colonnes catégorielles (normalisation faite une fois)"""
+    zone_par_commune = {commune: zone for zone, communes in ZONES_GEOGRAPHIQUES.items() for commune in communes}
+    noms = pd.Series(pd.unique(ratios['Commune']))
+    correspondance = dict(zip(noms, noms.astype(str).str.upper().str.strip().map(zone_par_commune)))
+    ratios['Zone'] = pd.Categorical(ratios['Commune'].map(correspondance), categories=list(ZONES_GEOGRAPHIQUES))
+    if 'Nom_EPCI' in ratios.columns:
+        ratios['Nom_EPCI'] = ratios['Nom_EPCI'].astype('category')
+    return ratios
+
+
+def ajouter_percentiles_strate(ratios):
+    """Ajoute le rang percentile (0-100) de chaque indicateur dans sa strate, par exercice"""
+    indicateurs = list(INDICATEURS)
+    if 'Strate_population' not in ratios.columns:
+        for nom in indicateurs:
+            ratios[f"{nom}{SUFFIXE_PERCENTILE}"] = np.nan
+        return ratios
+    rangs = ratios.groupby(['Exercice', 'Strate_population'])[indicateurs].rank(pct=True) * 100
+    rangs.columns = [f"{nom}{SUFFIXE_PERCENTILE}" for nom in indicateurs]
+    return pd.concat([ratios, rangs], axis=1)
+
+
+# ============================================
+# AGRÉGATS PAR ZONE ET PAR EPCI
+# ============================================
+
+def agreger_groupes(ratios, dimension):
+    """Effectif, population et moyennes simples/pondérées de chaque indicateur par (exercice, groupe)"""
+    indicateurs = list(INDICATEURS)
+    valeurs = ratios[indicateurs].replace([np.inf, -np.inf], np.nan)
+    population = ratios['Population'].fillna(0)
+
+    # Une seule agrégation : sommes, effectifs non nuls et sommes pondérées par la population
+    # (la table des ratios a une ligne par commune et exercice)
+    colonnes = {'nb_communes': np.ones(len(ratios), dtype=np.int64), 'population': population}
+    for nom in indicateurs:
+        colonnes[f"{nom}__somme"] = valeurs[nom]
+        colonnes[f"{nom}__n"] = valeurs[nom].notna()
+        colonnes[f"{nom}__somme_ponderee"] = valeurs[nom] * population
+        colonnes[f"{nom}__poids"] = population.where(valeurs[nom].notna(), 0)
+    travail = pd.DataFrame(colonnes, index=ratios.index)
+    travail['Exercice'] = ratios['Exercice']
+    travail[dimension] = ratios[dimension]
+
+    sommes = travail.groupby(['Exercice', dimension], observed=True).sum()
+    resultat = sommes[['nb_communes', 'population']].copy()
+    for nom in indicateurs:
+        resultat[f"{nom}_moyenne"] = sommes[f"{nom}__somme"] / sommes[f"{nom}__n"].where(sommes[f"{nom}__n"] > 0)
+        resultat[f"{nom}_ponderee"] = sommes[f"{nom}__somme_ponderee"] / \
+            sommes[f"{nom}__poids"].where(sommes[f"{nom}__poids"] > 0)
+    return resultat
+
+
+def index_groupes(ratios):
+    """Agrégats précalculés pour chaque dimension de regroupement (zone, EPCI)"""
+    return {dimension: agreger_groupes(ratios, dimension)
+            for dimension in DIMENSIONS_GROUPES if dimension in ratios.columns}
+
+
+# ============================================
+# CLASSIFICATION DES BUDGETS ANNEXES
+# ============================================
+
+def _normaliser_libelle(libelle):
+    """Minuscules sans accents pour la recherche de motifs"""
+    texte = unicodedata.normalize('NFKD', str(libelle).lower())
+    return ''.join(caractere for caractere in texte if not unicodedata.combining(caractere))
+
+
+def classer_services(df, services=SERVICES_ANNEXES):
+    """Type de service (catégoriel) des budgets annexes, classés une fois par libellé distinct"""
+    categories = [nom for nom, _ in services] + [SERVICE_AUTRES]
+    if 'Libelle_Budget' not in df.columns or 'Type_budget' not in df.columns:
+        return pd.Categorical([None] * len(df), categories=categories)
+
+    codes, libelles = pd.factorize(df['Libelle_Budget'])
+    normalises = pd.Series([_normaliser_libelle(libelle) for libelle in libelles], dtype=object)
+    correspondances = [normalises.str.contains(motif, regex=True).to_numpy() for _, motif in services]
+    classes = np.select(correspondances, np.arange(len(services)), default=len(services))
+
+    # Libellés absents (-1) et budgets principaux : pas de type de service
+    codes_services = np.where(codes >= 0, classes[codes], -1)
+    codes_services = np.where((df['Type_budget'] == 'Budget annexe').to_numpy(), codes_services, -1)
+    return pd.Categorical.from_codes(codes_services, categories=categories)
+
+
+def table_annexes(df):
+    """Montants des budgets annexes par (exercice, commune, type de service, agrégat)"""
+    colonnes = ['Exercice', 'Code_Commune', 'Commune', 'Type_service', 'Agregat',
+                'Montant', 'nb_budgets', 'Population']
+    if 'Type_service' not in df.columns:
+        return pd.DataFrame(columns=colonnes)
+    annexes = df[df['Type_service'].notna()]
+    if annexes.empty:
+        return pd.DataFrame(columns=colonnes)
+    return annexes.groupby(['Exercice', 'Code_Commune', 'Commune', 'Type_service', 'Agregat'], observed=True).agg(
+        Montant=('Montant', 'sum'),
+        nb_budgets=('Siret_Budget', 'nunique'),
+        Population=('Population', 'first')
+    ).reset_index()
+
+
+def consolider_budgets(df):
+    """Budget principal et budgets annexes additionnés par (exercice, commune, agrégat), en un regroupement
+
+    Même schéma que les lignes OFGL (Type_budget = 'Budget consolidé') : les fonctions du budget
+    principal s'y appliquent telles quelles. Les flux entre budgets d'une commune ne sont pas neutralisés.
+    """
+    cles = ['Exercice', 'Code_Commune', 'Agregat']
+    sommees = [colonne for colonne in COLONNES_SOMMEES if colonne in df.columns]
+    attributs = [colonne for colonne in df.columns
+                 if colonne not in cles + sommees + COLONNES_BUDGET + ['Montant_par_habitant']]
+    groupes = df.groupby(cles, sort=False, observed=True)
+    consolide = groupes[attributs].first().join(groupes[sommees].sum(min_count=1))
+    consolide['Nb_budgets'] = groupes.size()
+    consolide = consolide.reset_index()
+
+    population = consolide['Population'].where(consolide['Population'] > 0)
+    consolide['Montant_par_habitant'] = consolide['Montant'] / population
+    consolide['Type_budget'] = TYPE_BUDGET_CONSOLIDE
+    consolide['Libelle_Budget'] = TYPE_BUDGET_CONSOLIDE
+    ordre = [colonne for colonne in df.columns if colonne in consolide.columns]
+    return consolide[ordre + ['Nb_budgets']]
+
+
+# ============================================
+# INDEX DES CLASSEMENTS
+# ============================================
+
+def index_classements(ratios):
+    """Rangs, percentiles et ordres de tri de chaque indicateur par exercice"""
+    indicateurs = list(INDICATEURS)
+    table = ratios[['Exercice', 'Code_Commune', 'Commune', 'Code_Departement'] + indicateurs].reset_index(drop=True)
+
+    # Rang 1 = valeur la plus forte de l'exercice ; percentile croissant (0-100)
+    groupes = table.groupby('Exercice')[indicateurs]
+    rangs = groupes.rank(ascending=False, method='min')
+    percentiles = groupes.rank(pct=True) * 100
+    for nom in indicateurs:
+        table[f"{nom}_rang"] = rangs[nom]
+        table[f"{nom}_percentile"] = percentiles[nom]
+
+    # Ordre décroissant des lignes par (exercice, indicateur) : top/bottom N par simple découpe
+    exercices = table['Exercice'].to_numpy()
+    ordres = {}
+    for nom in indicateurs:
+        valeurs = table[nom].to_numpy(np.float64)
+        valides = np.flatnonzero(~np.isnan(valeurs))
+        ordre = valides[np.lexsort((-valeurs[valides], exercices[valides]))]
+        exercices_tries = exercices[ordre]
+        coupures = np.flatnonzero(exercices_tries[1:] != exercices_tries[:-1]) + 1
+        for morceau in np.split(ordre, coupures):
+            if len(morceau):
+                ordres[(exercices[morceau[0]], nom)] = morceau
+
+    positions = pd.Series(np.arange(len(table)), index=pd.MultiIndex.from_frame(table[['Exercice', 'Code_Commune']]))
+    par_commune = table.groupby('Code_Commune').indices
+    return {'table': table, 'ordres': ordres, 'positions': positions, 'par_commune': par_commune}
+
+
+def classement(index, exercice, indicateur, n=20, croissant=False, codes_communes=None):
+    """Les n premières communes (valeurs décroissantes, ou croissantes) d'un exercice"""
+    ordre = index['ordres'].get((exercice, indicateur), np.empty(0, dtype=np.int64))
+    if croissant:
+        ordre = ordre[::-1]
+    if codes_communes is not None:
+        ordre = ordre[np.isin(index['table']['Code_Commune'].to_numpy()[ordre], list(codes_communes))]
+    lignes = index['table'].iloc[ordre[:n]]
+    resultat = lignes[['Commune', 'Code_Departement', indicateur, f"{indicateur}_rang", f"{indicateur}_percentile"]].copy()
+    resultat.insert(0, 'Position', np.arange(1, len(resultat) + 1))
+    return resultat.reset_index(drop=True)
+
+
+def rang_commune(index, exercice, code_commune, indicateur):
+    """Valeur, rang national et percentile d'une commune pour un exercice"""
+    position = index['positions'].get((exercice, code_commune))
+    if position is None:
+        return None
+    return index['table'].iloc[position][[indicateur, f"{indicateur}_rang", f"{indicateur}_percentile"]]
+
+
+def evolution_rangs(index, code_commune, indicateur):
+    """Rang national de la commune pour chaque exercice et variation d'une année sur l'autre"""
+    positions = index['par_commune'].get(code_commune, np.empty(0, dtype=np.int64))
+    lignes = index['table'].iloc[positions].sort_values('Exercice')
+    evolution = lignes[['Exercice', indicateur, f"{indicateur}_rang", f"{indicateur}_percentile"]].reset_index(drop=True)
+    # Variation positive : la commune gagne des places
+    evolution['variation_rang'] = -evolution[f"{indicateur}_rang"].diff()
+    return evolution
+
+
+# ============================================
+# INDEX DES GROUPES DE PAIRS
+# ============================================
+
+def index_pairs(ratios):
+    """Quantiles p10-p90 de chaque indicateur par (exercice, strate, tranche de revenu)"""
+    indicateurs = list(INDICATEURS)
+    colonnes = pd.MultiIndex.from_product([indicateurs, [f"p{int(q * 100)}" for q in QUANTILES_PAIRS]])
+    if ratios.empty or not set(CLES_PAIRS).issubset(ratios.columns):
+        return pd.DataFrame(columns=colonnes)
+
+    # Les capacités de désendettement infinies faussent l'interpolation : exclues des quantiles
+    valeurs = ratios[CLES_PAIRS + indicateurs].replace([np.inf, -np.inf], np.nan)
+    groupes = valeurs.groupby(CLES_PAIRS)
+    quantiles = groupes[indicateurs].quantile(QUANTILES_PAIRS).unstack(level=-1)
+    quantiles.columns = colonnes
+    quantiles[('effectif', 'n')] = groupes.size()
+    return quantiles.sort_index()
+
+
+def comparer_aux_pairs(ratios, index, indicateur):
+    """Positionne chaque commune dans la distribution de ses pairs pour un indicateur"""
+    bornes = index[indicateur].add_prefix('pairs_')
+    bornes['nb_pairs'] = index[('effectif', 'n')]
+    comparaison = ratios[['Commune'] + CLES_PAIRS + [indicateur]].join(bornes, on=CLES_PAIRS)
+
+    valeur = comparaison[indicateur]
+    comparaison['position'] = np.select(
+        [valeur.isna() | comparaison['pairs_p50'].isna(),
+         valeur < comparaison['pairs_p10'],
+         valeur < comparaison['pairs_p25'],
+         valeur < comparaison['pairs_p50'],
+         valeur < comparaison['pairs_p75'],
+         valeur <= comparaison['pairs_p90']],
+        ['-', '< p10', 'p10-p25', 'p25-p50', 'p50-p75', 'p75-p90'],
+        default='> p90'
+    )
+    return comparaison
+
+
+# ============================================
+# SYNTHÈSES D'UNE SÉLECTION (KPI, BENCHMARKS)
+# ============================================
+
+def kpi_principaux(df, type_budget=TYPE_BUDGET_PRINCIPAL):
+    """Indicateurs clés des budgets principaux (ou consolidés) d'une sélection (un exercice)"""
+    principal = df[df['Type_budget'] == type_budget]
+    montants = principal.groupby('Agregat', observed=True)['Montant'].sum()
+    return {
+        'epargne_brute_totale_meur': float(montants.get(AGREGAT_EPARGNE_BRUTE, 0)) / 1_000_000,
+        'nb_communes': int(principal['Commune'].nunique()),
+        'population_totale': float(principal['Population'].sum()),
+        'recettes_totales_meur': float(montants.get(AGREGAT_RECETTES, 0)) / 1_000_000,
+    }
+
+
+def comparaison_benchmarks(df, benchmarks=BENCHMARKS_DEFAUT, type_budget=TYPE_BUDGET_PRINCIPAL):
+    """Moyennes €/hab des budgets principaux (ou consolidés) d'une sélection face aux benchmarks nationaux"""
+    principal = df[df['Type_budget'] == type_budget]
+    moyennes = principal.groupby('Agregat', observed=True)['Montant_par_habitant'].mean()
+    if AGREGAT_EPARGNE_BRUTE not in moyennes.index or AGREGAT_RECETTES not in moyennes.index:
+        return pd.DataFrame()
+
+    # Dépenses estimées par différence (convention dépenses = recettes - épargne)
+    epargne, recettes = moyennes[AGREGAT_EPARGNE_BRUTE], moyennes[AGREGAT_RECETTES]
+    depenses = recettes - epargne
+    locales = {
+        'epargne_hab': epargne,
+        'recettes_hab': recettes,
+        'depenses_hab': depenses,
+        'taux_epargne': epargne / recettes * 100 if recettes > 0 else 0,
+        'ratio_depenses_recettes': depenses / recettes * 100 if recettes > 0 else 0,
+    }
+    comparaison = pd.DataFrame({
+        'valeur_locale': pd.Series(locales, dtype=np.float64),
+        'benchmark': pd.Series({nom: benchmarks[cle] for nom, cle in BENCHMARKS_INDICATEURS.items()},
+                               dtype=np.float64),
+        'sens': pd.Series({nom: INDICATEURS[nom]['sens'] for nom in locales}),
+    })
+    comparaison['ecart'] = comparaison['valeur_locale'] - comparaison['benchmark']
+    comparaison.index.name = 'indicateur'
+    return comparaison
+
+
+# ============================================
+# FICHE COMMUNE
+# ============================================
+
+def index_communes(df):
+    """Positions des lignes de chaque commune (clé : Code_Commune), construit une fois par version"""
+    if 'Code_Commune' not in df.columns:
+        return {}
+    return df.groupby('Code_Commune', sort=False).indices
+
+
+def fiche_commune(df, positions):
+    """Lignes d'une commune extraites par position : agrégats par exercice, séries €/hab et budgets"""
+    lignes = df.take(positions)
+    principal = lignes[lignes['Type_budget'] == TYPE_BUDGET_PRINCIPAL]
+    sommes = principal.groupby(['Agregat', 'Exercice'], observed=True)[['Montant', 'Montant_par_habitant']].sum()
+    agregats = sommes['Montant'].unstack('Exercice')
+    par_habitant = sommes['Montant_par_habitant'].unstack('Exercice')
+    # Budget principal et budgets annexes, un agrégat par colonne
+    budgets = lignes.groupby(['Exercice', 'Type_budget', 'Libelle_Budget', 'Agregat'],
+                             observed=True)['Montant'].sum().unstack('Agregat')
+    return {'lignes': lignes, 'agregats': agregats, 'par_habitant': par_habitant, 'budgets': budgets}
+
+
+# ============================================
+# ALERTES FINANCIÈRES ET D'ENDETTEMENT
+# ============================================
+
+def _contexte_alertes(table):
+    """Exercice et code commune de chaque ligne (None si la colonne est absente)"""
+    return [table[colonne] if colonne in table.columns else pd.Series(None, index=table.index, dtype=object)
+            for colonne in ('Exercice', 'Code_Commune')]
+
+
+def alertes_epargne(df, seuils):
+    """Alertes vectorisées sur l'épargne brute par habitant (très faible ou exceptionnelle)"""
+    alertes = []
+    if 'Agregat' not in df.columns or 'Montant_par_habitant' not in df.columns:
+        return alertes
+
+    epargne = df[df['Agregat'] == AGREGAT_EPARGNE_BRUTE]
+    valeurs = epargne['Montant_par_habitant']
+    communes = epargne['Commune'] if 'Commune' in epargne.columns else pd.Series('Inconnue', index=epargne.index)
+    exercices, codes = _contexte_alertes(epargne)
+    for masque, type_alerte, libelle in [
+        (valeurs < seuils['epargne_brute_seuil_bas'], 'danger', "Épargne brute très faible"),
+        (valeurs > seuils['epargne_brute_seuil_haut'], 'positive', "Épargne brute exceptionnelle"),
+    ]:
+        for commune, valeur, exercice, code in zip(communes[masque], valeurs[masque], exercices[masque], codes[masque]):
+            alertes.append({
+                'type': type_alerte,
+                'commune': commune,
+                'message': f"{libelle} : {valeur:,.0f} €/hab",
+                'indicateur': 'Épargne brute',
+                'exercice': exercice,
+                'code_commune': code,
+                'valeur': valeur,
+            })
+    return alertes
+
+
+def alertes_dette(ratios, seuils):
+    """Alertes vectorisées sur la capacité de désendettement et le poids des annuités"""
+    alertes = []
+    if ratios.empty:
+        return alertes
+    exercices, codes = _contexte_alertes(ratios)
+
+    desendettement = ratios['capacite_desendettement']
+    masque = desendettement > seuils['capacite_desendettement_seuil']
+    for commune, valeur, exercice, code in zip(ratios.loc[masque, 'Commune'], desendettement[masque],
+                                               exercices[masque], codes[masque]):
+        message = ("Épargne brute nulle ou négative : désendettement impossible" if np.isinf(valeur)
+                   else f"Capacité de désendettement élevée : {valeur:,.1f} ans")
+        alertes.append({
+            'type': 'danger',
+            'commune': commune,
+            'message': message,
+            'indicateur': 'Capacité de désendettement',
+            'exercice': exercice,
+            'code_commune': code,
+            'valeur': valeur,
+        })
+
+    annuites = ratios['annuite_recettes']
+    masque = annuites > seuils['annuite_recettes_seuil']
+    for commune, valeur, exercice, code in zip(ratios.loc[masque, 'Commune'], annuites[masque],
+                                               exercices[masque], codes[masque]):
+        alertes.append({
+            'type': 'warning',
+            'commune': commune,
+            'message': f"Annuité de la dette élevée : {valeur:,.1f}% des recettes",
+            'indicateur': 'Annuité/recettes',
+            'exercice': exercice,
+            'code_commune': code,
+            'valeur': valeur,
+        })
+
+    return alertes
+
+
+# ============================================
+# SENSIBILITÉ DES SEUILS
+# ============================================
+
+def grille_seuils(debut, fin, pas):
+    """Valeurs de seuil de debut à fin incluse"""
+    return np.round(np.arange(debut, fin + pas / 2, pas), 10)
+
+
+def _indices_declenchement(valeurs, grille, declenchement):
+    """Position de chaque valeur dans la grille triée des seuils
+
+    inferieur : alerte au seuil i si i >= indice ; superieur : alerte au seuil i si i < indice.
+    Une valeur manquante ne déclenche jamais.
+    """
+    valeurs = np.asarray(valeurs, dtype=np.float64)
+    if declenchement == 'inferieur':
+        indices = np.searchsorted(grille, valeurs, side='right')
+        indices[np.isnan(valeurs)] = len(grille)
+    else:
+        indices = np.searchsorted(grille, valeurs, side='left')
+        indices[np.isnan(valeurs)] = 0
+    return indices
+
+
+def _cumuler(histogramme, axe, declenchement):
+    """Effectifs par indice de déclenchement -> nombre d'éléments en alerte pour chaque seuil de l'axe"""
+    taille = histogramme.shape[axe]
+    if declenchement == 'inferieur':
+        return np.cumsum(histogramme, axis=axe).take(np.arange(taille - 1), axis=axe)
+    suffixes = np.flip(np.cumsum(np.flip(histogramme, axis=axe), axis=axe), axis=axe)
+    return suffixes.take(np.arange(1, taille), axis=axe)
+
+
+def _comptes_croises(indices_x, indices_y, nb_x, nb_y, declenchement_x, declenchement_y):
+    """Éléments en alerte sur x, sur y et sur les deux pour chaque couple de seuils (histogramme 2-D cumulé)"""
+    histogramme = np.bincount(indices_x * (nb_y + 1) + indices_y, minlength=(nb_x + 1) * (nb_y + 1))
+    histogramme = histogramme.reshape(nb_x + 1, nb_y + 1)
+    en_alerte_x = _cumuler(histogramme.sum(axis=1), 0, declenchement_x)
+    en_alerte_y = _cumuler(histogramme.sum(axis=0), 0, declenchement_y)
+    deux = _cumuler(_cumuler(histogramme, 0, declenchement_x), 1, declenchement_y)
+    return en_alerte_x, en_alerte_y, deux
+
+
+def balayage_seuils(ratios, seuil_x, grille_x, seuil_y, grille_y, regles=REGLES_SENSIBILITE):
+    """Alertes et communes concernées pour chaque couple (seuil x, seuil y) d'une grille
+
+    Chaque (commune, exercice) est placée une fois dans la grille de chaque seuil : les comptes de
+    tous les couples s'obtiennent par sommes cumulées d'un histogramme 2-D, sans parcourir la grille.
+    Les règles portent sur la table des ratios (budget principal).
+    """
+    regle_x, regle_y = regles[seuil_x], regles[seuil_y]
+    grille_x = np.sort(np.asarray(grille_x, dtype=np.float64))
+    grille_y = np.sort(np.asarray(grille_y, dtype=np.float64))
+    indices_x = _indices_declenchement(ratios[regle_x['indicateur']], grille_x, regle_x['declenchement'])
+    indices_y = _indices_declenchement(ratios[regle_y['indicateur']], grille_y, regle_y['declenchement'])
+    alertes_x, alertes_y, doubles = _comptes_croises(indices_x, indices_y, len(grille_x), len(grille_y),
+                                                     regle_x['declenchement'], regle_y['declenchement'])
+
+    # Commune concernée si l'un de ses exercices déclenche : indice extrême de ses exercices
+    codes = pd.factorize(ratios['Code_Commune'])[0]
+    extremes = {'inferieur': 'min', 'superieur': 'max'}
+    par_commune = (
+        pd.DataFrame({'code': codes, 'x': indices_x, 'y': indices_y})[codes >= 0]
+        .groupby('code', sort=False)
+        .agg(x=('x', extremes[regle_x['declenchement']]), y=('y', extremes[regle_y['declenchement']]))
+    )
+    communes_x, communes_y, communes_deux = _comptes_croises(
+        par_commune['x'].to_numpy(), par_commune['y'].to_numpy(), len(grille_x), len(grille_y),
+        regle_x['declenchement'], regle_y['declenchement']
+    )
+
+    return {
+        'grille_x': grille_x,
+        'grille_y': grille_y,
+        'alertes': alertes_x[:, None] + alertes_y[None, :],
+        'communes_exercices': alertes_x[:, None] + alertes_y[None, :] - doubles,
+        'communes': communes_x[:, None] + communes_y[None, :] - communes_deux,
+        'nb_communes_exercices': len(ratios),
+        'nb_communes': len(par_commune),
+    }
@@ -0,0 +1,278 @@
+# magasin.py - Ingestion parallèle des fichiers OFGL dans un magasin Parquet partitionné
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from chargement import NUMERIC_COLS, ErreurChargement, charger_fichier, version_fichier
+from validation import valider
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow absent : le magasin n'est pas disponible
+    pa = None
+    ds = None
+    pq = None
+
+# ============================================
+# PARAMÈTRES DU MAGASIN
+# ============================================
+
+REPERTOIRE_MAGASIN = 'magasin_ofgl'
+# Préfixe '_' : ignoré par les lecteurs Parquet du répertoire
+FICHIER_MANIFESTE = '_manifeste.json'
+
+# Partitions : un répertoire par département puis par exercice
+COLONNES_PARTITION = ['Code_Departement', 'Exercice']
+
+# Colonnes entières ; toutes les autres colonnes non numériques sont stockées en texte
+COLONNES_ENTIERES = ['Exercice']
+
+
+# ============================================
+# INGESTION D'UN FICHIER (PROCESSUS DE TRAVAIL)
+# ============================================
+
+def _initialiser_processus(nb_threads):
+    """Répartit les cœurs entre processus : threads pyarrow par processus de travail"""
+    if pa is not None:
+        pa.set_cpu_count(nb_threads)
+
+
+def _texte(colonne):
+    """Colonne en texte, codes numériques sans décimales (97401.0 -> '97401')"""
+    if pd.api.types.is_float_dtype(colonne) and (colonne.dropna() % 1 == 0).all():
+        colonne = colonne.astype('Int64')
+    return colonne.astype('string')
+
+
+def schema_uniforme(df):
+    """Types identiques quel que soit le fichier : montants en float64, exercice entier, le reste en texte"""
+    for colonne in df.columns:
+        if colonne in NUMERIC_COLS:
+            df[colonne] = df[colonne].astype('float64')
+        elif colonne in COLONNES_ENTIERES:
+            df[colonne] = pd.to_numeric(df[colonne], errors='coerce').astype('Int64')
+        else:
+            df[colonne] = _texte(df[colonne])
+    return df
+
+
+def _prefixe(chemin):
+    """Préfixe des fichiers Parquet issus d'un fichier source (nom lisible et empreinte du chemin)"""
+    nom = os.path.splitext(os.path.basename(chemin))[0]
+    return f"{nom}-{hashlib.sha1(os.path.abspath(chemin).encode()).hexdigest()[:8]}"
+
+
+def ingerer_fichier(chemin, repertoire=REPERTOIRE_MAGASIN):
+    """Lit, normalise et écrit un fichier dans le magasin ; renvoie son rapport d'ingestion"""
+    debut = time.perf_counter()
+    df, rapport = charger_fichier(chemin, departement=None)
+    manquantes = [colonne for colonne in COLONNES_PARTITION if colonne not in df.columns]
+    if manquantes:
+        raise ErreurChargement(f"{chemin} : colonnes de partition absentes ({', '.join(manquantes)})")
+    df, qualite = valider(df, rapport['pertes_conversion'])
+    df = schema_uniforme(df).dropna(subset=COLONNES_PARTITION)
+
+    # Un fichier de sortie par (fichier source, partition) : les processus n'écrivent jamais le même fichier
+    prefixe = _prefixe(chemin)
+    for ancien in glob.glob(os.path.join(repertoire, '*', '*', f"{prefixe}-*.parquet")):
+        os.remove(ancien)  # réingestion : les partitions de l'ancienne version disparaissent
+    pq.write_to_dataset(
+        pa.Table.from_pandas(df, preserve_index=False),
+        repertoire,
+        partition_cols=COLONNES_PARTITION,
+        basename_template=f"{prefixe}-{{i}}.parquet",
+        existing_data_behavior='overwrite_or_ignore',
+    )
+
+    duree = time.perf_counter() - debut
+    taille = os.path.getsize(chemin)
+    return {
+        'fichier': os.path.abspath(chemin),
+        'version': rapport['version'],
+        'encodage': rapport['encodage'],
+        'moteur': rapport['moteur'],
+        'lignes': len(df),
+        'quarantaine': qualite['lignes_quarantaine'],
+        'duree_s': duree,
+        'lignes_par_s': len(df) / duree if duree > 0 else 0.0,
+        'mo_par_s': taille / 1_000_000 / duree if duree > 0 else 0.0,
+    }
+
+
+# ============================================
+# INGESTION PARALLÈLE
+# ============================================
+
+def lister_fichiers(sources):
+    """Fichiers CSV désignés par des répertoires, des motifs glob ou des chemins"""
+    fichiers = []
+    for source in sources:
+        if os.path.isdir(source):
+            fichiers.extend(glob.glob(os.path.join(source, '*.csv')))
+        else:
+            fichiers.extend(glob.glob(source))
+    return sorted(set(os.path.abspath(fichier) for fichier in fichiers))
+
+
+def version_magasin(fichiers):
+    """Version du magasin : empreinte des versions des fichiers sources"""
+    return hashlib.sha1('|'.join(sorted(fichier['version'] for fichier in fichiers)).encode()).hexdigest()[:16]
+
+
+def lire_manifeste(repertoire=REPERTOIRE_MAGASIN):
+    """Manifeste du magasin (fichiers ingérés, partitions, version), vide si absent"""
+    chemin = os.path.join(repertoire, FICHIER_MANIFESTE)
+    if not os.path.isfile(chemin):
+        return {'version': None, 'fichiers': [], 'partitions': []}
+    with open(chemin, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _partitions(repertoire):
+    """Couples (département, exercice) présents dans le magasin"""
+    partitions = []
+    for chemin in glob.glob(os.path.join(repertoire, 'Code_Departement=*', 'Exercice=*')):
+        departement = os.path.basename(os.path.dirname(chemin)).split('=', 1)[1]
+        partitions.append([departement, int(os.path.basename(chemin).split('=', 1)[1])])
+    return sorted(partitions)
+
+
+def _supprimer_partitions_vides(repertoire):
+    """Supprime les répertoires de partition vidés par une réingestion (départements ou exercices retirés)"""
+    for motif in (os.path.join('Code_Departement=*', 'Exercice=*'), 'Code_Departement=*'):
+        for chemin in glob.glob(os.path.join(repertoire, motif)):
+            if not os.listdir(chemin):
+                os.rmdir(chemin)
+
+
+def ingerer(sources, repertoire=REPERTOIRE_MAGASIN, nb_processus=None):
+    """Ingère les fichiers en parallèle (un processus par fichier) et met à jour le manifeste"""
+    if pq is None:
+        raise ErreurChargement("pyarrow est requis pour le magasin partitionné")
+    fichiers = lister_fichiers(sources)
+    if not fichiers:
+        raise ErreurChargement(f"Aucun fichier CSV trouvé : {', '.join(sources)}")
+
+    nb_coeurs = os.cpu_count() or 1
+    nb_processus = min(nb_processus or nb_coeurs, len(fichiers))
+    os.makedirs(repertoire, exist_ok=True)
+
+    # Fichiers déjà ingérés dans cette version : ignorés
+    deja_ingeres = {fichier['fichier']: fichier for fichier in lire_manifeste(repertoire)['fichiers']}
+    a_ingerer = [chemin for chemin in fichiers
+                 if deja_ingeres.get(chemin, {}).get('version') != version_fichier(chemin)]
+
+    debut = time.perf_counter()
+    rapports, erreurs = [], []
+    if a_ingerer:
+        with ProcessPoolExecutor(max_workers=nb_processus, initializer=_initialiser_processus,
+                                 initargs=(max(1, nb_coeurs // nb_processus),)) as pool:
+            taches = {pool.submit(ingerer_fichier, chemin, repertoire): chemin for chemin in a_ingerer}
+            for tache in as_completed(taches):
+                try:
+                    rapports.append(tache.result())
+                except ErreurChargement as e:
+                    erreurs.append({'fichier': taches[tache], 'erreur': str(e)})
+
+    # Après les processus de travail : aucune écriture en cours dans les partitions
+    _supprimer_partitions_vides(repertoire)
+    for rapport in rapports:
+        deja_ingeres[rapport['fichier']] = rapport
+    manifeste = {
+        'fichiers': sorted(deja_ingeres.values(), key=lambda fichier: fichier['fichier']),
+        'partitions': _partitions(repertoire),
+    }
+    manifeste['version'] = version_magasin(manifeste['fichiers'])
+    # Écriture atomique : un lecteur ne voit jamais un manifeste partiel
+    temporaire = os.path.join(repertoire, FICHIER_MANIFESTE + '.tmp')
+    with open(temporaire, 'w', encoding='utf-8') as f:
+        json.dump(manifeste, f, ensure_ascii=False, indent=2)
+    os.replace(temporaire, os.path.join(repertoire, FICHIER_MANIFESTE))
+
+    return {
+        'rapports': sorted(rapports, key=lambda rapport: rapport['fichier']),
+        'erreurs': erreurs,
+        'ignores': len(fichiers) - len(a_ingerer),
+        'nb_processus': nb_processus,
+        'duree_s': time.perf_counter() - debut,
+        'manifeste': manifeste,
+    }
+
+
+# ============================================
+# LECTURE PAR DÉPARTEMENT
+# ============================================
+
+def index_departements(df):
+    """Positions des lignes de chaque département du fichier chargé (repli quand le magasin n'est pas à jour)"""
+    if 'Code_Departement' not in df.columns:
+        return {}
+    return {departement: positions
+            for departement, positions in df.groupby('Code_Departement', sort=True).indices.items()}
+
+
+def magasin_a_jour(fichiers, repertoire=REPERTOIRE_MAGASIN):
+    """Vrai si le magasin contient exactement ces fichiers sources, dans leur version actuelle"""
+    if pq is None:
+        return False
+    ingeres = {fichier['fichier']: fichier['version'] for fichier in lire_manifeste(repertoire)['fichiers']}
+    try:
+        sources = {os.path.abspath(chemin): version_fichier(chemin) for chemin in fichiers}
+    except OSError:
+        return False
+    return bool(sources) and ingeres == sources
+
+
+def lire_departement(departement, repertoire=REPERTOIRE_MAGASIN, modele=None):
+    """Lignes d'un département lues dans sa seule partition du magasin
+
+    modele : DataFrame dont les colonnes et les types sont repris (ceux du fichier chargé en mémoire),
+    pour que les lignes lues se comparent aux tables nationales
+    """
+    if pq is None:
+        raise ErreurChargement("pyarrow est requis pour le magasin partitionné")
+    chemin = os.path.join(repertoire, f"Code_Departement={departement}")
+    if not os.path.isdir(chemin):
+        raise ErreurChargement(f"Département absent du magasin : {departement}")
+    partitionnement = ds.partitioning(pa.schema([('Exercice', pa.int64())]), flavor='hive')
+    df = ds.dataset(chemin, format='parquet', partitioning=partitionnement).to_table().to_pandas()
+    df['Code_Departement'] = str(departement)
+    if modele is None:
+        return df
+    colonnes = [colonne for colonne in modele.columns if colonne in df.columns]
+    for colonne in colonnes:
+        try:
+            df[colonne] = df[colonne].astype(modele[colonne].dtype)
+        except (TypeError, ValueError):  # valeurs manquantes dans une colonne entière : type du magasin conservé
+            pass
+    return df[colonnes]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ingestion parallèle de fichiers OFGL dans un magasin Parquet")
+    parser.add_argument('sources', nargs='+', help="répertoires, motifs glob ou fichiers CSV")
+    parser.add_argument('--magasin', default=REPERTOIRE_MAGASIN)
+    parser.add_argument('--processus', type=int, help="processus de travail (par défaut : un par cœur)")
+    args = parser.parse_args()
+
+    resultat = ingerer(args.sources, args.magasin, args.processus)
+    for rapport in resultat['rapports']:
+        print(f"{os.path.basename(rapport['fichier'])} : {rapport['lignes']:,} lignes en {rapport['duree_s']:.2f} s "
+              f"({rapport['lignes_par_s']:,.0f} lignes/s, {rapport['mo_par_s']:.1f} Mo/s, "
+              f"{rapport['quarantaine']:,} en quarantaine, "
+              f"{rapport['encodage']}, {rapport['moteur']})")
+    for erreur in resultat['erreurs']:
+        print(f"ERREUR {erreur['fichier']} : {erreur['erreur']}")
+    total = sum(rapport['lignes'] for rapport in resultat['rapports'])
+    print(f"{len(resultat['rapports'])} fichiers ({resultat['ignores']} déjà à jour), {total:,} lignes "
+          f"en {resultat['duree_s']:.2f} s sur {resultat['nb_processus']} processus ; "
+          f"{len(resultat['manifeste']['partitions'])} partitions, version {resultat['manifeste']['version']}")
@@ -0,0 +1,183 @@
+# memoire.py - Cache des artefacts dérivés sous budget mémoire : éviction LRU pondérée par la taille et statistiques
+import functools
+import inspect
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# ============================================
+# PARAMÈTRES DU CACHE
+# ============================================
+
+# Budget total des artefacts en cache (Mo), à régler d'après la mémoire du conteneur
+BUDGET_CACHE_MO = float(os.environ.get('OFGL_BUDGET_CACHE_MO', 512))
+
+# Profondeur d'exploration des conteneurs imbriqués pour l'estimation de taille
+PROFONDEUR_TAILLE = 4
+
+
+# ============================================
+# ESTIMATION DE LA TAILLE
+# ============================================
+
+def taille_objet(objet, profondeur=PROFONDEUR_TAILLE):
+    """Taille approximative (octets) d'un artefact : tables, tableaux, textes et leurs conteneurs"""
+    if isinstance(objet, pd.DataFrame):
+        # deep=True : les colonnes texte pèsent souvent plus que les montants (mesuré une fois, à l'insertion)
+        return int(objet.memory_usage(index=True, deep=True).sum())
+    if isinstance(objet, (pd.Series, pd.Index)):
+        return int(objet.memory_usage(deep=True))
+    if isinstance(objet, np.ndarray):
+        return int(objet.nbytes)
+    if isinstance(objet, (str, bytes, bytearray)):
+        return sys.getsizeof(objet)
+    if profondeur <= 0:
+        return sys.getsizeof(objet)
+    if isinstance(objet, dict):
+        return sys.getsizeof(objet) + sum(taille_objet(cle, profondeur - 1) + taille_objet(valeur, profondeur - 1)
+                                          for cle, valeur in objet.items())
+    if isinstance(objet, (list, tuple, set, frozenset)):
+        return sys.getsizeof(objet) + sum(taille_objet(element, profondeur - 1) for element in objet)
+    if isinstance(getattr(objet, 'data', None), np.ndarray):  # arbre KD : points et permutation
+        return int(objet.data.nbytes + getattr(objet, 'indices', np.empty(0)).nbytes)
+    if hasattr(objet, '__dict__'):
+        return sys.getsizeof(objet) + taille_objet(vars(objet), profondeur - 1)
+    return sys.getsizeof(objet)
+
+
+def cle_hachable(valeur):
+    """Paramètre utilisable en clé : dictionnaires et listes convertis en tuples"""
+    if isinstance(valeur, dict):
+        return tuple(sorted((cle, cle_hachable(element)) for cle, element in valeur.items()))
+    if isinstance(valeur, (list, tuple)):
+        return tuple(cle_hachable(element) for element in valeur)
+    if isinstance(valeur, (set, frozenset)):
+        return tuple(sorted(cle_hachable(element) for element in valeur))
+    return valeur
+
+
+# ============================================
+# GESTIONNAIRE
+# ============================================
+
+class GestionnaireCache:
+    """Artefacts dérivés partagés par les sessions, sous un budget mémoire commun
+
+    Chaque entrée appartient à un espace (tables, figures, styles, cartes, exports...) et,
+    si elle dépend des données, à une version du fichier : changer de version libère les autres.
+    Les valeurs sont partagées sans copie et ne doivent pas être modifiées par l'appelant.
+    """
+
+    def __init__(self, budget_mo=BUDGET_CACHE_MO):
+        self.budget_octets = int(budget_mo * 1_000_000)
+        self.version_courante = None
+        self._entrees = OrderedDict()  # (espace, version, cle) -> (valeur, taille)
+        self._occupation = 0
+        self._stats = {}
+        self._verrou = threading.Lock()
+
+    def _stat(self, espace):
+        if espace not in self._stats:
+            self._stats[espace] = {'succes': 0, 'echecs': 0, 'evictions': 0, 'invalidations': 0,
+                                   'refus': 0, 'entrees': 0, 'octets': 0, 'duree_calcul_s': 0.0}
+        return self._stats[espace]
+
+    def _retirer(self, cle_complete, motif):
+        _, taille = self._entrees.pop(cle_complete)
+        self._occupation -= taille
+        stat = self._stat(cle_complete[0])
+        stat[motif] += 1
+        stat['entrees'] -= 1
+        stat['octets'] -= taille
+
+    def obtenir(self, espace, cle, calculer, version=None):
+        """Valeur en cache, sinon calculée puis conservée si elle tient dans le budget"""
+        cle_complete = (espace, version, cle)
+        with self._verrou:
+            if cle_complete in self._entrees:
+                self._entrees.move_to_end(cle_complete)
+                self._stat(espace)['succes'] += 1
+                return self._entrees[cle_complete][0]
+            self._stat(espace)['echecs'] += 1
+
+        # Calcul hors verrou : les autres sessions ne sont pas bloquées
+        debut = time.perf_counter()
+        valeur = calculer()
+        duree = time.perf_counter() - debut
+        taille = taille_objet(valeur)
+
+        with self._verrou:
+            stat = self._stat(espace)
+            stat['duree_calcul_s'] += duree
+            if taille > self.budget_octets:
+                stat['refus'] += 1
+                return valeur
+            if cle_complete in self._entrees:  # calculée entre-temps par une autre session
+                return self._entrees[cle_complete][0]
+            self._entrees[cle_complete] = (valeur, taille)
+            self._occupation += taille
+            stat['entrees'] += 1
+            stat['octets'] += taille
+            # Éviction des entrées les moins récemment utilisées jusqu'à revenir sous le budget
+            while self._occupation > self.budget_octets:
+                self._retirer(next(iter(self._entrees)), 'evictions')
+        return valeur
+
+    def invalider(self, version):
+        """Déclare la version servie : les entrées liées à une autre version sont libérées"""
+        if version == self.version_courante:
+            return 0
+        with self._verrou:
+            self.version_courante = version
+            obsoletes = [cle for cle in self._entrees if cle[1] is not None and cle[1] != version]
+            for cle in obsoletes:
+                self._retirer(cle, 'invalidations')
+        return len(obsoletes)
+
+    def vider(self, espace=None):
+        """Libère tout le cache ou un espace"""
+        with self._verrou:
+            for cle in [cle for cle in self._entrees if espace is None or cle[0] == espace]:
+                self._retirer(cle, 'invalidations')
+
+    def en_cache(self, espace):
+        """Décorateur : mémorise la fonction dans un espace
+
+        Comme st.cache_data, les paramètres préfixés par '_' ne font pas partie de la clé ;
+        un paramètre 'version' rattache l'entrée à la version des données.
+        """
+        def decorateur(fonction):
+            signature = inspect.signature(fonction)
+            noms_cle = [nom for nom in signature.parameters if not nom.startswith('_')]
+
+            @functools.wraps(fonction)
+            def enveloppe(*args, **kwargs):
+                arguments = signature.bind(*args, **kwargs)
+                arguments.apply_defaults()
+                cle = (fonction.__qualname__,) + tuple(cle_hachable(arguments.arguments[nom]) for nom in noms_cle)
+                return self.obtenir(espace, cle, lambda: fonction(*args, **kwargs),
+                                    version=arguments.arguments.get('version'))
+            return enveloppe
+        return decorateur
+
+    def statistiques(self):
+        """Succès, échecs, évictions et occupation par espace"""
+        with self._verrou:
+            lignes = [{'espace': espace, **stat} for espace, stat in sorted(self._stats.items())]
+            occupation = self._occupation
+        stats = pd.DataFrame(lignes, columns=['espace', 'succes', 'echecs', 'evictions', 'invalidations', 'refus',
+                                              'entrees', 'octets', 'duree_calcul_s'])
+        demandes = stats['succes'] + stats['echecs']
+        stats['taux_succes'] = np.where(demandes > 0, stats['succes'] / demandes.where(demandes > 0, 1) * 100, np.nan)
+        stats['mo'] = stats['octets'] / 1_000_000
+        return stats, {'occupation_mo': occupation / 1_000_000, 'budget_mo': self.budget_octets / 1_000_000,
+                       'version': self.version_courante}
+
+
+# Instance partagée par toutes les sessions du processus
+cache = GestionnaireCache()
@@ -0,0 +1,177 @@
+# profils.py - Profils financiers standardisés, communes similaires et typologie (k-means)
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # scipy absent : recherche exhaustive vectorisée
+    cKDTree = None
+
+# ============================================
+# VARIABLES DU PROFIL
+# ============================================
+
+# Indicateurs de la table des ratios composant le profil d'une commune
+VARIABLES_PROFIL = ['epargne_hab', 'recettes_hab', 'depenses_hab', 'taux_epargne', 'financement_hab', 'Population']
+
+LIBELLES_PROFIL = {
+    'epargne_hab': 'Épargne/hab',
+    'recettes_hab': 'Recettes/hab',
+    'depenses_hab': 'Dépenses/hab',
+    'taux_epargne': 'Taux épargne',
+    'financement_hab': 'Capacité financement/hab',
+    'Population': 'Population',
+}
+
+
+# ============================================
+# MATRICE STANDARDISÉE
+# ============================================
+
+def matrice_profils(ratios, exercice=None):
+    """Matrice standardisée (z-scores) des profils des communes d'un exercice (tous si None)"""
+    communes = ratios if exercice is None else ratios[ratios['Exercice'] == exercice]
+    valeurs = communes[VARIABLES_PROFIL].replace([np.inf, -np.inf], np.nan)
+    complet = valeurs.notna().all(axis=1)
+    communes = communes[complet].reset_index(drop=True)
+    valeurs = valeurs[complet].to_numpy(np.float64)
+
+    # Population très asymétrique : comparée en ordre de grandeur
+    colonne_population = VARIABLES_PROFIL.index('Population')
+    valeurs[:, colonne_population] = np.log1p(np.clip(valeurs[:, colonne_population], 0, None))
+
+    moyennes = valeurs.mean(axis=0) if len(valeurs) else np.zeros(len(VARIABLES_PROFIL))
+    ecarts = valeurs.std(axis=0) if len(valeurs) else np.ones(len(VARIABLES_PROFIL))
+    ecarts[ecarts == 0] = 1.0
+    return communes, (valeurs - moyennes) / ecarts, moyennes, ecarts
+
+
+def index_similarite(ratios, exercice):
+    """Construit la matrice standardisée et les arbres KD (national et par département) d'un exercice"""
+    communes, matrice, _, _ = matrice_profils(ratios, exercice)
+    arbre = cKDTree(matrice) if cKDTree is not None and len(matrice) else None
+    positions = pd.Series(np.arange(len(communes)), index=communes['Code_Commune'])
+    # Lignes de chaque département et arbre KD restreint à ces lignes
+    departements = communes.groupby('Code_Departement', observed=True, sort=False).indices if len(communes) else {}
+    arbres_departements = {departement: cKDTree(matrice[lignes]) for departement, lignes in departements.items()} \
+        if cKDTree is not None else {}
+    return {'communes': communes, 'matrice': matrice, 'arbre': arbre, 'positions': positions,
+            'departements': departements, 'arbres_departements': arbres_departements}
+
+
+# ============================================
+# RECHERCHE DES PLUS PROCHES VOISINS
+# ============================================
+
+def communes_similaires(index, code_commune, k=5, departement=None):
+    """Les k communes au profil le plus proche (distance euclidienne sur les z-scores)"""
+    debut = time.perf_counter()
+    if code_commune not in index['positions'].index:
+        return pd.DataFrame(), 0.0
+    position = index['positions'][code_commune]
+    point = index['matrice'][position]
+
+    if departement is None:
+        candidats, arbre = np.arange(len(index['matrice'])), index['arbre']
+    else:
+        # Seules les lignes du département sont interrogées (son propre arbre KD)
+        candidats = index['departements'].get(departement, np.empty(0, dtype=np.int64))
+        arbre = index['arbres_departements'].get(departement)
+
+    if arbre is not None:
+        # k + 1 : la commune elle-même est son propre plus proche voisin
+        distances, voisins = arbre.query(point, k=min(k + 1, len(candidats)))
+        distances, voisins = np.atleast_1d(distances), candidats[np.atleast_1d(voisins)]
+    else:
+        distances = np.sqrt(((index['matrice'][candidats] - point) ** 2).sum(axis=1))
+        ordre = np.argsort(distances)[:k + 1]
+        distances, voisins = distances[ordre], candidats[ordre]
+
+    garder = voisins != position
+    resultat = index['communes'].iloc[voisins[garder][:k]][['Commune', 'Code_Departement'] + VARIABLES_PROFIL].copy()
+    resultat.insert(2, 'Distance', distances[garder][:k])
+    return resultat.reset_index(drop=True), time.perf_counter() - debut
+
+
+# ============================================
+# TYPOLOGIE DES COMMUNES (K-MEANS)
+# ============================================
+
+# Taille des blocs de calcul des distances (lignes × profils)
+TAILLE_BLOC_KMEANS = 65536
+
+COULEURS_PROFILS = ['blue', 'green', 'orange', 'purple', 'red', 'cadetblue', 'darkgreen', 'pink', 'gray', 'black']
+
+
+def _affecter(matrice, centres, taille_bloc=TAILLE_BLOC_KMEANS):
+    """Indice du centre le plus proche de chaque ligne, par blocs pour borner la mémoire"""
+    normes_centres = (centres ** 2).sum(axis=1)
+    affectations = np.empty(len(matrice), dtype=np.int64)
+    for debut in range(0, len(matrice), taille_bloc):
+        bloc = matrice[debut:debut + taille_bloc]
+        # ||x - c||² à une constante près : ||c||² - 2 x·c
+        affectations[debut:debut + taille_bloc] = np.argmin(normes_centres - 2 * bloc @ centres.T, axis=1)
+    return affectations
+
+
+def kmeans(matrice, nb_profils, graine=0, iterations_max=100, tolerance=1e-4):
+    """K-means (Lloyd) vectorisé avec initialisation k-means++"""
+    rng = np.random.default_rng(graine)
+    n = len(matrice)
+    nb_profils = min(nb_profils, n)
+
+    # Initialisation k-means++ : tirage pondéré par la distance au centre le plus proche
+    centres = np.empty((nb_profils, matrice.shape[1]))
+    centres[0] = matrice[rng.integers(n)]
+    distances = ((matrice - centres[0]) ** 2).sum(axis=1)
+    for j in range(1, nb_profils):
+        total = distances.sum()
+        choix = rng.choice(n, p=distances / total) if total > 0 else rng.integers(n)
+        centres[j] = matrice[choix]
+        distances = np.minimum(distances, ((matrice - centres[j]) ** 2).sum(axis=1))
+
+    for _ in range(iterations_max):
+        affectations = _affecter(matrice, centres)
+        effectifs = np.bincount(affectations, minlength=nb_profils)
+        sommes = np.stack([np.bincount(affectations, weights=matrice[:, j], minlength=nb_profils)
+                           for j in range(matrice.shape[1])], axis=1)
+        # Un profil vide garde son centre précédent
+        nouveaux = np.where(effectifs[:, None] > 0, sommes / np.maximum(effectifs, 1)[:, None], centres)
+        deplacement = np.abs(nouveaux - centres).max()
+        centres = nouveaux
+        if deplacement < tolerance:
+            break
+
+    return _affecter(matrice, centres), centres
+
+
+def profils_financiers(ratios, nb_profils=5, graine=0):
+    """Classe toutes les (commune, exercice) en profils financiers ; renvoie affectations et centres"""
+    communes, matrice, moyennes, ecarts = matrice_profils(ratios)
+    if len(matrice) == 0:
+        return pd.DataFrame(), pd.DataFrame()
+    affectations, centres = kmeans(matrice, nb_profils, graine)
+
+    # Profils numérotés par épargne/hab décroissante, libellés par leur trait le plus marqué
+    ordre = np.argsort(-centres[:, VARIABLES_PROFIL.index('epargne_hab')])
+    rang = np.empty_like(ordre)
+    rang[ordre] = np.arange(len(ordre))
+    libelles = []
+    for numero, centre in enumerate(centres[ordre], start=1):
+        variable = int(np.argmax(np.abs(centre)))
+        sens = 'élevé(e)' if centre[variable] > 0 else 'faible'
+        libelles.append(f"P{numero} · {LIBELLES_PROFIL[VARIABLES_PROFIL[variable]]} {sens}")
+
+    resultat = communes[['Exercice', 'Code_Commune', 'Commune', 'Code_Departement', 'Population']].copy()
+    resultat['numero_profil'] = rang[affectations]
+    resultat['Profil'] = pd.Categorical.from_codes(resultat['numero_profil'], categories=libelles)
+
+    # Centres dans les unités d'origine (population repassée en habitants)
+    valeurs_centres = centres[ordre] * ecarts + moyennes
+    colonne_population = VARIABLES_PROFIL.index('Population')
+    valeurs_centres[:, colonne_population] = np.expm1(valeurs_centres[:, colonne_population])
+    centres_df = pd.DataFrame(valeurs_centres, columns=VARIABLES_PROFIL, index=pd.Index(libelles, name='Profil'))
+    centres_df['effectif'] = np.bincount(resultat['numero_profil'], minlength=len(libelles))
+    return resultat, centres_df
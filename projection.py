@@ -0,0 +1,161 @@
+# projection.py - Projection Monte Carlo vectorisée de l'épargne et de la dette des communes
+import time
+
+import numpy as np
+import pandas as pd
+
+# ============================================
+# PARAMÈTRES DE SIMULATION
+# ============================================
+
+QUANTILES_PROJECTION = [5, 25, 50, 75, 95]
+
+INDICATEURS_PROJECTION = ['epargne_hab', 'encours_hab', 'capacite_desendettement']
+
+# Capacité de désendettement plafonnée (épargne nulle ou négative)
+PLAFOND_DESENDETTEMENT = 50.0  # années
+
+# Mémoire maximale d'un lot de simulation (communes × trajectoires × années)
+BUDGET_LOT_OCTETS = 512 * 1024 * 1024
+NB_TABLEAUX_LOT = 8  # chocs, recettes, charges, épargne, encours, capacité et temporaires
+
+# Durée d'amortissement par défaut quand l'annuité n'est pas renseignée
+DUREE_AMORTISSEMENT_DEFAUT = 15  # années
+
+HYPOTHESES_DEFAUT = {
+    'horizon': 10,                    # années projetées
+    'nb_trajectoires': 2000,
+    'croissance_recettes': 0.02,      # par an
+    'croissance_charges': 0.02,       # par an
+    'volatilite': 0.03,               # écart-type annuel des chocs
+    'taux_interet': 0.025,            # taux moyen de l'encours
+    'choc_taux': 0.0,                 # points ajoutés au taux dès la 1re année
+    'annees_stagnation': 0,           # années sans croissance des recettes
+    'part_investissement': 0.10,      # investissement annuel en part des recettes
+    'graine': 0,
+}
+
+
+# ============================================
+# ÉTAT INITIAL
+# ============================================
+
+def etat_initial(ratios, taux_interet):
+    """Extrait les vecteurs initiaux (€/hab) de la table des ratios d'un exercice"""
+    ratios = ratios.dropna(subset=['recettes_hab', 'epargne_hab'])
+    recettes = ratios['recettes_hab'].to_numpy(np.float64)
+    epargne = ratios['epargne_hab'].to_numpy(np.float64)
+    encours = ratios['encours_hab'].fillna(0).clip(lower=0).to_numpy(np.float64)
+    annuite = (ratios['annuite_recettes'] * ratios['recettes_hab'] / 100).to_numpy(np.float64)
+
+    interets = encours * taux_interet
+    # Charges hors intérêts : recettes - épargne - intérêts (convention dépenses = recettes - épargne)
+    charges = recettes - epargne - interets
+    # Taux d'amortissement implicite du capital, à défaut une durée standard
+    remboursement = np.clip(annuite - interets, 0, None)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        taux_amortissement = np.where(
+            (encours > 0) & (remboursement > 0), remboursement / encours, 1 / DUREE_AMORTISSEMENT_DEFAUT
+        )
+    taux_amortissement = np.clip(taux_amortissement, 0, 1)
+
+    return ratios[['Code_Commune', 'Commune', 'Exercice']].reset_index(drop=True), {
+        'recettes': recettes,
+        'charges': charges,
+        'encours': encours,
+        'taux_amortissement': taux_amortissement,
+    }
+
+
+# ============================================
+# SIMULATION
+# ============================================
+
+def simuler_lot(etat, rng, horizon, nb_trajectoires, croissance_recettes, croissance_charges,
+                volatilite, taux_interet, choc_taux, annees_stagnation, part_investissement):
+    """Simule un lot de communes ; renvoie les trajectoires (communes × trajectoires × années)"""
+    n = len(etat['recettes'])
+    forme = (n, nb_trajectoires, horizon)
+
+    # Tous les chocs du lot tirés en une fois
+    chocs_recettes = rng.standard_normal(forme, dtype=np.float32) * np.float32(volatilite)
+    chocs_charges = rng.standard_normal(forme, dtype=np.float32) * np.float32(volatilite)
+    croissance = np.full(horizon, croissance_recettes, dtype=np.float32)
+    croissance[:annees_stagnation] = 0.0
+
+    # Recettes et charges : produits cumulés le long de l'axe des années
+    recettes = etat['recettes'][:, None, None].astype(np.float32) * \
+        np.cumprod(1 + croissance + chocs_recettes, axis=2)
+    charges = etat['charges'][:, None, None].astype(np.float32) * \
+        np.cumprod(1 + np.float32(croissance_charges) + chocs_charges, axis=2)
+
+    # La dette dépend de l'épargne de l'année : récurrence sur l'horizon
+    taux = np.float32(taux_interet + choc_taux)
+    amortissement = etat['taux_amortissement'][:, None].astype(np.float32)
+    encours_courant = np.broadcast_to(etat['encours'][:, None].astype(np.float32), (n, nb_trajectoires)).copy()
+    epargne = np.empty(forme, dtype=np.float32)
+    encours = np.empty(forme, dtype=np.float32)
+    for t in range(horizon):
+        epargne[:, :, t] = recettes[:, :, t] - charges[:, :, t] - encours_courant * taux
+        remboursement = encours_courant * amortissement
+        # Emprunt : ce que l'épargne ne couvre pas du remboursement et de l'investissement
+        emprunt = np.maximum(remboursement + part_investissement * recettes[:, :, t] - epargne[:, :, t], 0)
+        encours_courant = encours_courant - remboursement + emprunt
+        encours[:, :, t] = encours_courant
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        capacite = np.where(epargne > 0, encours / epargne, PLAFOND_DESENDETTEMENT)
+    capacite = np.minimum(capacite, PLAFOND_DESENDETTEMENT)
+
+    return {'epargne_hab': epargne, 'encours_hab': encours, 'capacite_desendettement': capacite}
+
+
+def projeter(ratios, seuil_desendettement=12, **hypotheses):
+    """Projette toutes les communes d'un exercice et renvoie les bandes de percentiles et une synthèse"""
+    params = {**HYPOTHESES_DEFAUT, **hypotheses}
+    graine = params.pop('graine')
+    horizon = params['horizon']
+    nb_trajectoires = params['nb_trajectoires']
+
+    debut = time.perf_counter()
+    communes, etat = etat_initial(ratios, params['taux_interet'])
+    n = len(communes)
+    if n == 0:
+        return pd.DataFrame(), pd.DataFrame(), 0.0
+
+    # Taille des lots bornée par le budget mémoire (float32)
+    taille_lot = max(1, BUDGET_LOT_OCTETS // (nb_trajectoires * horizon * 4 * NB_TABLEAUX_LOT))
+    rng = np.random.default_rng(graine)
+
+    bandes = {nom: np.empty((n, horizon, len(QUANTILES_PROJECTION)), dtype=np.float32)
+              for nom in INDICATEURS_PROJECTION}
+    probabilite_depassement = np.empty(n, dtype=np.float64)
+    for debut_lot in range(0, n, taille_lot):
+        lot = slice(debut_lot, min(debut_lot + taille_lot, n))
+        trajectoires = simuler_lot({cle: valeurs[lot] for cle, valeurs in etat.items()}, rng, **params)
+        for nom, valeurs in trajectoires.items():
+            # (quantiles, communes, années) -> (communes, années, quantiles)
+            bandes[nom][lot] = np.percentile(valeurs, QUANTILES_PROJECTION, axis=1).transpose(1, 2, 0)
+        probabilite_depassement[lot] = (trajectoires['capacite_desendettement'][:, :, -1]
+                                        > seuil_desendettement).mean(axis=1)
+
+    # Format long : une ligne par (commune, année, indicateur)
+    annees = communes['Exercice'].to_numpy()[:, None] + np.arange(1, horizon + 1)
+    morceaux = []
+    for nom, valeurs in bandes.items():
+        morceau = pd.DataFrame(valeurs.reshape(n * horizon, -1),
+                               columns=[f"p{q}" for q in QUANTILES_PROJECTION])
+        morceau.insert(0, 'Indicateur', nom)
+        morceau.insert(0, 'Annee', annees.ravel())
+        morceau.insert(0, 'Commune', np.repeat(communes['Commune'].to_numpy(), horizon))
+        morceau.insert(0, 'Code_Commune', np.repeat(communes['Code_Commune'].to_numpy(), horizon))
+        morceaux.append(morceau)
+    bandes_df = pd.concat(morceaux, ignore_index=True)
+
+    synthese = communes[['Code_Commune', 'Commune']].copy()
+    synthese['epargne_hab_mediane'] = bandes['epargne_hab'][:, -1, QUANTILES_PROJECTION.index(50)]
+    synthese['encours_hab_median'] = bandes['encours_hab'][:, -1, QUANTILES_PROJECTION.index(50)]
+    synthese['capacite_desendettement_mediane'] = bandes['capacite_desendettement'][:, -1, QUANTILES_PROJECTION.index(50)]
+    synthese['probabilite_depassement'] = probabilite_depassement * 100
+
+    return bandes_df, synthese, time.perf_counter() - debut
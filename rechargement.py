@@ -0,0 +1,182 @@
+# rechargement.py - Rechargement à chaud des données OFGL : surveillance, reconstruction en arrière-plan, bascule atomique
+#                   et tables dérivées d'une version, en cache commun au dashboard et à l'API
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from chargement import ErreurChargement, charger_fichier, version_fichier
+from indicateurs import (TYPE_BUDGET_CONSOLIDE, TYPE_BUDGET_PRINCIPAL, classer_services, consolider_budgets,
+                         index_groupes, table_ratios)
+from magasin import index_departements, lister_fichiers
+from memoire import cache
+from validation import valider
+
+# ============================================
+# PARAMÈTRES DE SURVEILLANCE
+# ============================================
+
+# Intervalle entre deux contrôles de la version de la source
+INTERVALLE_SURVEILLANCE_S = 5
+
+# Une nouvelle version n'est chargée qu'une fois stable sur deux contrôles (fichier en cours de copie)
+NB_CONTROLES_STABLES = 2
+
+# Budgets analysés : type de ligne retenu par les ratios, KPI et tendances
+TYPES_BUDGET_ANALYSE = {'principal': TYPE_BUDGET_PRINCIPAL, 'consolide': TYPE_BUDGET_CONSOLIDE}
+
+
+# ============================================
+# SOURCE DES DONNÉES (FICHIER OU RÉPERTOIRE)
+# ============================================
+
+def fichiers_source(source):
+    """Fichiers CSV d'une source : le fichier lui-même ou tous les CSV du répertoire"""
+    if os.path.isdir(source):
+        return lister_fichiers([source])
+    return [source]
+
+
+def version_source(source):
+    """Version d'une source : celle du fichier, ou empreinte des versions des CSV du répertoire"""
+    if not os.path.isdir(source):
+        return version_fichier(source)
+    fichiers = fichiers_source(source)
+    if not fichiers:
+        raise ErreurChargement(f"Aucun fichier CSV dans {source}")
+    return hashlib.sha1('|'.join(version_fichier(chemin) for chemin in fichiers).encode()).hexdigest()[:16]
+
+
+def charger_source(source):
+    """Lit, valide et enrichit la source ; renvoie le DataFrame national et le rapport de chargement"""
+    version = version_source(source)
+    tables, rapports, pertes_conversion = [], [], {}
+    decalage = 0
+    for chemin in fichiers_source(source):
+        df, rapport = charger_fichier(chemin, departement=None)
+        # Étiquettes des pertes de conversion décalées dans l'index de la table concaténée
+        for colonne, etiquettes in rapport['pertes_conversion'].items():
+            pertes_conversion.setdefault(colonne, []).append(np.asarray(etiquettes) + decalage)
+        decalage += len(df)
+        tables.append(df)
+        rapports.append(rapport)
+
+    df = tables[0] if len(tables) == 1 else pd.concat(tables, ignore_index=True)
+    pertes_conversion = {colonne: pd.Index(np.concatenate(parties)) for colonne, parties in pertes_conversion.items()}
+    rapport = {
+        'fichier': source,
+        'fichiers': [rapport['fichier'] for rapport in rapports],
+        'version': version,
+        'encodage': ', '.join(sorted({rapport['encodage'] for rapport in rapports})),
+        'moteur': ', '.join(sorted({rapport['moteur'] for rapport in rapports})),
+        'duree_lecture_s': sum(rapport['duree_lecture_s'] for rapport in rapports),
+        'duree_totale_s': sum(rapport['duree_totale_s'] for rapport in rapports),
+        'lignes_lues': sum(rapport['lignes_lues'] for rapport in rapports),
+        'lignes_retenues': len(df),
+        'pertes_conversion': pertes_conversion,
+    }
+
+    # Contrôles de qualité : les lignes invalides partent en quarantaine, le rapport suit la version
+    df, rapport['qualite'] = valider(df, pertes_conversion)
+    # Type de service des budgets annexes, classé une fois par libellé distinct
+    df['Type_service'] = classer_services(df)
+    return df, rapport
+
+
+# ============================================
+# TABLES DÉRIVÉES (CACHE COMMUN)
+# ============================================
+
+@cache.en_cache('tables')
+def load_consolide(version, _df_national):
+    """Budgets principal et annexes additionnés par (exercice, commune, agrégat), une fois par version"""
+    return consolider_budgets(_df_national)
+
+@cache.en_cache('tables')
+def load_ratios(version, _df_national, budgets='principal'):
+    """Table des ratios (commune, exercice) avec percentiles de strate nationaux, budgets principaux ou consolidés"""
+    return table_ratios(_df_national, TYPES_BUDGET_ANALYSE[budgets])
+
+@cache.en_cache('index')
+def load_index_groupes(version, departement, _ratios, budgets='principal'):
+    """Agrégats par (exercice, zone) et (exercice, EPCI) du département (ou national), précalculés une fois"""
+    return index_groupes(_ratios)
+
+@cache.en_cache('index')
+def load_index_departements(version, _df_national, budgets='principal'):
+    """Positions des lignes de chaque département dans le fichier national (ou sa vue consolidée)"""
+    return index_departements(_df_national)
+
+
+# ============================================
+# SURVEILLANCE ET BASCULE
+# ============================================
+
+class SurveillantDonnees:
+    """Version courante des données, remplacée en arrière-plan quand la source change
+
+    prechauffer : fonction (df, rapport) appelée sur la nouvelle version avant la bascule,
+    pour calculer les tables dérivées pendant que l'ancienne version reste servie
+    """
+
+    def __init__(self, source, prechauffer=None, intervalle_s=INTERVALLE_SURVEILLANCE_S):
+        self.source = source
+        self.prechauffer = prechauffer
+        self.intervalle_s = intervalle_s
+        self.courant = None          # (df, rapport), remplacé en une affectation
+        self.erreur = None           # dernière erreur de rechargement (l'ancienne version reste servie)
+        self.rechargement_en_cours = False
+        self.nb_rechargements = 0
+        self._arret = threading.Event()
+        self._fil = None
+
+    @property
+    def version(self):
+        return self.courant[1]['version'] if self.courant is not None else None
+
+    def recharger(self):
+        """Construit la nouvelle version complète puis la substitue à l'ancienne"""
+        self.rechargement_en_cours = True
+        try:
+            df, rapport = charger_source(self.source)
+            if self.prechauffer is not None and self.courant is not None:
+                self.prechauffer(df, rapport)
+            self.courant = (df, rapport)
+            self.erreur = None
+            self.nb_rechargements += 1
+        except Exception as e:  # toute erreur (lecture, validation, préchauffage) : l'ancienne version reste servie
+            self.erreur = str(e)
+        finally:
+            self.rechargement_en_cours = False
+
+    def _surveiller(self):
+        candidate, nb_stables = None, 0
+        while not self._arret.wait(self.intervalle_s):
+            try:
+                version = version_source(self.source)
+            except Exception as e:  # le fil de surveillance ne s'arrête jamais
+                self.erreur = str(e)
+                continue
+            if version == self.version:
+                candidate, nb_stables = None, 0
+                continue
+            nb_stables = nb_stables + 1 if version == candidate else 1
+            candidate = version
+            if nb_stables >= NB_CONTROLES_STABLES:
+                self.recharger()
+                candidate, nb_stables = None, 0
+
+    def demarrer(self):
+        """Premier chargement (bloquant) puis surveillance dans un fil d'exécution dédié"""
+        self.recharger()
+        self._fil = threading.Thread(target=self._surveiller, name='surveillance-ofgl', daemon=True)
+        self._fil.start()
+        return self
+
+    def arreter(self):
+        self._arret.set()
+        if self._fil is not None:
+            self._fil.join()
@@ -0,0 +1,218 @@
+# rendu.py - Mise en forme des tableaux : styles vectorisés et mis en cache
+import hashlib
+import re
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+import streamlit.components.v1 as components
+
+from memoire import cache
+
+# ============================================
+# PARAMÈTRES DE RENDU
+# ============================================
+
+# Classes de couleur d'un écart selon le sens de l'indicateur
+STYLES_CLASSES = {
+    'favorable': 'background-color: #D1FAE5',
+    'defavorable': 'background-color: #FEE2E2',
+    'neutre': '',
+}
+
+# Au-delà, les nombres sont formatés par le navigateur (st.column_config) et non plus cellule par cellule en Python
+SEUIL_CELLULES_STYLER = 5000
+
+# Au-delà, les couleurs sont désactivées : Streamlit parcourt en Python chaque cellule d'un tableau stylé
+SEUIL_CELLULES_COULEURS = 50_000
+
+
+# ============================================
+# CLASSES DE COULEUR VECTORISÉES
+# ============================================
+
+def classes_ecart(ecarts, sens):
+    """Classe favorable/défavorable/neutre de chaque écart selon le sens de l'indicateur"""
+    signe = np.sign(np.asarray(ecarts, dtype=np.float64) * np.asarray(sens, dtype=np.float64))
+    return np.select([signe > 0, signe < 0], ['favorable', 'defavorable'], default='neutre')
+
+
+def couleurs_degrade(valeurs, cmap='RdYlGn'):
+    """Couleurs de fond d'un dégradé calculées en une fois pour toute une colonne"""
+    import matplotlib
+
+    valeurs = np.asarray(valeurs, dtype=np.float64)
+    finies = np.isfinite(valeurs)
+    styles = np.full(len(valeurs), '', dtype=object)
+    if not finies.any():
+        return styles
+    minimum, maximum = valeurs[finies].min(), valeurs[finies].max()
+    normees = (valeurs[finies] - minimum) / (maximum - minimum) if maximum > minimum else np.full(finies.sum(), 0.5)
+    rgb = (matplotlib.colormaps[cmap](normees)[:, :3] * 255).round().astype(int)
+    # Texte blanc sur les fonds sombres
+    luminance = (0.299 * rgb[:, 0] + 0.587 * rgb[:, 1] + 0.114 * rgb[:, 2]) / 255
+    styles[finies] = [
+        f"background-color: #{r:02x}{g:02x}{b:02x}; color: {'#F9FAFB' if lum < 0.5 else '#111827'}"
+        for (r, g, b), lum in zip(rgb, luminance)
+    ]
+    return styles
+
+
+# ============================================
+# CACHE DES STYLES
+# ============================================
+
+def empreinte(df, *parametres):
+    """Empreinte des données (valeurs et index) et des paramètres de rendu"""
+    h = hashlib.sha1()
+    try:
+        valeurs = pd.util.hash_pandas_object(df, index=True)
+    except TypeError:  # cellules non hachables (listes des mini-graphiques)
+        valeurs = pd.util.hash_pandas_object(df.astype(str), index=True)
+    h.update(valeurs.to_numpy().tobytes())
+    h.update(repr(list(df.columns)).encode())
+    h.update(repr(parametres).encode())
+    return h.hexdigest()
+
+
+def feuille_styles(df, couleurs=None, degrades=None):
+    """Feuille CSS (même forme que df) mise en cache par empreinte des entrées"""
+    def calculer():
+        css = pd.DataFrame('', index=df.index, columns=df.columns)
+        for colonne, (colonne_sens, colonne_ecart) in (couleurs or {}).items():
+            classes = classes_ecart(df[colonne_ecart], df[colonne_sens])
+            css[colonne] = pd.Series(classes, index=df.index).map(STYLES_CLASSES)
+        for colonne, cmap in (degrades or {}).items():
+            css[colonne] = couleurs_degrade(df[colonne], cmap)
+        return css
+
+    cle = empreinte(df, sorted((couleurs or {}).items()), sorted((degrades or {}).items()))
+    return cache.obtenir('styles', cle, calculer)
+
+
+# ============================================
+# CACHE DES FIGURES PLOTLY ET DES CARTES
+# ============================================
+
+def figure_en_cache(nom, donnees, parametres, construire):
+    """Spécification (dict) d'une figure, reconstruite seulement si ses données ou paramètres changent
+
+    donnees : DataFrame ou liste de DataFrames lus par la construction
+    parametres : autres valeurs utilisées (titres, benchmarks, seuils...), comparées par repr
+    construire : fonction sans argument renvoyant la figure Plotly
+    """
+    tables = donnees if isinstance(donnees, (list, tuple)) else [donnees]
+    cle = (nom, tuple(empreinte(table) for table in tables), repr(parametres))
+    return cache.obtenir('figures', cle, lambda: construire().to_dict())
+
+
+def afficher_figure(nom, donnees, parametres, construire, **options):
+    """Affiche une figure Plotly à partir de sa spécification en cache"""
+    options.setdefault('use_container_width', True)
+    st.plotly_chart(figure_en_cache(nom, donnees, parametres, construire), **options)
+
+
+def afficher_carte(nom, donnees, parametres, construire, width=1000, height=600):
+    """Affiche une carte folium à partir de son HTML en cache (marqueurs construits une seule fois)"""
+    import folium
+
+    def rendre():
+        return folium.Figure().add_child(construire()).render()
+
+    cle = (nom, empreinte(donnees), repr(parametres))
+    components.html(cache.obtenir('cartes', cle, rendre), height=height + 10, width=width)
+
+
+# ============================================
+# AFFICHAGE
+# ============================================
+
+def _format_navigateur(format_python):
+    """Convertit un format Python ('{:+,.1f} €') en format printf pour st.column_config"""
+    correspondance = re.fullmatch(r"(.*)\{:(\+?),?\.(\d+)f\}(.*)", format_python)
+    if correspondance is None:
+        return None
+    prefixe, signe, decimales, suffixe = correspondance.groups()
+    return f"{prefixe.replace('%', '%%')}%{signe}.{decimales}f{suffixe.replace('%', '%%')}"
+
+
+def afficher_tableau(df, formats=None, couleurs=None, degrades=None, masquer=None, **options):
+    """Affiche un tableau numérique : couleurs précalculées (cache) et formatage navigateur si volumineux
+
+    Jusqu'à SEUIL_CELLULES_STYLER cellules, les nombres sont formatés par le Styler ; au-delà, par le
+    navigateur, et les couleurs sont conservées jusqu'à SEUIL_CELLULES_COULEURS (une note le signale ensuite).
+
+    couleurs : {colonne colorée: (colonne du sens, colonne de l'écart)}
+    degrades : {colonne: palette matplotlib}
+    masquer : colonnes de métadonnées (ex. sens) utilisées pour le calcul mais non affichées
+    """
+    formats = formats or {}
+    masquer = [colonne for colonne in (masquer or []) if colonne in df.columns]
+    options.setdefault('use_container_width', True)
+
+    affiche = df.drop(columns=masquer)
+    colore = bool(couleurs or degrades)
+    if affiche.size <= SEUIL_CELLULES_STYLER:
+        styler = affiche.style.format({colonne: fmt for colonne, fmt in formats.items() if colonne in affiche.columns},
+                                      na_rep='-')
+        if colore:
+            css = feuille_styles(df, couleurs, degrades).drop(columns=masquer)
+            styler = styler.apply(lambda _: css, axis=None)
+        st.dataframe(styler, **options)
+        return
+
+    # Valeurs numériques et format appliqué par le navigateur (prioritaire sur l'affichage du Styler)
+    config = {colonne: st.column_config.NumberColumn(format=_format_navigateur(fmt))
+              for colonne, fmt in formats.items()
+              if colonne in affiche.columns and _format_navigateur(fmt) is not None}
+    config.update(options.pop('column_config', None) or {})
+    if colore and affiche.size <= SEUIL_CELLULES_COULEURS:
+        # Seule la feuille CSS précalculée est appliquée, sans fonction de format par cellule
+        css = feuille_styles(df, couleurs, degrades).drop(columns=masquer)
+        st.dataframe(affiche.style.apply(lambda _: css, axis=None), column_config=config, **options)
+        return
+    st.dataframe(affiche, column_config=config, **options)
+    if colore:
+        st.caption(f"ℹ️ Couleurs désactivées : {affiche.size:,} cellules, au-delà de la limite de mise en forme "
+                   f"({SEUIL_CELLULES_COULEURS:,}). Filtrez la sélection pour les afficher.")
+
+
+# ============================================
+# EXPLORATEUR PAGINÉ
+# ============================================
+
+TAILLES_PAGE = [25, 50, 100, 250]
+
+
+def _masque_recherche(colonne, recherche):
+    """Lignes dont la valeur contient le texte cherché, testé une fois par valeur distincte"""
+    if isinstance(colonne.dtype, pd.CategoricalDtype):
+        codes, valeurs = colonne.cat.codes.to_numpy(), colonne.cat.categories
+    else:
+        codes, valeurs = pd.factorize(colonne)
+    trouvees = np.asarray(pd.Index(valeurs).astype(str).str.contains(recherche, case=False, regex=False), dtype=bool)
+    # Code -1 : valeur manquante, jamais trouvée
+    return np.append(trouvees, False)[codes]
+
+
+def positions_explorateur(df, recherche='', colonnes_recherche=(), tri=None, croissant=True):
+    """Positions des lignes retenues par la recherche, dans l'ordre de tri demandé"""
+    if recherche:
+        masque = np.zeros(len(df), dtype=bool)
+        for colonne in colonnes_recherche:
+            masque |= _masque_recherche(df[colonne], recherche)
+        positions = np.flatnonzero(masque)
+    else:
+        positions = np.arange(len(df))
+
+    if tri is not None and len(positions):
+        valeurs = df[tri].iloc[positions].reset_index(drop=True)
+        ordre = valeurs.sort_values(ascending=croissant, kind='stable', na_position='last').index.to_numpy()
+        positions = positions[ordre]
+    return positions
+
+
+def page_explorateur(df, positions, colonnes, page, taille_page):
+    """Seules les lignes de la page demandée sont extraites, sur les colonnes retenues"""
+    debut = (page - 1) * taille_page
+    return df.take(positions[debut:debut + taille_page])[colonnes]
@@ -0,0 +1,309 @@
+# statique.py - Pré-rendu HTML statique du dashboard par (exercice, commune) et par département
+import argparse
+import html
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import folium
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.offline import get_plotlyjs
+
+from chargement import FICHIER_DONNEES, ErreurChargement, charger_centroides, codes_insee
+from indicateurs import (BENCHMARKS_DEFAUT, INDICATEURS, SEUILS_ALERTES_DEFAUT, alertes_dette, alertes_epargne,
+                         comparaison_benchmarks, kpi_principaux, table_ratios)
+from rechargement import charger_source
+from rendu import empreinte
+
+# ============================================
+# PARAMÈTRES DU RENDU STATIQUE
+# ============================================
+
+REPERTOIRE_SORTIE = 'site_statique'
+FICHIER_MANIFESTE = '_pages.json'
+FICHIER_PLOTLY = 'plotly.min.js'
+DEPARTEMENT_DEFAUT = '974'
+
+# À incrémenter quand le gabarit change : toutes les pages sont alors régénérées
+VERSION_GABARIT = 1
+
+# Colonnes de la table des ratios utilisées par une page (carte et alertes)
+COLONNES_RATIOS_PAGE = ['Exercice', 'Code_Commune', 'Commune', 'epargne_hab', 'capacite_desendettement',
+                        'annuite_recettes']
+
+# Pages envoyées d'un bloc à chaque processus de travail
+TAILLE_LOT = 8
+
+STYLE_PAGE = """
+body { font-family: sans-serif; margin: 2rem auto; max-width: 1100px; color: #111827; }
+h1 { color: #1E3A8A; text-align: center; }
+.sous-titre { text-align: center; color: #6B7280; }
+.cartes { display: grid; grid-template-columns: repeat(4, 1fr); gap: 1rem; margin: 1.5rem 0; }
+.carte { background: #F3F4F6; border-left: 5px solid #3B82F6; border-radius: 8px; padding: 1rem; }
+.carte .valeur { font-size: 1.5rem; font-weight: bold; }
+.alerte { border-radius: 4px; margin: 6px 0; padding: 8px 12px; }
+.danger { background: #FEE2E2; border-left: 5px solid #DC2626; }
+.warning { background: #FEF3C7; border-left: 5px solid #F59E0B; }
+.positive { background: #D1FAE5; border-left: 5px solid #10B981; }
+.pied { color: #6B7280; font-size: 0.9rem; text-align: center; margin-top: 2rem; }
+"""
+
+GABARIT_PAGE = """<!DOCTYPE html>
+<html lang="fr">
+<head>
+<meta charset="utf-8">
+<title>{titre} - {exercice}</title>
+<script src="{plotly}"></script>
+<style>{style}</style>
+</head>
+<body>
+<h1>📊 {titre}</h1>
+<p class="sous-titre">Exercice {exercice} - Analyse budgétaire, données OFGL</p>
+<div class="cartes">{cartes}</div>
+<h2>🗺️ Carte</h2>
+{carte}
+<h2>📊 Benchmarks</h2>
+{benchmarks}
+<h2>⚠️ Alertes</h2>
+{alertes}
+<p class="pied"><a href="index.html">Toutes les pages</a> | Généré le {date}</p>
+</body>
+</html>
+"""
+
+
+# ============================================
+# COMPOSANTS D'UNE PAGE
+# ============================================
+
+def _cartes_kpi(kpi):
+    cartes = [
+        ("💰 Épargne brute totale", f"{kpi['epargne_brute_totale_meur']:,.1f} M€"),
+        ("🏘️ Communes", f"{kpi['nb_communes']:,}"),
+        ("👥 Population", f"{kpi['population_totale']:,.0f}"),
+        ("📈 Recettes totales", f"{kpi['recettes_totales_meur']:,.1f} M€"),
+    ]
+    return ''.join(f'<div class="carte"><div>{libelle}</div><div class="valeur">{valeur}</div></div>'
+                   for libelle, valeur in cartes)
+
+
+def _couleur_epargne(epargne):
+    """Mêmes seuils que la carte du dashboard"""
+    if epargne != epargne:  # NaN
+        return 'gray'
+    if epargne < 0:
+        return 'red'
+    if epargne < 100:
+        return 'orange'
+    if epargne < 300:
+        return 'lightgreen'
+    return 'green'
+
+
+def _carte(ratios, centroides):
+    """Carte folium des communes de la page, intégrée comme document autonome (iframe srcdoc)"""
+    placees = ratios.merge(centroides, left_on=codes_insee(ratios['Code_Commune']).to_numpy(),
+                           right_index=True, how='inner')
+    if placees.empty:
+        return "<p>Aucune commune de la page dans la table des centroïdes.</p>"
+    carte = folium.Map(location=[placees['Latitude'].mean(), placees['Longitude'].mean()], zoom_start=10)
+    for ligne in placees.itertuples(index=False):
+        folium.Marker(
+            location=[ligne.Latitude, ligne.Longitude],
+            tooltip=ligne.Commune,
+            popup=f"{ligne.Commune} : {ligne.epargne_hab:,.0f} €/hab d'épargne brute",
+            icon=folium.Icon(color=_couleur_epargne(ligne.epargne_hab), icon='info-sign'),
+        ).add_to(carte)
+    if len(placees) > 1:
+        carte.fit_bounds([[placees['Latitude'].min(), placees['Longitude'].min()],
+                          [placees['Latitude'].max(), placees['Longitude'].max()]])
+    return (f'<iframe srcdoc="{html.escape(carte.get_root().render())}" '
+            f'style="width: 100%; height: 500px; border: none;"></iframe>')
+
+
+def _benchmarks(lignes, titre):
+    comparaison = comparaison_benchmarks(lignes, BENCHMARKS_DEFAUT)
+    if comparaison.empty:
+        return "<p>Données insuffisantes pour la comparaison.</p>"
+    libelles = [f"{INDICATEURS[nom]['libelle']} ({INDICATEURS[nom]['unite']})" for nom in comparaison.index]
+    fig = go.Figure([
+        go.Bar(name=titre, x=libelles, y=comparaison['valeur_locale'], marker_color='#3B82F6'),
+        go.Bar(name='Benchmark National', x=libelles, y=comparaison['benchmark'], marker_color='#10B981'),
+    ])
+    fig.update_layout(barmode='group', height=450, legend=dict(orientation='h', y=1.1))
+    return fig.to_html(full_html=False, include_plotlyjs=False)
+
+
+def _alertes(lignes, ratios):
+    alertes = alertes_epargne(lignes, SEUILS_ALERTES_DEFAUT) + alertes_dette(ratios, SEUILS_ALERTES_DEFAUT)
+    if not alertes:
+        return '<div class="alerte positive">Aucune alerte aux seuils par défaut.</div>'
+    return ''.join(f'<div class="alerte {alerte["type"]}"><strong>{html.escape(str(alerte["commune"]))}</strong> - '
+                   f'{html.escape(alerte["message"])}</div>' for alerte in alertes)
+
+
+def rendre_page(tache):
+    """Écrit la page HTML d'une tâche ; exécuté dans un processus de travail"""
+    debut = time.perf_counter()
+    lignes, ratios = tache['lignes'], tache['ratios']
+    contenu = GABARIT_PAGE.format(
+        titre=html.escape(tache['titre']),
+        exercice=tache['exercice'],
+        plotly=FICHIER_PLOTLY,
+        style=STYLE_PAGE,
+        cartes=_cartes_kpi(kpi_principaux(lignes)),
+        carte=_carte(ratios, tache['centroides']),
+        benchmarks=_benchmarks(lignes, tache['titre']),
+        alertes=_alertes(lignes, ratios),
+        date=datetime.now().strftime('%d/%m/%Y %H:%M'),
+    )
+    temporaire = os.path.join(tache['sortie'], tache['nom'] + '.tmp')
+    with open(temporaire, 'w', encoding='utf-8') as f:
+        f.write(contenu)
+    os.replace(temporaire, os.path.join(tache['sortie'], tache['nom']))
+    return tache['nom'], time.perf_counter() - debut
+
+
+# ============================================
+# CONSTRUCTION DU SITE
+# ============================================
+
+def taches_pages(df, ratios, centroides, departement, sortie):
+    """Une tâche par (exercice, commune) et par (exercice, département), avec l'empreinte de ses données"""
+    if departement is not None:
+        df = df[df['Code_Departement'].astype(str) == departement]
+        ratios = ratios[ratios['Code_Departement'].astype(str) == departement]
+    # Seules les colonnes affichées entrent dans l'empreinte (les percentiles nationaux bougent à chaque livraison)
+    ratios = ratios[COLONNES_RATIOS_PAGE]
+    parametres = (VERSION_GABARIT, sorted(BENCHMARKS_DEFAUT.items()), sorted(SEUILS_ALERTES_DEFAUT.items()))
+    titre_perimetre = (str(df['Nom_Departement'].iat[0]) if departement is not None and 'Nom_Departement' in df.columns
+                       else "France entière")
+
+    # Positions des lignes par page, obtenues en un regroupement
+    index_lignes = df.groupby(['Exercice', 'Code_Commune'], sort=True).indices
+    index_ratios = ratios.groupby(['Exercice', 'Code_Commune'], sort=True).indices
+    index_exercices = df.groupby('Exercice', sort=True).indices
+    ratios_exercices = ratios.groupby('Exercice', sort=True).indices
+
+    taches = []
+    for exercice, positions in index_exercices.items():
+        ratios_exercice = ratios.iloc[ratios_exercices.get(exercice, [])]
+        taches.append({
+            'nom': f"perimetre-{departement or 'france'}-{exercice}.html",
+            'titre': f"Communes - {titre_perimetre}",
+            'exercice': exercice,
+            'lignes': df.iloc[positions],
+            'ratios': ratios_exercice,
+        })
+    for (exercice, code), positions in index_lignes.items():
+        lignes = df.iloc[positions]
+        taches.append({
+            'nom': f"commune-{code}-{exercice}.html",
+            'titre': str(lignes['Commune'].iat[0]),
+            'exercice': exercice,
+            'lignes': lignes,
+            'ratios': ratios.iloc[index_ratios.get((exercice, code), [])],
+        })
+
+    for tache in taches:
+        tache['sortie'] = sortie
+        # Seuls les centroïdes des communes de la page sont envoyés au processus de travail
+        codes = centroides.index.intersection(codes_insee(tache['ratios']['Code_Commune']).dropna().unique())
+        tache['centroides'] = centroides.loc[codes]
+        # Index remis à zéro : une ligne supprimée ailleurs dans le fichier ne change pas la page
+        tache['lignes'] = tache['lignes'].reset_index(drop=True)
+        tache['ratios'] = tache['ratios'].reset_index(drop=True)
+        tache['empreinte'] = empreinte(tache['lignes'], empreinte(tache['ratios']), empreinte(tache['centroides']),
+                                       parametres)
+    return taches
+
+
+def _index_html(pages, sortie):
+    """Sommaire des pages, regroupées par exercice"""
+    par_exercice = {}
+    for tache in pages:
+        par_exercice.setdefault(tache['exercice'], []).append(tache)
+    sections = []
+    for exercice in sorted(par_exercice, reverse=True):
+        liens = ''.join(f'<li><a href="{tache["nom"]}">{html.escape(tache["titre"])}</a></li>'
+                        for tache in par_exercice[exercice])
+        sections.append(f"<h2>Exercice {exercice}</h2><ul>{liens}</ul>")
+    with open(os.path.join(sortie, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(f'<!DOCTYPE html><html lang="fr"><head><meta charset="utf-8"><title>Dashboard Financier Communal</title>'
+                f'<style>{STYLE_PAGE}</style></head><body><h1>📊 Dashboard Financier Communal</h1>'
+                f'{"".join(sections)}</body></html>')
+
+
+def construire_site(source=FICHIER_DONNEES, sortie=REPERTOIRE_SORTIE, departement=DEPARTEMENT_DEFAUT,
+                    nb_processus=None, tout_reconstruire=False):
+    """Rend en parallèle les pages dont les données ont changé depuis la dernière construction"""
+    debut = time.perf_counter()
+    df, rapport = charger_source(source)
+    ratios = table_ratios(df)
+    try:
+        centroides = charger_centroides()
+    except ErreurChargement:
+        centroides = pd.DataFrame(columns=['Latitude', 'Longitude'])
+    os.makedirs(sortie, exist_ok=True)
+
+    chemin_manifeste = os.path.join(sortie, FICHIER_MANIFESTE)
+    manifeste = {}
+    if os.path.isfile(chemin_manifeste) and not tout_reconstruire:
+        with open(chemin_manifeste, encoding='utf-8') as f:
+            manifeste = json.load(f)
+
+    taches = taches_pages(df, ratios, centroides, departement, sortie)
+    a_rendre = [tache for tache in taches
+                if manifeste.get(tache['nom']) != tache['empreinte']
+                or not os.path.isfile(os.path.join(sortie, tache['nom']))]
+
+    durees = []
+    if a_rendre:
+        if not os.path.isfile(os.path.join(sortie, FICHIER_PLOTLY)):
+            with open(os.path.join(sortie, FICHIER_PLOTLY), 'w', encoding='utf-8') as f:
+                f.write(get_plotlyjs())
+        nb_processus = min(nb_processus or os.cpu_count() or 1, len(a_rendre))
+        with ProcessPoolExecutor(max_workers=nb_processus) as pool:
+            durees = [duree for _, duree in pool.map(rendre_page, a_rendre, chunksize=TAILLE_LOT)]
+
+    # Pages disparues des données : supprimées
+    noms = {tache['nom'] for tache in taches}
+    obsoletes = [nom for nom in manifeste if nom not in noms]
+    for nom in obsoletes:
+        if os.path.isfile(os.path.join(sortie, nom)):
+            os.remove(os.path.join(sortie, nom))
+
+    _index_html(taches, sortie)
+    temporaire = chemin_manifeste + '.tmp'
+    with open(temporaire, 'w', encoding='utf-8') as f:
+        json.dump({tache['nom']: tache['empreinte'] for tache in taches}, f, indent=0)
+    os.replace(temporaire, chemin_manifeste)
+
+    return {
+        'version': rapport['version'],
+        'pages': len(taches),
+        'rendues': len(a_rendre),
+        'supprimees': len(obsoletes),
+        'nb_processus': nb_processus if a_rendre else 0,
+        'duree_rendu_s': sum(durees),
+        'duree_s': time.perf_counter() - debut,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pré-rendu HTML statique du dashboard par commune et par exercice")
+    parser.add_argument('--source', default=FICHIER_DONNEES, help="fichier OFGL ou répertoire de fichiers CSV")
+    parser.add_argument('--sortie', default=REPERTOIRE_SORTIE)
+    parser.add_argument('--departement', default=DEPARTEMENT_DEFAUT, help="code département ou 'tous'")
+    parser.add_argument('--processus', type=int, help="processus de travail (par défaut : un par cœur)")
+    parser.add_argument('--tout', action='store_true', help="régénère toutes les pages")
+    args = parser.parse_args()
+
+    resultat = construire_site(args.source, args.sortie, None if args.departement == 'tous' else args.departement,
+                               args.processus, args.tout)
+    print(f"{resultat['rendues']:,} pages rendues sur {resultat['pages']:,} "
+          f"({resultat['pages'] - resultat['rendues']:,} inchangées, {resultat['supprimees']:,} supprimées) "
+          f"en {resultat['duree_s']:.1f} s sur {resultat['nb_processus']} processus, version {resultat['version']}")
@@ -0,0 +1,40 @@
+# conftest.py - Données OFGL synthétiques partagées par les tests (générées une fois par session)
+import os
+import sys
+import tempfile
+
+import pytest
+
+REPERTOIRE_DEPOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPERTOIRE_DEPOT)
+
+# Historique des alertes hors du dépôt, fixé avant toute importation de historique.py
+os.environ.setdefault('OFGL_HISTORIQUE', os.path.join(tempfile.mkdtemp(prefix='ofgl-tests-'), 'historique.sqlite'))
+
+from banc_charge import generer_donnees  # noqa: E402
+from chargement import charger_fichier  # noqa: E402
+from indicateurs import table_ratios  # noqa: E402
+
+# Communes métropolitaines fictives ajoutées aux 24 communes de La Réunion (5 départements)
+NB_COMMUNES_TESTS = 60
+
+
+@pytest.fixture(scope='session')
+def chemin_ofgl(tmp_path_factory):
+    """Fichier OFGL synthétique : plusieurs départements, exercices et budgets annexes"""
+    chemin = tmp_path_factory.mktemp('ofgl') / 'ofgl-base-communes.csv'
+    generer_donnees(str(chemin), nb_communes_nationales=NB_COMMUNES_TESTS)
+    return str(chemin)
+
+
+@pytest.fixture(scope='session')
+def donnees(chemin_ofgl):
+    """Lignes normalisées du fichier synthétique (tous départements)"""
+    df, _ = charger_fichier(chemin_ofgl, departement=None)
+    return df
+
+
+@pytest.fixture(scope='session')
+def ratios(donnees):
+    """Table des ratios des budgets principaux"""
+    return table_ratios(donnees)
@@ -0,0 +1,96 @@
+# test_api.py - API JSON : mêmes chiffres que les chargeurs du dashboard, ETag et 304, erreurs 400 et 503
+import http.client
+import json
+import os
+import shutil
+import threading
+
+import pytest
+
+from api import creer_serveur
+from indicateurs import consolider_budgets, kpi_principaux
+from rechargement import TYPES_BUDGET_ANALYSE, charger_source
+
+
+@pytest.fixture
+def source(chemin_ofgl, tmp_path):
+    """Copie modifiable du fichier synthétique"""
+    chemin = str(tmp_path / 'ofgl.csv')
+    shutil.copy(chemin_ofgl, chemin)
+    return chemin
+
+
+@pytest.fixture
+def serveur(source):
+    serveur = creer_serveur(source, port=0, nb_threads=2)
+    fil = threading.Thread(target=serveur.serve_forever, daemon=True)
+    fil.start()
+    yield serveur
+    serveur.shutdown()
+    serveur.server_close()
+
+
+def requete(serveur, chemin, entetes=None):
+    """(statut, en-têtes, corps JSON ou None) d'une requête GET"""
+    connexion = http.client.HTTPConnection(*serveur.server_address, timeout=30)
+    try:
+        connexion.request('GET', chemin, headers=entetes or {})
+        reponse = connexion.getresponse()
+        corps = reponse.read()
+        return reponse.status, dict(reponse.getheaders()), json.loads(corps) if corps else None
+    finally:
+        connexion.close()
+
+
+def test_memes_chiffres_que_le_dashboard(serveur, source):
+    df, rapport = charger_source(source)
+    exercice = int(df['Exercice'].max())
+    statut, _, version = requete(serveur, '/api/version')
+    assert statut == 200 and version['version'] == rapport['version'] and version['lignes'] == len(df)
+
+    for budgets in ('principal', 'consolide'):
+        statut, _, kpi = requete(serveur, f"/api/kpi?departement=13&budgets={budgets}")
+        lignes = df if budgets == 'principal' else consolider_budgets(df)
+        lignes = lignes[(lignes['Exercice'] == exercice) & (lignes['Code_Departement'].astype(str) == '13')]
+        attendus = kpi_principaux(lignes, TYPES_BUDGET_ANALYSE[budgets])
+        assert statut == 200 and kpi['budgets'] == budgets
+        for nom, valeur in attendus.items():
+            assert kpi[nom] == pytest.approx(valeur), (budgets, nom)
+
+
+def test_etag_et_304(serveur, source):
+    statut, entetes, corps = requete(serveur, '/api/zones?departement=tous')
+    assert statut == 200 and corps['groupes']
+    etag = entetes['ETag']
+
+    statut, entetes, corps = requete(serveur, '/api/zones?departement=tous', {'If-None-Match': f'"autre", {etag}'})
+    assert (statut, entetes['ETag'], corps) == (304, etag, None)
+    # Autre ressource ou autres paramètres : autre ETag
+    assert requete(serveur, '/api/zones?departement=974', {'If-None-Match': etag})[0] == 200
+
+    # Nouvelle version des données : l'ancien ETag ne vaut plus
+    with open(source, 'a', encoding='utf-8') as f:
+        f.write('\n')
+    statut, entetes, _ = requete(serveur, '/api/zones?departement=tous', {'If-None-Match': etag})
+    assert statut == 200 and entetes['ETag'] != etag
+
+
+@pytest.mark.parametrize('chemin', [
+    '/api/zones?dimension=Canton',
+    '/api/kpi?exercice=deux-mille',
+    '/api/kpi?budgets=annexes',
+])
+def test_parametres_invalides(serveur, chemin):
+    statut, _, corps = requete(serveur, chemin)
+    assert statut == 400 and corps['erreur']
+
+
+def test_ressource_inconnue(serveur):
+    statut, _, corps = requete(serveur, '/api/inconnue')
+    assert statut == 404 and '/api/kpi' in corps['ressources']
+
+
+def test_source_indisponible(serveur, source):
+    os.remove(source)
+    statut, entetes, corps = requete(serveur, '/api/kpi')
+    assert statut == 503 and corps['erreur'] and 'ETag' not in entetes
@@ -0,0 +1,65 @@
+# test_chargement.py - Lecture des fichiers OFGL : détection d'encodage et équivalence des lecteurs pyarrow/pandas
+import pandas as pd
+import pytest
+
+import chargement
+from chargement import ErreurChargement, charger_fichier, detecter_encodage
+
+ENTETE = 'Nom 2024 Commune;Montant\n'
+
+
+def ecrire(tmp_path, nom, contenu):
+    """Écrit un petit fichier d'octets et renvoie son chemin"""
+    chemin = tmp_path / nom
+    chemin.write_bytes(contenu)
+    return str(chemin)
+
+
+@pytest.mark.parametrize('contenu, attendu', [
+    ((ENTETE + 'Saint-Benoît;1\n').encode('utf-8-sig'), 'utf-8-sig'),
+    ((ENTETE + 'Saint-Benoît;1\n').encode('utf-8'), 'utf-8'),
+    # é (0xE9) et € (0x80) : export Windows
+    ((ENTETE + 'Étang-Salé;1 €\n').encode('cp1252'), 'cp1252'),
+    # 0x81 n'est pas défini en cp1252 : latin-1
+    ((ENTETE + 'Étang-Salé;1\x81\n').encode('latin-1'), 'latin-1'),
+])
+def test_detection_encodage(tmp_path, contenu, attendu):
+    assert detecter_encodage(ecrire(tmp_path, 'ofgl.csv', contenu)) == attendu
+
+
+def test_detection_utf8_blocs_tronques(tmp_path):
+    """Des blocs d'échantillon coupant des caractères multi-octets restent reconnus en UTF-8"""
+    contenu = (ENTETE + 'Saint-André;1\n' * 50).encode('utf-8')
+    chemin = ecrire(tmp_path, 'ofgl.csv', contenu)
+    for taille_bloc in range(7, 40):
+        assert detecter_encodage(chemin, taille_bloc=taille_bloc, nb_blocs=6) == 'utf-8', taille_bloc
+
+
+def test_fichier_vide_ou_absent(tmp_path):
+    with pytest.raises(ErreurChargement):
+        charger_fichier(ecrire(tmp_path, 'vide.csv', b''))
+    with pytest.raises(ErreurChargement):
+        charger_fichier(str(tmp_path / 'absent.csv'))
+
+
+def test_lecteurs_equivalents(tmp_path, monkeypatch):
+    """pyarrow et pandas donnent le même tableau normalisé, cellules texte vides comprises"""
+    pytest.importorskip('pyarrow')
+    contenu = ('Code Insee 2024 Département;Nom 2024 Commune;Commune rurale;Présence QPV;Montant\n'
+               '974;Étang-Salé; oui ;;12.5\n'
+               '974;Saint-Benoît;;non;\n'
+               '974;Saint-Denis;;;7\n').encode('cp1252')
+    chemin = ecrire(tmp_path, 'ofgl.csv', contenu)
+
+    df_pyarrow, rapport_pyarrow = charger_fichier(chemin)
+    monkeypatch.setattr(chargement, 'pa_csv', None)
+    df_pandas, rapport_pandas = charger_fichier(chemin)
+
+    assert (rapport_pyarrow['moteur'], rapport_pandas['moteur']) == ('pyarrow', 'pandas')
+    assert df_pyarrow['Commune'].tolist() == ['Étang-Salé', 'Saint-Benoît', 'Saint-Denis']
+    for colonne in ('Commune_rurale', 'Presence_QPV'):
+        assert df_pyarrow[colonne].isna().tolist() == df_pandas[colonne].isna().tolist(), colonne
+        assert df_pyarrow[colonne].dropna().tolist() == df_pandas[colonne].dropna().tolist(), colonne
+    assert df_pyarrow['Commune_rurale'].isna().tolist() == [False, True, True]
+    assert df_pyarrow.loc[0, 'Commune_rurale'] == 'OUI'
+    pd.testing.assert_series_equal(df_pyarrow['Montant'], df_pandas['Montant'])
@@ -0,0 +1,118 @@
+# test_dashboard.py - Clés des caches du dashboard : changer de département ou de vue des budgets (AppTest)
+import os
+import re
+
+import pytest
+
+from conftest import REPERTOIRE_DEPOT
+from indicateurs import consolider_budgets
+
+streamlit_testing = pytest.importorskip('streamlit.testing.v1')
+
+SCRIPT_DASHBOARD = os.path.join(REPERTOIRE_DEPOT, 'Dashboard.py')
+DELAI_EXECUTION_S = 300
+
+
+@pytest.fixture(scope='module')
+def application(chemin_ofgl):
+    """Dashboard exécuté sur le fichier synthétique, trié par montant décroissant dans l'explorateur"""
+    ancienne_source = os.environ.get('OFGL_SOURCE')
+    os.environ['OFGL_SOURCE'] = chemin_ofgl
+    at = streamlit_testing.AppTest.from_file(SCRIPT_DASHBOARD, default_timeout=DELAI_EXECUTION_S)
+    at.run()
+    widget(at, 'selectbox', "Trier par").set_value('Montant').run()
+    widget(at, 'radio', "Ordre").set_value("Décroissant").run()
+    widget(at, 'radio', "Regroupement").set_value('Nom_EPCI').run()
+    yield at
+    if ancienne_source is None:
+        os.environ.pop('OFGL_SOURCE', None)
+    else:
+        os.environ['OFGL_SOURCE'] = ancienne_source
+
+
+def widget(at, type_widget, libelle):
+    """Premier widget d'un type donné portant ce libellé"""
+    return next(element for element in getattr(at, type_widget) if element.label == libelle)
+
+
+def erreurs(at):
+    return [element.value for element in at.exception] + [element.value for element in at.error]
+
+
+def lignes_explorateur(at):
+    """(lignes retenues, lignes du périmètre) affichées sous l'explorateur"""
+    legende = next(element.value for element in at.caption if 'retenues' in element.value)
+    retenues, perimetre = re.search(r"sur ([\d,]+) retenues \(([\d,]+) dans", legende).groups()
+    return int(retenues.replace(',', '')), int(perimetre.replace(',', ''))
+
+
+def communes_projetees(at):
+    legende = next(element.value for element in at.caption if 'trajectoires' in element.value)
+    return int(legende.split(' communes')[0])
+
+
+def epci_affiches(at):
+    return set(next(element.value for element in at.dataframe if 'EPCI' in element.value.columns)['EPCI'])
+
+
+def selection(lignes, departement, exercice, communes):
+    lignes = lignes[(lignes['Exercice'] == exercice) & lignes['Commune'].isin(communes)]
+    return lignes if departement is None else lignes[lignes['Code_Departement'] == departement]
+
+
+def test_vue_des_budgets_et_departement(application, donnees):
+    at = application
+    exercice = widget(at, 'selectbox', "Année d'exercice").value
+    consolide = consolider_budgets(donnees)
+    assert erreurs(at) == []
+
+    etapes = [
+        (974, False, donnees),
+        (974, True, consolide),
+        (974, False, donnees),
+        (13, False, donnees),
+        (13, True, consolide),
+        (None, True, consolide),
+        (974, True, consolide),
+    ]
+    for departement, consolides, lignes in etapes:
+        widget(at, 'selectbox', "Département").set_value(departement)
+        at.toggle[0].set_value(consolides)
+        at.run()
+        regles = next(element.value for element in at.caption if element.value.startswith('Règles appliquées'))
+        assert ('budgets consolidés' in regles) == consolides, (departement, consolides)
+        # Mêmes filtres dans les deux vues (10 premières communes), puis toutes les communes du périmètre
+        for toutes in (False, True):
+            contexte = (departement, consolides, toutes)
+            communes = widget(at, 'multiselect', "Communes")
+            if toutes:
+                communes.set_value(communes.options).run()
+            assert erreurs(at) == [], contexte
+
+            attendues = selection(lignes, departement, exercice, communes.value)
+            assert lignes_explorateur(at) == (len(attendues), len(attendues)), contexte
+            if departement is not None:
+                perimetre = lignes[(lignes['Exercice'] == exercice) & (lignes['Code_Departement'] == departement)]
+                assert communes_projetees(at) == perimetre['Code_Commune'].nunique(), contexte
+                if toutes:
+                    assert epci_affiches(at) == set(perimetre['Nom_EPCI']), contexte
+
+
+def test_departement_lu_dans_le_magasin(chemin_ofgl, donnees, tmp_path, monkeypatch):
+    magasin = pytest.importorskip('magasin')
+    repertoire = str(tmp_path / 'magasin')
+    magasin.ingerer([chemin_ofgl], repertoire, nb_processus=1)
+    monkeypatch.setenv('OFGL_SOURCE', chemin_ofgl)
+    monkeypatch.setenv('OFGL_MAGASIN', repertoire)
+    at = streamlit_testing.AppTest.from_file(SCRIPT_DASHBOARD, default_timeout=DELAI_EXECUTION_S)
+    at.run()
+    for departement in (974, 13):
+        widget(at, 'selectbox', "Département").set_value(departement).run()
+        assert erreurs(at) == [], departement
+        assert any('partition du magasin' in element.value for element in at.caption), departement
+
+        exercice = widget(at, 'selectbox', "Année d'exercice").value
+        communes = widget(at, 'multiselect', "Communes")
+        communes.set_value(communes.options).run()
+        attendues = selection(donnees, departement, exercice, communes.value)
+        assert lignes_explorateur(at) == (len(attendues), len(attendues)), departement
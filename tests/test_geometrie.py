@@ -0,0 +1,70 @@
+# test_geometrie.py - Simplification des contours : Douglas-Peucker comparé à la version récursive
+import numpy as np
+import pytest
+
+from geometrie import _douglas_peucker, simplifier_anneau, simplifier_geometrie
+
+TOLERANCES = [0.0, 0.001, 0.01, 0.05]
+
+
+def distance_a_la_droite(points, debut, fin):
+    """Distance de chaque point à la droite (debut, fin), ou à debut si les deux sont confondus"""
+    segment, relatifs = fin - debut, points - debut
+    longueur = np.hypot(*segment)
+    if longueur == 0:
+        return np.hypot(relatifs[:, 0], relatifs[:, 1])
+    return np.abs(segment[0] * relatifs[:, 1] - segment[1] * relatifs[:, 0]) / longueur
+
+
+def douglas_peucker_recursif(points, tolerance):
+    """Référence : formulation récursive de Douglas-Peucker, indices conservés"""
+    if len(points) < 3:
+        return list(range(len(points)))
+    distances = distance_a_la_droite(points[1:-1], points[0], points[-1])
+    plus_loin = int(np.argmax(distances)) + 1
+    if distances[plus_loin - 1] <= tolerance:
+        return [0, len(points) - 1]
+    gauche = douglas_peucker_recursif(points[:plus_loin + 1], tolerance)
+    droite = douglas_peucker_recursif(points[plus_loin:], tolerance)
+    return gauche[:-1] + [plus_loin + indice for indice in droite]
+
+
+@pytest.fixture
+def anneau():
+    """Contour fermé bruité de 400 sommets"""
+    rng = np.random.default_rng(0)
+    angles = np.linspace(0, 2 * np.pi, 400, endpoint=False)
+    rayons = 0.1 + 0.01 * rng.standard_normal(len(angles))
+    points = np.column_stack([55.5 + rayons * np.cos(angles), -21.1 + rayons * np.sin(angles)])
+    return np.vstack([points, points[:1]])
+
+
+@pytest.mark.parametrize('tolerance', TOLERANCES)
+def test_douglas_peucker_egale_la_recursion(anneau, tolerance):
+    for points in (anneau, anneau[:150]):
+        garder = _douglas_peucker(points, tolerance)
+        assert np.flatnonzero(garder).tolist() == douglas_peucker_recursif(points, tolerance)
+
+
+@pytest.mark.parametrize('tolerance', TOLERANCES)
+def test_douglas_peucker_extremites_et_tolerance(anneau, tolerance):
+    points = anneau[:150]
+    gardes = np.flatnonzero(_douglas_peucker(points, tolerance))
+    assert (gardes[0], gardes[-1]) == (0, len(points) - 1)
+    # Chaque sommet supprimé reste à moins de la tolérance de la corde entre les sommets gardés qui l'encadrent
+    for debut, fin in zip(gardes[:-1], gardes[1:]):
+        if fin - debut > 1:
+            distances = distance_a_la_droite(points[debut + 1:fin], points[debut], points[fin])
+            assert distances.max() <= tolerance + 1e-12
+    if tolerance > 0:
+        assert len(gardes) < len(points)
+
+
+def test_simplifier_anneau_reste_ferme(anneau):
+    simplifie = simplifier_anneau(anneau.tolist(), 0.01, 3)
+    assert simplifie[0] == simplifie[-1] and 4 <= len(simplifie) < len(anneau)
+    assert all(round(valeur, 3) == valeur for point in simplifie for valeur in point)
+    # Anneaux plus petits que la tolérance : l'extérieur est gardé arrondi, le trou disparaît
+    petit = (anneau - anneau[0]) * 0.01 + anneau[0]
+    geometrie = simplifier_geometrie({'type': 'Polygon', 'coordinates': [petit.tolist(), petit.tolist()]}, 0.05, 3)
+    assert len(geometrie['coordinates']) == 1 and len(geometrie['coordinates'][0]) > 0
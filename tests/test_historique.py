@@ -0,0 +1,97 @@
+# test_historique.py - Historique des alertes : empreintes exactes, évaluation incrémentale, retraits
+import pandas as pd
+import pytest
+
+from historique import (COLONNES_EPARGNE, COLONNES_RATIOS, chronologie, comptes_par_commune,
+                        empreintes_combinaisons, enregistrer_evaluation)
+from indicateurs import AGREGAT_EPARGNE_BRUTE, SEUILS_ALERTES_DEFAUT
+
+# Seuils qui déclenchent des alertes sur les données synthétiques
+SEUILS = {**SEUILS_ALERTES_DEFAUT, 'epargne_brute_seuil_bas': 100, 'capacite_desendettement_seuil': 8}
+
+
+@pytest.fixture
+def chemin(tmp_path):
+    return str(tmp_path / 'historique.sqlite')
+
+
+@pytest.fixture
+def desalignees(donnees, ratios):
+    """Clés différentes des deux côtés : une (exercice, commune) sans épargne, une autre sans ratios"""
+    exercice = int(ratios['Exercice'].max())
+    codes = sorted(ratios['Code_Commune'].unique())
+    sans_epargne, sans_ratios = (exercice, codes[0]), (exercice, codes[1])
+    df = donnees[~((donnees['Exercice'] == sans_epargne[0]) & (donnees['Code_Commune'] == sans_epargne[1])
+                   & (donnees['Agregat'] == AGREGAT_EPARGNE_BRUTE))]
+    ratios = ratios[~((ratios['Exercice'] == sans_ratios[0]) & (ratios['Code_Commune'] == sans_ratios[1]))]
+    return df.reset_index(drop=True), ratios.reset_index(drop=True), sans_epargne, sans_ratios
+
+
+def somme_exacte(table):
+    """Référence : somme modulo 2^64 des empreintes de lignes, en entiers Python"""
+    empreintes = pd.util.hash_pandas_object(table, index=False).to_numpy()
+    sommes = {}
+    for (exercice, code), valeur in zip(zip(table['Exercice'], table['Code_Commune']), empreintes):
+        cle = (int(exercice), str(code))
+        sommes[cle] = (sommes.get(cle, 0) + int(valeur)) % 2 ** 64
+    return sommes
+
+
+def test_empreintes_exactes_avec_cles_desalignees(desalignees):
+    df, ratios, sans_epargne, sans_ratios = desalignees
+    epargne = somme_exacte(df.loc[df['Agregat'] == AGREGAT_EPARGNE_BRUTE, COLONNES_EPARGNE])
+    dette = somme_exacte(ratios[COLONNES_RATIOS])
+    attendues = {cle: f"{(epargne.get(cle, 0) + dette.get(cle, 0)) % 2 ** 64:016x}"
+                 for cle in set(epargne) | set(dette)}
+
+    empreintes = empreintes_combinaisons(df, ratios)
+    assert dict(empreintes.items()) == attendues
+    assert (sans_epargne[0], str(sans_epargne[1])) in empreintes.index
+    assert (sans_ratios[0], str(sans_ratios[1])) in empreintes.index
+
+
+def test_evaluation_incrementale(desalignees, chemin):
+    df, ratios, sans_epargne, sans_ratios = desalignees
+    nb_combinaisons = len(empreintes_combinaisons(df, ratios))
+
+    premiere = enregistrer_evaluation(df, ratios, SEUILS, 'v1', chemin)
+    assert premiere['evaluees'] == nb_combinaisons and premiere['alertes'] > 0
+    assert enregistrer_evaluation(df, ratios, SEUILS, 'v1', chemin)['evaluees'] == 0
+
+    # Une valeur modifiée de chaque côté, sur les clés présentes d'un seul côté : seules ces deux sont réévaluées
+    df, ratios = df.copy(), ratios.copy()
+    ligne = (df['Exercice'] == sans_ratios[0]) & (df['Code_Commune'] == sans_ratios[1]) & \
+        (df['Agregat'] == AGREGAT_EPARGNE_BRUTE)
+    df.loc[ligne, 'Montant_par_habitant'] = -500.0
+    ligne = (ratios['Exercice'] == sans_epargne[0]) & (ratios['Code_Commune'] == sans_epargne[1])
+    ratios.loc[ligne, 'capacite_desendettement'] = 40.0
+    seconde = enregistrer_evaluation(df, ratios, SEUILS, 'v2', chemin)
+    assert (seconde['evaluees'], seconde['retirees']) == (2, 0)
+
+    for exercice, code in (sans_ratios, sans_epargne):
+        alertes = chronologie(code, SEUILS, chemin)
+        assert (alertes.loc[alertes['exercice'] == exercice, 'version'] == 'v2').all()
+        assert len(alertes[alertes['exercice'] == exercice]) >= 1
+
+    # Une autre configuration de seuils est évaluée entièrement, indépendamment
+    autres = {**SEUILS, 'capacite_desendettement_seuil': 12}
+    assert enregistrer_evaluation(df, ratios, autres, 'v2', chemin)['evaluees'] == nb_combinaisons
+
+
+def test_combinaisons_sorties_des_donnees_retirees(donnees, ratios, chemin):
+    enregistrer_evaluation(donnees, ratios, SEUILS, 'v1', chemin)
+    comptes = comptes_par_commune(SEUILS, chemin=chemin)
+    code = comptes['code_commune'].iloc[0]
+    nb_exercices = ratios.loc[ratios['Code_Commune'].astype(str) == code, 'Exercice'].nunique()
+
+    # La commune passe en quarantaine : ses alertes ne sont plus en vigueur
+    resultat = enregistrer_evaluation(donnees[donnees['Code_Commune'].astype(str) != code],
+                                      ratios[ratios['Code_Commune'].astype(str) != code], SEUILS, 'v2', chemin)
+    assert (resultat['evaluees'], resultat['retirees']) == (0, nb_exercices)
+    assert code not in set(comptes_par_commune(SEUILS, chemin=chemin)['code_commune'])
+    assert chronologie(code, SEUILS, chemin).empty
+
+    # Elle revient : réévaluée
+    assert enregistrer_evaluation(donnees, ratios, SEUILS, 'v3', chemin)['evaluees'] == nb_exercices
+    assert code in set(comptes_par_commune(SEUILS, chemin=chemin)['code_commune'])
+
@@ -0,0 +1,360 @@
+# test_indicateurs.py - Moteur d'indicateurs comparé aux calculs ligne à ligne qu'il remplace
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicateurs import (AGREGAT_ANNUITE, AGREGAT_DEPENSES, AGREGAT_ENCOURS, AGREGAT_EPARGNE_BRUTE, AGREGAT_FINANCEMENT,
+                         AGREGAT_RECETTES, CLES_PAIRS, INDICATEURS, QUANTILES_PAIRS, REGLES_SENSIBILITE,
+                         SERVICE_AUTRES, SERVICES_ANNEXES, SUFFIXE_PERCENTILE, TYPE_BUDGET_CONSOLIDE,
+                         TYPE_BUDGET_PRINCIPAL, agreger_groupes, balayage_seuils, classement, classer_services,
+                         comparer_aux_pairs, consolider_budgets, grille_seuils, index_classements, index_pairs,
+                         kpi_principaux, rang_commune, table_ratios)
+
+
+# ============================================
+# TABLE DES RATIOS
+# ============================================
+
+def ratios_par_boucle(df):
+    """Référence : indicateurs calculés commune par commune, comme le faisait l'onglet Benchmarks"""
+    lignes = []
+    principal = df[df['Type_budget'] == TYPE_BUDGET_PRINCIPAL]
+    for (exercice, code), commune in principal.groupby(['Exercice', 'Code_Commune']):
+        montants = commune.groupby('Agregat')['Montant'].sum()
+        population = commune['Population'].iloc[0]
+        epargne, recettes = montants[AGREGAT_EPARGNE_BRUTE], montants[AGREGAT_RECETTES]
+        encours = montants[AGREGAT_ENCOURS]
+        if epargne > 0:
+            capacite = encours / epargne
+        else:
+            capacite = np.inf if encours > 0 else (0.0 if encours == 0 else np.nan)
+        lignes.append({
+            'Exercice': exercice,
+            'Code_Commune': code,
+            'epargne_hab': epargne / population,
+            'recettes_hab': recettes / population,
+            'depenses_hab': (recettes - epargne) / population,
+            'financement_hab': montants[AGREGAT_FINANCEMENT] / population,
+            'taux_epargne': epargne / recettes * 100,
+            'ratio_depenses_recettes': (recettes - epargne) / recettes * 100,
+            'encours_hab': encours / population,
+            'annuite_recettes': montants[AGREGAT_ANNUITE] / recettes * 100,
+            'capacite_desendettement': capacite,
+        })
+    return pd.DataFrame(lignes).set_index(['Exercice', 'Code_Commune']).sort_index()
+
+
+def test_table_ratios_egale_la_boucle_par_commune(donnees, ratios):
+    reference = ratios_par_boucle(donnees)
+    calcules = ratios.set_index(['Exercice', 'Code_Commune']).sort_index()
+
+    assert calcules.index.equals(reference.index)
+    for nom in INDICATEURS:
+        np.testing.assert_allclose(calcules[nom].to_numpy(float), reference[nom].to_numpy(float), rtol=1e-10,
+                                   err_msg=nom)
+
+
+def test_depenses_deduites_des_recettes_et_de_l_epargne(donnees, ratios):
+    # L'agrégat des dépenses n'est pas lu : le retirer ne change aucun ratio
+    sans_depenses = table_ratios(donnees[donnees['Agregat'] != AGREGAT_DEPENSES])
+    pd.testing.assert_frame_equal(sans_depenses, ratios)
+
+
+def test_percentiles_de_strate(ratios):
+    for (exercice, strate), groupe in ratios.groupby(['Exercice', 'Strate_population']):
+        valeurs = groupe['epargne_hab'].to_numpy()
+        attendus = [(valeurs < valeur).sum() + ((valeurs == valeur).sum() + 1) / 2 for valeur in valeurs]
+        np.testing.assert_allclose(groupe[f"epargne_hab{SUFFIXE_PERCENTILE}"],
+                                   np.array(attendus) / len(valeurs) * 100)
+
+
+def test_capacite_desendettement_epargne_negative():
+    df = pd.DataFrame({
+        'Exercice': 2020, 'Code_Commune': [1, 1, 2, 2],
+        'Commune': ['A', 'A', 'B', 'B'], 'Population': 1000, 'Strate_population': 1,
+        'Type_budget': TYPE_BUDGET_PRINCIPAL,
+        'Agregat': [AGREGAT_EPARGNE_BRUTE, AGREGAT_ENCOURS] * 2,
+        'Montant': [-50.0, 200.0, 0.0, 0.0],
+    })
+    capacites = table_ratios(df).set_index('Code_Commune')['capacite_desendettement']
+    assert capacites[1] == np.inf
+    assert capacites[2] == 0.0
+
+
+# ============================================
+# SENSIBILITÉ DES SEUILS
+# ============================================
+
+def declenche(valeurs, seuil, declenchement):
+    """Référence : règle d'alerte appliquée valeur par valeur"""
+    valeurs = np.asarray(valeurs, dtype=np.float64)
+    return valeurs < seuil if declenchement == 'inferieur' else valeurs > seuil
+
+
+def balayage_force_brute(ratios, seuil_x, grille_x, seuil_y, grille_y):
+    """Référence : chaque couple de seuils évalué séparément"""
+    regle_x, regle_y = REGLES_SENSIBILITE[seuil_x], REGLES_SENSIBILITE[seuil_y]
+    codes = ratios['Code_Commune'].to_numpy()
+    forme = (len(grille_x), len(grille_y))
+    alertes, communes_exercices, communes = np.zeros(forme, int), np.zeros(forme, int), np.zeros(forme, int)
+    for i, valeur_x in enumerate(grille_x):
+        en_x = declenche(ratios[regle_x['indicateur']], valeur_x, regle_x['declenchement'])
+        for j, valeur_y in enumerate(grille_y):
+            en_y = declenche(ratios[regle_y['indicateur']], valeur_y, regle_y['declenchement'])
+            alertes[i, j] = en_x.sum() + en_y.sum()
+            communes_exercices[i, j] = (en_x | en_y).sum()
+            communes[i, j] = len(set(codes[en_x | en_y]))
+    return alertes, communes_exercices, communes
+
+
+@pytest.mark.parametrize('seuil_x, seuil_y', [
+    ('epargne_brute_seuil_bas', 'ratio_depenses_recettes_seuil'),
+    ('epargne_brute_seuil_bas', 'epargne_brute_seuil_haut'),
+    ('capacite_desendettement_seuil', 'annuite_recettes_seuil'),
+])
+def test_balayage_egale_la_force_brute(ratios, seuil_x, seuil_y):
+    grille_x = grille_seuils(*REGLES_SENSIBILITE[seuil_x]['grille'])
+    grille_y = grille_seuils(*REGLES_SENSIBILITE[seuil_y]['grille'])
+    resultat = balayage_seuils(ratios, seuil_x, grille_x, seuil_y, grille_y)
+
+    alertes, communes_exercices, communes = balayage_force_brute(ratios, seuil_x, grille_x, seuil_y, grille_y)
+    np.testing.assert_array_equal(resultat['alertes'], alertes)
+    np.testing.assert_array_equal(resultat['communes_exercices'], communes_exercices)
+    np.testing.assert_array_equal(resultat['communes'], communes)
+    assert resultat['nb_communes'] == ratios['Code_Commune'].nunique()
+
+
+def test_balayage_valeurs_sur_la_grille_et_manquantes():
+    # Valeurs égales aux seuils (inégalités strictes), manquantes et infinies
+    ratios = pd.DataFrame({
+        'Code_Commune': [1, 1, 2, 3, 4],
+        'epargne_hab': [-100.0, 0.0, np.nan, 50.0, -300.0],
+        'capacite_desendettement': [12.0, np.inf, 4.0, np.nan, 30.0],
+    })
+    grille_x, grille_y = grille_seuils(-300, 100, 50), grille_seuils(4, 30, 2)
+    resultat = balayage_seuils(ratios, 'epargne_brute_seuil_bas', grille_x, 'capacite_desendettement_seuil', grille_y)
+
+    alertes, communes_exercices, communes = balayage_force_brute(
+        ratios, 'epargne_brute_seuil_bas', grille_x, 'capacite_desendettement_seuil', grille_y)
+    np.testing.assert_array_equal(resultat['alertes'], alertes)
+    np.testing.assert_array_equal(resultat['communes_exercices'], communes_exercices)
+    np.testing.assert_array_equal(resultat['communes'], communes)
+
+
+# ============================================
+# BUDGETS CONSOLIDÉS
+# ============================================
+
+def test_consolider_budgets_somme_principal_et_annexes(donnees):
+    consolide = consolider_budgets(donnees)
+    cles = ['Exercice', 'Code_Commune', 'Agregat']
+
+    assert not consolide.duplicated(cles).any()
+    assert (consolide['Type_budget'] == TYPE_BUDGET_CONSOLIDE).all()
+    attendus = donnees.groupby(cles)['Montant'].agg(['sum', 'size'])
+    obtenus = consolide.set_index(cles).sort_index()
+    np.testing.assert_allclose(obtenus['Montant'], attendus['sum'].loc[obtenus.index])
+    np.testing.assert_array_equal(obtenus['Nb_budgets'], attendus['size'].loc[obtenus.index])
+    np.testing.assert_allclose(obtenus['Montant_par_habitant'], obtenus['Montant'] / obtenus['Population'])
+    # Au moins une commune a des budgets annexes : la vue consolidée diffère du budget principal
+    assert (obtenus['Nb_budgets'] > 1).any()
+
+
+def test_ratios_consolides(donnees):
+    consolide = consolider_budgets(donnees)
+    ratios_consolides = table_ratios(consolide, TYPE_BUDGET_CONSOLIDE).set_index(['Exercice', 'Code_Commune'])
+    montants = donnees.groupby(['Exercice', 'Code_Commune', 'Agregat'])['Montant'].sum().unstack('Agregat')
+    population = donnees.groupby(['Exercice', 'Code_Commune'])['Population'].first()
+    attendus = (montants[AGREGAT_EPARGNE_BRUTE] / population).loc[ratios_consolides.index]
+    np.testing.assert_allclose(ratios_consolides['epargne_hab'], attendus)
+    # Les fonctions du budget principal lisent la vue consolidée sans modification
+    assert kpi_principaux(consolide, TYPE_BUDGET_CONSOLIDE)['epargne_brute_totale_meur'] == pytest.approx(
+        montants[AGREGAT_EPARGNE_BRUTE].sum() / 1_000_000)
+
+
+def test_consolider_budgets_montant_manquant():
+    df = pd.DataFrame({
+        'Exercice': 2020, 'Code_Commune': 1, 'Commune': 'A', 'Population': 100,
+        'Type_budget': [TYPE_BUDGET_PRINCIPAL, 'Budget annexe', TYPE_BUDGET_PRINCIPAL],
+        'Agregat': [AGREGAT_EPARGNE_BRUTE, AGREGAT_EPARGNE_BRUTE, AGREGAT_ENCOURS],
+        'Montant': [1000.0, np.nan, np.nan],
+    })
+    consolide = consolider_budgets(df).set_index('Agregat')
+    # Montant manquant ignoré dans la somme ; agrégat sans aucun montant : manquant, pas zéro
+    assert consolide.loc[AGREGAT_EPARGNE_BRUTE, 'Montant'] == 1000.0
+    assert np.isnan(consolide.loc[AGREGAT_ENCOURS, 'Montant'])
+
+
+# ============================================
+# GROUPES DE PAIRS
+# ============================================
+
+def pairs_par_boucle(ratios, indicateur):
+    """Référence : quantiles des pairs et position recalculés commune par commune"""
+    lignes = []
+    for _, commune in ratios.iterrows():
+        pairs = ratios
+        for cle in CLES_PAIRS:
+            pairs = pairs[pairs[cle] == commune[cle]]
+        valeurs = pairs[indicateur].to_numpy(np.float64)
+        valeurs = valeurs[np.isfinite(valeurs)]
+        bornes = np.percentile(valeurs, [q * 100 for q in QUANTILES_PAIRS]) if len(valeurs) else \
+            np.full(len(QUANTILES_PAIRS), np.nan)
+        valeur = commune[indicateur]
+        if pd.isna(valeur) or np.isnan(bornes[2]):
+            position = '-'
+        else:
+            etiquettes = ['< p10', 'p10-p25', 'p25-p50', 'p50-p75']
+            position = next((etiquette for borne, etiquette in zip(bornes, etiquettes) if valeur < borne),
+                            'p75-p90' if valeur <= bornes[4] else '> p90')
+        lignes.append([len(pairs), *bornes, position])
+    return pd.DataFrame(lignes, index=ratios.index,
+                        columns=['nb_pairs'] + [f"pairs_p{int(q * 100)}" for q in QUANTILES_PAIRS] + ['position'])
+
+
+@pytest.mark.parametrize('indicateur', ['epargne_hab', 'capacite_desendettement'])
+def test_comparer_aux_pairs_egale_la_boucle(ratios, indicateur):
+    # Comparaison restreinte à une sélection, index calculé sur toute la table
+    selection = ratios[ratios['Code_Departement'] == ratios['Code_Departement'].iloc[0]]
+    comparaison = comparer_aux_pairs(selection, index_pairs(ratios), indicateur)
+    reference = pairs_par_boucle(ratios, indicateur).loc[selection.index]
+
+    assert comparaison.index.equals(selection.index)
+    np.testing.assert_array_equal(comparaison['nb_pairs'].fillna(0), reference['nb_pairs'])
+    for colonne in reference.columns[1:-1]:
+        np.testing.assert_allclose(comparaison[colonne].to_numpy(float), reference[colonne].to_numpy(float),
+                                   rtol=1e-10, err_msg=colonne)
+    assert comparaison['position'].tolist() == reference['position'].tolist()
+
+
+# ============================================
+# AGRÉGATS PAR ZONE ET PAR EPCI
+# ============================================
+
+def groupes_par_boucle(ratios, dimension):
+    """Référence : moyennes simples et pondérées recalculées groupe par groupe"""
+    lignes = {}
+    for cle, groupe in ratios.groupby(['Exercice', dimension], observed=True):
+        population = groupe['Population'].fillna(0).to_numpy(np.float64)
+        ligne = {'nb_communes': len(groupe), 'population': population.sum()}
+        for nom in INDICATEURS:
+            valeurs = groupe[nom].to_numpy(np.float64)
+            finies = np.isfinite(valeurs)
+            ligne[f"{nom}_moyenne"] = valeurs[finies].mean() if finies.any() else np.nan
+            poids = population[finies].sum()
+            ligne[f"{nom}_ponderee"] = (valeurs[finies] * population[finies]).sum() / poids if poids > 0 else np.nan
+        lignes[cle] = ligne
+    return pd.DataFrame.from_dict(lignes, orient='index')
+
+
+@pytest.mark.parametrize('dimension', ['Zone', 'Nom_EPCI'])
+def test_agreger_groupes_egale_la_boucle(ratios, dimension):
+    agregats = agreger_groupes(ratios, dimension)
+    reference = groupes_par_boucle(ratios, dimension)
+
+    assert sorted(agregats.index) == sorted(reference.index)
+    reference = reference.loc[list(agregats.index)]
+    np.testing.assert_array_equal(agregats['nb_communes'], reference['nb_communes'])
+    for colonne in reference.columns[1:]:
+        np.testing.assert_allclose(agregats[colonne].to_numpy(float), reference[colonne].to_numpy(float),
+                                   rtol=1e-10, err_msg=colonne)
+
+
+# ============================================
+# TYPES DE SERVICE DES BUDGETS ANNEXES
+# ============================================
+
+LIBELLES_SERVICES = {
+    'EAU POTABLE': 'Eau',
+    'Régie des eaux': 'Eau',
+    'ASSAINISSEMENT': 'Assainissement',
+    "Station d'épuration": 'Assainissement',
+    'Eaux usées': 'Assainissement',
+    'SPANC': 'SPANC',
+    'Assainissement non collectif': 'SPANC',
+    'Pompes Funèbres': 'Pompes funèbres',
+    'Cimetière communal': 'Pompes funèbres',
+    'TRANSPORT URBAIN': 'Transport',
+    'PORT DE PLAISANCE': 'Ports',
+    'ZONE ACTIVITE': "Zones d'activité",
+    'ZAC des Cocotiers': "Zones d'activité",
+    'Lotissement Les Hauts': "Zones d'activité",
+    'Ordures ménagères': 'Déchets',
+    'CINEMA': 'Culture et loisirs',
+    'Complexe sportif': SERVICE_AUTRES,
+    'Régie de la cantine': SERVICE_AUTRES,
+}
+
+
+def test_classer_services_libelles():
+    libelles = list(LIBELLES_SERVICES)
+    df = pd.DataFrame({
+        'Libelle_Budget': libelles + ['EAU POTABLE', None],
+        'Type_budget': ['Budget annexe'] * len(libelles) + [TYPE_BUDGET_PRINCIPAL, 'Budget annexe'],
+    })
+    services = classer_services(df)
+    assert list(services[:len(libelles)]) == list(LIBELLES_SERVICES.values())
+    # Budget principal et libellé absent : pas de type de service
+    assert services[len(libelles):].isna().all()
+    assert list(services.categories) == [nom for nom, _ in SERVICES_ANNEXES] + [SERVICE_AUTRES]
+
+
+def test_classer_services_egale_la_boucle(donnees):
+    attendus = []
+    for libelle, type_budget in zip(donnees['Libelle_Budget'], donnees['Type_budget']):
+        if type_budget != 'Budget annexe' or pd.isna(libelle):
+            attendus.append(None)
+            continue
+        texte = unicodedata.normalize('NFKD', libelle.lower()).encode('ascii', 'ignore').decode()
+        attendus.append(next((nom for nom, motif in SERVICES_ANNEXES if re.search(motif, texte)), SERVICE_AUTRES))
+    services = classer_services(donnees)
+    assert [None if pd.isna(service) else service for service in services] == attendus
+    assert pd.Series(attendus).notna().any()
+
+
+# ============================================
+# CLASSEMENTS
+# ============================================
+
+def classement_par_boucle(ratios, exercice, indicateur):
+    """Référence : communes triées par valeur décroissante, rang et percentile comptés commune par commune"""
+    lignes = ratios[(ratios['Exercice'] == exercice) & ratios[indicateur].notna()]
+    valeurs = lignes[indicateur].to_numpy(np.float64)
+    resultat = []
+    for position in sorted(range(len(lignes)), key=lambda i: -valeurs[i]):
+        valeur = valeurs[position]
+        inferieures, egales = (valeurs < valeur).sum(), (valeurs == valeur).sum()
+        resultat.append((lignes['Code_Commune'].iloc[position], valeur, 1 + (valeurs > valeur).sum(),
+                         (inferieures + (egales + 1) / 2) / len(valeurs) * 100))
+    return pd.DataFrame(resultat, columns=['Code_Commune', 'valeur', 'rang', 'percentile'])
+
+
+@pytest.mark.parametrize('indicateur', ['epargne_hab', 'capacite_desendettement'])
+def test_classement_egale_la_boucle(ratios, indicateur):
+    index = index_classements(ratios)
+    communes = ratios.drop_duplicates('Code_Commune').set_index('Code_Commune')['Commune']
+    for exercice in ratios['Exercice'].unique():
+        reference = classement_par_boucle(ratios, exercice, indicateur)
+        n = len(reference)
+
+        decroissant = classement(index, exercice, indicateur, n=n)
+        assert decroissant['Commune'].tolist() == communes.loc[reference['Code_Commune']].tolist()
+        np.testing.assert_array_equal(decroissant[f"{indicateur}_rang"], reference['rang'])
+        np.testing.assert_allclose(decroissant[f"{indicateur}_percentile"], reference['percentile'])
+        croissant = classement(index, exercice, indicateur, n=5, croissant=True)
+        np.testing.assert_array_equal(croissant[indicateur], reference['valeur'][::-1][:5])
+
+        # Restriction à quelques communes : même ordre, rangs nationaux conservés
+        codes = set(reference['Code_Commune'].iloc[::3])
+        restreint = classement(index, exercice, indicateur, n=n, codes_communes=codes)
+        attendu = reference[reference['Code_Commune'].isin(codes)]
+        np.testing.assert_array_equal(restreint[f"{indicateur}_rang"], attendu['rang'])
+
+        for ligne in reference.itertuples():
+            rang = rang_commune(index, exercice, ligne.Code_Commune, indicateur)
+            assert (rang[f"{indicateur}_rang"], rang[f"{indicateur}_percentile"]) == \
+                (ligne.rang, pytest.approx(ligne.percentile))
+    assert rang_commune(index, exercice, 'inconnue', indicateur) is None
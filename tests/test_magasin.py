@@ -0,0 +1,99 @@
+# test_magasin.py - Magasin Parquet partitionné : lecture d'un département comparée au fichier national
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from chargement import version_fichier
+from magasin import (_partitions, index_departements, ingerer, lire_departement, lire_manifeste, magasin_a_jour,
+                     version_magasin)
+from rechargement import charger_source
+
+pytest.importorskip('pyarrow')
+
+CLES_LIGNE = ['Exercice', 'Siret_Budget', 'Agregat']
+
+
+@pytest.fixture(scope='module')
+def magasin(chemin_ofgl, tmp_path_factory):
+    """Fichier synthétique ingéré dans un magasin temporaire"""
+    repertoire = str(tmp_path_factory.mktemp('magasin'))
+    resultat = ingerer([chemin_ofgl], repertoire, nb_processus=1)
+    assert resultat['erreurs'] == []
+    return repertoire
+
+
+@pytest.fixture(scope='module')
+def national(chemin_ofgl):
+    """Version servie par le dashboard : fichier lu, validé et enrichi"""
+    df, _ = charger_source(chemin_ofgl)
+    return df
+
+
+def test_partition_egale_les_lignes_du_fichier_national(magasin, national):
+    colonnes = [colonne for colonne in national.columns if colonne != 'Type_service']
+    for departement, positions in index_departements(national).items():
+        attendues = national.take(positions)[colonnes].sort_values(CLES_LIGNE).reset_index(drop=True)
+        lues = lire_departement(departement, magasin, national).sort_values(CLES_LIGNE).reset_index(drop=True)
+        assert list(lues.columns) == colonnes
+        assert lues.dtypes.equals(attendues.dtypes), departement
+        assert lues.equals(attendues), departement
+
+
+def test_magasin_a_jour(chemin_ofgl, magasin, tmp_path):
+    assert magasin_a_jour([chemin_ofgl], magasin)
+    assert not magasin_a_jour([], magasin)
+    assert not magasin_a_jour([chemin_ofgl], str(tmp_path / 'absent'))
+
+    # Fichier source absent du magasin, puis modifié après son ingestion : le magasin n'est plus à jour
+    copie = str(tmp_path / 'copie.csv')
+    shutil.copy(chemin_ofgl, copie)
+    assert not magasin_a_jour([chemin_ofgl, copie], magasin)
+    repertoire = str(tmp_path / 'magasin')
+    ingerer([copie], repertoire, nb_processus=1)
+    assert magasin_a_jour([copie], repertoire)
+    with open(copie, 'a', encoding='utf-8') as f:
+        f.write('\n')
+    assert not magasin_a_jour([copie], repertoire)
+
+
+def test_manifeste_et_partitions(chemin_ofgl, magasin, national):
+    manifeste = lire_manifeste(magasin)
+    assert [fichier['fichier'] for fichier in manifeste['fichiers']] == [os.path.abspath(chemin_ofgl)]
+    assert manifeste['fichiers'][0]['version'] == version_fichier(chemin_ofgl)
+    assert manifeste['version'] == version_magasin(manifeste['fichiers'])
+    attendues = sorted({(str(departement), int(exercice))
+                        for departement, exercice in national[['Code_Departement', 'Exercice']].itertuples(index=False)})
+    assert [tuple(partition) for partition in manifeste['partitions']] == attendues
+    assert manifeste['partitions'] == _partitions(magasin)
+
+
+def test_reingestion(chemin_ofgl, tmp_path):
+    # Deux fichiers sources : La Réunion et le reste du pays
+    brut = pd.read_csv(chemin_ofgl, sep=';', dtype=str, encoding='utf-8')
+    reunion = brut['Code Insee 2024 Département'] == '974'
+    chemins = {nom: str(tmp_path / f"{nom}.csv") for nom in ('reunion', 'metropole')}
+    brut[reunion].to_csv(chemins['reunion'], sep=';', index=False, encoding='utf-8')
+    brut[~reunion].to_csv(chemins['metropole'], sep=';', index=False, encoding='utf-8')
+    repertoire = str(tmp_path / 'magasin')
+
+    premiere = ingerer(list(chemins.values()), repertoire, nb_processus=2)
+    assert (len(premiere['rapports']), premiere['ignores']) == (2, 0)
+    # Versions inchangées : rien n'est relu
+    seconde = ingerer(list(chemins.values()), repertoire, nb_processus=2)
+    assert (seconde['rapports'], seconde['ignores']) == ([], 2)
+    assert seconde['manifeste'] == premiere['manifeste']
+
+    # Un département retiré du fichier métropolitain : seul ce fichier est relu, sa partition disparaît
+    metropole = brut[~reunion]
+    retire = metropole['Code Insee 2024 Département'].iloc[0]
+    metropole[metropole['Code Insee 2024 Département'] != retire].to_csv(chemins['metropole'], sep=';', index=False,
+                                                                           encoding='utf-8')
+    troisieme = ingerer(list(chemins.values()), repertoire, nb_processus=2)
+    assert [rapport['fichier'] for rapport in troisieme['rapports']] == [os.path.abspath(chemins['metropole'])]
+    assert troisieme['ignores'] == 1
+    assert troisieme['manifeste']['version'] != premiere['manifeste']['version']
+    departements = {departement for departement, _ in troisieme['manifeste']['partitions']}
+    assert retire not in departements and '974' in departements
+    assert magasin_a_jour(list(chemins.values()), repertoire)
@@ -0,0 +1,95 @@
+# test_memoire.py - Cache sous budget mémoire : éviction LRU pondérée, invalidation par version, clés du décorateur
+import numpy as np
+
+from memoire import GestionnaireCache, taille_objet
+
+
+def tableau(mo):
+    """Tableau d'environ mo mégaoctets"""
+    return np.zeros(int(mo * 1_000_000) // 8)
+
+
+def compteur():
+    """Fonction de calcul qui compte ses appels"""
+    appels = []
+
+    def calculer(valeur):
+        def _():
+            appels.append(valeur)
+            return valeur
+        return _
+    return appels, calculer
+
+
+def test_succes_et_echecs():
+    cache = GestionnaireCache(budget_mo=10)
+    appels, calculer = compteur()
+    assert cache.obtenir('tables', 'a', calculer(1)) == 1
+    assert cache.obtenir('tables', 'a', calculer(2)) == 1
+    assert appels == [1]
+    stats, _ = cache.statistiques()
+    ligne = stats.set_index('espace').loc['tables']
+    assert (ligne['succes'], ligne['echecs'], ligne['entrees']) == (1, 1, 1)
+
+
+def test_eviction_des_moins_recemment_utilisees_selon_la_taille():
+    cache = GestionnaireCache(budget_mo=10)
+    for cle in 'abc':
+        cache.obtenir('tables', cle, lambda: tableau(3))
+    cache.obtenir('tables', 'a', lambda: tableau(3))  # 'a' redevient la plus récente
+    cache.obtenir('figures', 'd', lambda: tableau(4))  # 13 Mo : 'b' puis rien d'autre à évincer
+
+    cles = [cle for _, _, cle in cache._entrees]
+    assert cles == ['c', 'a', 'd']
+    assert cache._occupation <= cache.budget_octets
+    assert cache._occupation == sum(taille for _, taille in cache._entrees.values())
+    stats, resume = cache.statistiques()
+    assert stats.set_index('espace').loc['tables', 'evictions'] == 1
+    assert resume['occupation_mo'] <= resume['budget_mo']
+
+
+def test_entree_plus_grande_que_le_budget_refusee():
+    cache = GestionnaireCache(budget_mo=1)
+    cache.obtenir('tables', 'petite', lambda: tableau(0.5))
+    valeur = cache.obtenir('tables', 'enorme', lambda: tableau(2))
+    assert len(valeur) == int(2_000_000) // 8
+    assert [cle for _, _, cle in cache._entrees] == ['petite']
+    assert cache.statistiques()[0].set_index('espace').loc['tables', 'refus'] == 1
+
+
+def test_invalidation_par_version():
+    cache = GestionnaireCache(budget_mo=10)
+    cache.obtenir('tables', 'ratios', lambda: 'v1', version='v1')
+    cache.obtenir('figures', 'carte', lambda: 'v1', version='v1')
+    cache.obtenir('styles', 'css', lambda: 'commun')  # sans version : conservée
+
+    assert cache.invalider('v1') == 0
+    assert cache.invalider('v2') == 2
+    assert [cle for _, _, cle in cache._entrees] == ['css']
+    assert cache._occupation == taille_objet('commun')
+    assert cache.obtenir('tables', 'ratios', lambda: 'v2', version='v2') == 'v2'
+
+
+def test_decorateur_ignore_les_parametres_prives():
+    cache = GestionnaireCache(budget_mo=10)
+    appels = []
+
+    @cache.en_cache('tables')
+    def charger(version, perimetre, _df):
+        appels.append((version, perimetre))
+        return len(_df)
+
+    assert charger('v1', '974', [1, 2]) == 2
+    assert charger('v1', '974', [1, 2, 3]) == 2  # _df hors de la clé : même entrée
+    assert charger('v1', '13', [1, 2, 3]) == 3
+    assert charger(version='v1', perimetre=['a', 'b'], _df=[1]) == 1  # paramètres non hachables convertis
+    assert appels == [('v1', '974'), ('v1', '13'), ('v1', ['a', 'b'])]
+
+    cache.invalider('v2')
+    assert charger('v2', '974', [1]) == 1
+    assert len(appels) == 4
+
+
+def test_taille_objet():
+    assert taille_objet(tableau(1)) == 1_000_000
+    assert taille_objet({'a': tableau(1), 'b': [tableau(1)]}) > 2_000_000
@@ -0,0 +1,67 @@
+# test_profils.py - Communes similaires : arbre KD comparé à la distance calculée pour toutes les paires
+import numpy as np
+import pytest
+
+import profils
+from profils import communes_similaires, index_similarite
+
+NB_VOISINS = 5
+
+
+@pytest.fixture(scope='module')
+def index(ratios):
+    """Index de similarité du dernier exercice"""
+    return index_similarite(ratios, ratios['Exercice'].max())
+
+
+def voisins_force_brute(index, code_commune, k, departement=None):
+    """Référence : distances à toutes les autres communes (du département), triées"""
+    communes, matrice = index['communes'], index['matrice']
+    point = matrice[index['positions'][code_commune]]
+    distances = np.sqrt(((matrice - point) ** 2).sum(axis=1))
+    autres = (communes['Code_Commune'] != code_commune).to_numpy()
+    if departement is not None:
+        autres = autres & (communes['Code_Departement'] == departement).to_numpy()
+    candidats = np.flatnonzero(autres)
+    ordre = candidats[np.argsort(distances[candidats], kind='stable')][:k]
+    return communes['Commune'].iloc[ordre].tolist(), distances[ordre]
+
+
+def verifier(index, communes):
+    """Chaque commune : voisins nationaux et départementaux identiques à la force brute"""
+    for code, departement in communes:
+        for restriction in (None, departement):
+            resultat, _ = communes_similaires(index, code, NB_VOISINS, departement=restriction)
+            noms, distances = voisins_force_brute(index, code, NB_VOISINS, restriction)
+            assert resultat['Commune'].tolist() == noms, (code, restriction)
+            np.testing.assert_allclose(resultat['Distance'], distances, rtol=1e-12)
+
+
+def test_voisins_egaux_a_la_force_brute(index):
+    pytest.importorskip('scipy')
+    assert index['arbre'] is not None
+    verifier(index, index['communes'][['Code_Commune', 'Code_Departement']].itertuples(index=False))
+
+
+def test_voisins_sans_scipy(ratios, monkeypatch):
+    monkeypatch.setattr(profils, 'cKDTree', None)
+    index = index_similarite(ratios, ratios['Exercice'].max())
+    assert index['arbre'] is None
+    verifier(index, index['communes'][['Code_Commune', 'Code_Departement']].itertuples(index=False))
+
+
+def test_commune_inconnue(index):
+    resultat, _ = communes_similaires(index, 'inconnue')
+    assert resultat.empty
+
+
+def test_arbre_par_departement(index):
+    pytest.importorskip('scipy')
+    departements = index['communes']['Code_Departement']
+    assert set(index['arbres_departements']) == set(departements)
+    # Chaque arbre ne contient que les communes de son département
+    for departement, arbre in index['arbres_departements'].items():
+        assert arbre.n == (departements == departement).sum()
+    code = index['communes']['Code_Commune'].iloc[0]
+    resultat, _ = communes_similaires(index, code, departement='inexistant')
+    assert resultat.empty
@@ -0,0 +1,62 @@
+# test_projection.py - Projection Monte Carlo : découpage en lots sans effet et récurrence comparée à une boucle
+import numpy as np
+import pandas as pd
+import pytest
+
+import projection
+from projection import QUANTILES_PROJECTION, etat_initial, projeter
+
+# Sans volatilité toutes les trajectoires sont identiques : les résultats ne dépendent plus des tirages
+SCENARIO_DETERMINISTE = {'horizon': 6, 'nb_trajectoires': 4, 'volatilite': 0.0, 'choc_taux': 0.01,
+                         'annees_stagnation': 2}
+
+
+@pytest.fixture(scope='module')
+def ratios_exercice(ratios):
+    """Table des ratios du dernier exercice"""
+    return ratios[ratios['Exercice'] == ratios['Exercice'].max()]
+
+
+def projection_par_boucle(ratios, horizon, croissance_recettes, croissance_charges, taux_interet, choc_taux,
+                          annees_stagnation, part_investissement, **_):
+    """Référence : épargne et encours de la dernière année, commune par commune et année par année"""
+    _, etat = etat_initial(ratios, taux_interet)
+    resultats = []
+    for recettes, charges, encours, amortissement in zip(etat['recettes'], etat['charges'], etat['encours'],
+                                                         etat['taux_amortissement']):
+        for annee in range(horizon):
+            recettes *= 1 + (0.0 if annee < annees_stagnation else croissance_recettes)
+            charges *= 1 + croissance_charges
+            epargne = recettes - charges - encours * (taux_interet + choc_taux)
+            remboursement = encours * amortissement
+            encours += max(remboursement + part_investissement * recettes - epargne, 0) - remboursement
+        resultats.append((epargne, encours))
+    return np.array(resultats)
+
+
+def test_lots_sans_effet_sur_le_resultat(ratios_exercice, monkeypatch):
+    bandes, synthese, _ = projeter(ratios_exercice, **SCENARIO_DETERMINISTE)
+    # Budget mémoire réduit : un lot de 3 communes seulement
+    monkeypatch.setattr(projection, 'BUDGET_LOT_OCTETS', 3 * 4 * 6 * 4 * projection.NB_TABLEAUX_LOT)
+    bandes_lots, synthese_lots, _ = projeter(ratios_exercice, **SCENARIO_DETERMINISTE)
+
+    assert len(synthese) == ratios_exercice[['recettes_hab', 'epargne_hab']].dropna().shape[0] > 3
+    pd.testing.assert_frame_equal(bandes_lots, bandes)
+    pd.testing.assert_frame_equal(synthese_lots, synthese)
+
+
+def test_recurrence_egale_la_boucle(ratios_exercice):
+    hypotheses = {**projection.HYPOTHESES_DEFAUT, **SCENARIO_DETERMINISTE}
+    _, synthese, _ = projeter(ratios_exercice, **SCENARIO_DETERMINISTE)
+    reference = projection_par_boucle(ratios_exercice, **hypotheses)
+
+    # Calcul vectorisé en float32
+    np.testing.assert_allclose(synthese['epargne_hab_mediane'], reference[:, 0], rtol=1e-4, atol=1e-2)
+    np.testing.assert_allclose(synthese['encours_hab_median'], reference[:, 1], rtol=1e-4, atol=1e-2)
+
+
+def test_bandes_ordonnees(ratios_exercice):
+    bandes, synthese, _ = projeter(ratios_exercice, horizon=4, nb_trajectoires=200)
+    percentiles = bandes[[f"p{q}" for q in QUANTILES_PROJECTION]].to_numpy()
+    assert (np.diff(percentiles, axis=1) >= 0).all()
+    assert synthese['probabilite_depassement'].between(0, 100).all()
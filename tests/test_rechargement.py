@@ -0,0 +1,120 @@
+# test_rechargement.py - Rechargement à chaud : bascule après préchauffage, versions stables, erreurs tolérées
+import shutil
+import threading
+import time
+
+import pytest
+
+import rechargement
+from rechargement import NB_CONTROLES_STABLES, SurveillantDonnees, version_source
+
+# Attente maximale d'un rechargement par le fil de surveillance
+DELAI_S = 30
+
+
+@pytest.fixture
+def source(chemin_ofgl, tmp_path):
+    """Copie modifiable du fichier synthétique"""
+    chemin = str(tmp_path / 'ofgl.csv')
+    shutil.copy(chemin_ofgl, chemin)
+    return chemin
+
+
+def modifier(chemin):
+    """Nouvelle version du fichier, même contenu (taille changée)"""
+    with open(chemin, 'a', encoding='utf-8') as f:
+        f.write('\n')
+
+
+def attendre(condition):
+    fin = time.monotonic() + DELAI_S
+    while not condition():
+        assert time.monotonic() < fin, "délai de rechargement dépassé"
+        time.sleep(0.02)
+
+
+def test_bascule_apres_prechauffage(source):
+    versions_servies = []
+    surveillant = SurveillantDonnees(source, prechauffer=lambda df, rapport: versions_servies.append(
+        (surveillant.version, rapport['version'])))
+    surveillant.recharger()
+    ancienne = surveillant.version
+    assert (surveillant.nb_rechargements, surveillant.erreur, versions_servies) == (1, None, [])
+
+    modifier(source)
+    surveillant.recharger()
+    # Pendant le préchauffage, l'ancienne version était encore servie
+    assert versions_servies == [(ancienne, version_source(source))]
+    assert surveillant.version == version_source(source) != ancienne
+    assert surveillant.nb_rechargements == 2
+
+
+@pytest.mark.parametrize('panne', ['prechauffage', 'fichier'])
+def test_echec_du_rechargement_conserve_l_ancienne_version(source, panne):
+    def prechauffer(df, rapport):
+        if panne == 'prechauffage':
+            raise ValueError("préchauffage impossible")
+
+    surveillant = SurveillantDonnees(source, prechauffer=prechauffer)
+    surveillant.recharger()
+    courant = surveillant.courant
+
+    if panne == 'fichier':
+        open(source, 'w').close()  # fichier tronqué pendant une copie
+    else:
+        modifier(source)
+    surveillant.recharger()
+    assert surveillant.courant is courant
+    assert surveillant.erreur
+    assert (surveillant.nb_rechargements, surveillant.rechargement_en_cours) == (1, False)
+
+
+def test_rechargement_apres_versions_stables(source, monkeypatch):
+    surveillant = SurveillantDonnees(source, intervalle_s=0)
+    surveillant.recharger()
+    servie = surveillant.version
+    rechargements = []
+    monkeypatch.setattr(surveillant, 'recharger', lambda: rechargements.append(controles[0]))
+
+    # Fichier en cours d'écriture (a puis b), puis b stable ; une erreur de lecture ne compte pas
+    sequence = ['a', 'b', OSError("fichier verrouillé"), servie, 'c'] + ['d'] * NB_CONTROLES_STABLES
+    controles = [0]
+
+    def version_scriptee(_):
+        if controles[0] == len(sequence):
+            surveillant._arret.set()
+            return servie
+        valeur = sequence[controles[0]]
+        controles[0] += 1
+        if isinstance(valeur, Exception):
+            raise valeur
+        return valeur
+
+    monkeypatch.setattr(rechargement, 'version_source', version_scriptee)
+    surveillant._surveiller()
+    assert rechargements == [len(sequence)]
+    assert surveillant.erreur == "fichier verrouillé"
+
+
+def test_surveillance_survit_a_un_echec(source):
+    panne = threading.Event()
+    panne.set()
+
+    def prechauffer(df, rapport):
+        if panne.is_set():
+            raise RuntimeError("erreur inattendue")
+
+    surveillant = SurveillantDonnees(source, prechauffer=prechauffer, intervalle_s=0.01).demarrer()
+    try:
+        ancienne = surveillant.version
+        modifier(source)
+        attendre(lambda: surveillant.erreur is not None)
+        assert surveillant.version == ancienne
+        # Le fil tourne toujours : la nouvelle version est chargée dès que le préchauffage réussit
+        panne.clear()
+        attendre(lambda: surveillant.nb_rechargements == 2)
+        assert surveillant._fil.is_alive()
+        assert surveillant.version == version_source(source) != ancienne
+        assert surveillant.erreur is None
+    finally:
+        surveillant.arreter()
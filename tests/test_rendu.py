@@ -0,0 +1,47 @@
+# test_rendu.py - Explorateur paginé : recherche et tri par positions comparés à un filtrage ligne à ligne
+import numpy as np
+import pandas as pd
+import pytest
+
+from rendu import page_explorateur, positions_explorateur
+
+COLONNES_RECHERCHE = ['Commune', 'Zone']
+
+
+@pytest.fixture
+def table():
+    """Petite table avec texte, catégories et valeurs manquantes"""
+    return pd.DataFrame({
+        'Commune': ['Saint-Denis', 'Le Port', 'Sainte-Marie', None, 'Cilaos', 'Saint-Paul', 'Le Tampon'],
+        'Zone': pd.Categorical(['Nord', 'Ouest', 'Nord', 'Sud', None, 'Ouest', 'Sud']),
+        'epargne_hab': [120.0, np.nan, 80.0, 80.0, -15.0, np.nan, 200.0],
+    }, index=[10, 11, 12, 13, 14, 15, 16])
+
+
+def positions_par_boucle(df, recherche, tri, croissant):
+    """Référence : test de chaque ligne puis tri stable, valeurs manquantes en dernier"""
+    retenues = [position for position, (_, ligne) in enumerate(df.iterrows())
+                if not recherche or any(pd.notna(ligne[colonne]) and recherche.lower() in str(ligne[colonne]).lower()
+                                        for colonne in COLONNES_RECHERCHE)]
+    if tri is None:
+        return retenues
+    valeurs = df[tri].to_numpy()
+    renseignees = [position for position in retenues if pd.notna(valeurs[position])]
+    manquantes = [position for position in retenues if pd.isna(valeurs[position])]
+    return sorted(renseignees, key=lambda position: valeurs[position], reverse=not croissant) + manquantes
+
+
+@pytest.mark.parametrize('recherche', ['', 'saint', 'NORD', 'le ', 'absent'])
+@pytest.mark.parametrize('tri, croissant', [(None, True), ('epargne_hab', True), ('epargne_hab', False),
+                                            ('Commune', True)])
+def test_positions_egales_a_la_boucle(table, recherche, tri, croissant):
+    positions = positions_explorateur(table, recherche, COLONNES_RECHERCHE, tri, croissant)
+    assert positions.tolist() == positions_par_boucle(table, recherche, tri, croissant)
+
+
+def test_page_explorateur(table):
+    positions = positions_explorateur(table, 'e', COLONNES_RECHERCHE, 'epargne_hab', croissant=False)
+    pages = [page_explorateur(table, positions, ['Commune', 'epargne_hab'], page, 2) for page in (1, 2, 3, 4)]
+    assert len(positions) == 5
+    assert [len(page) for page in pages] == [2, 2, 1, 0]
+    pd.testing.assert_frame_equal(pd.concat(pages), table.iloc[positions][['Commune', 'epargne_hab']])
@@ -0,0 +1,61 @@
+# test_statique.py - Site statique : reconstruction incrémentale par empreinte, centroïdes limités à chaque page
+import pandas as pd
+import pytest
+
+from chargement import codes_insee
+from indicateurs import table_ratios
+from rechargement import charger_source
+from statique import construire_site, taches_pages
+
+pytest.importorskip('folium')
+
+# Communes de La Réunion retenues pour le site de test
+NB_COMMUNES_SITE = 3
+
+
+@pytest.fixture
+def source(chemin_ofgl, tmp_path):
+    """Extrait du fichier synthétique : quelques communes de La Réunion"""
+    brut = pd.read_csv(chemin_ofgl, sep=';', dtype=str, encoding='utf-8')
+    brut = brut[brut['Code Insee 2024 Département'] == '974']
+    brut = brut[brut['Code Insee 2024 Commune'].isin(brut['Code Insee 2024 Commune'].unique()[:NB_COMMUNES_SITE])]
+    chemin = str(tmp_path / 'ofgl.csv')
+    brut.to_csv(chemin, sep=';', index=False, encoding='utf-8')
+    return chemin
+
+
+def test_centroides_de_la_page(source, tmp_path):
+    df, _ = charger_source(source)
+    ratios = table_ratios(df)
+    codes = codes_insee(ratios['Code_Commune']).unique()
+    # Table nationale fictive : des centroïdes pour les communes du site et pour bien d'autres
+    centroides = pd.DataFrame({'Latitude': -21.0, 'Longitude': 55.5},
+                              index=pd.Index(list(codes) + [f"{numero:05d}" for numero in range(1000, 3000)],
+                                             dtype='string'))
+
+    for tache in taches_pages(df, ratios, centroides, '974', str(tmp_path)):
+        attendus = set(codes_insee(tache['ratios']['Code_Commune']))
+        assert set(tache['centroides'].index) == attendus, tache['nom']
+        assert len(tache['centroides']) == (len(codes) if tache['nom'].startswith('perimetre') else 1)
+
+
+def test_reconstruction_incrementale(source, tmp_path):
+    sortie = str(tmp_path / 'site')
+    premiere = construire_site(source, sortie, '974', nb_processus=2)
+    assert premiere['rendues'] == premiere['pages'] > 0
+
+    # Empreintes inchangées : aucune page rendue
+    assert construire_site(source, sortie, '974', nb_processus=2)['rendues'] == 0
+
+    # Un montant d'une commune modifié : sa page et celle du département pour cet exercice
+    brut = pd.read_csv(source, sep=';', dtype=str, encoding='utf-8')
+    montant = float(brut.loc[0, 'Montant']) + 100_000
+    brut.loc[0, 'Montant'] = str(montant)
+    brut.loc[0, 'Montant en € par habitant'] = f"{montant / float(brut.loc[0, 'Population totale']):.2f}"
+    brut.to_csv(source, sep=';', index=False, encoding='utf-8')
+    resultat = construire_site(source, sortie, '974', nb_processus=2)
+    assert (resultat['rendues'], resultat['pages']) == (2, premiere['pages'])
+
+    # Reconstruction complète demandée
+    assert construire_site(source, sortie, '974', nb_processus=2, tout_reconstruire=True)['rendues'] == \
+        premiere['pages']
@@ -0,0 +1,72 @@
+# test_validation.py - Contrôles de qualité à l'ingestion : conversions, doublons, ratios, agrégats manquants
+import pandas as pd
+import pytest
+
+from chargement import charger_fichier
+from indicateurs import AGREGAT_ENCOURS, TYPE_BUDGET_PRINCIPAL
+from validation import COLONNES_REQUISES, MOTIFS_QUARANTAINE, valider
+
+COLONNE_AGREGAT = 'Agrégat'
+
+
+@pytest.fixture
+def fichier_defectueux(chemin_ofgl, tmp_path):
+    """Extrait du fichier synthétique avec un défaut connu par contrôle ; renvoie le chemin et les lignes visées"""
+    brut = pd.read_csv(chemin_ofgl, sep=';', dtype=str, encoding='utf-8')
+    communes = brut['Code Insee 2024 Commune'].unique()[:3]
+    brut = brut[brut['Code Insee 2024 Commune'].isin(communes)]
+    # Agrégat manquant : l'encours de la première (exercice, commune) supprimé
+    principal = brut['Type de budget'] == TYPE_BUDGET_PRINCIPAL
+    encours = brut.index[principal & (brut[COLONNE_AGREGAT] == AGREGAT_ENCOURS)][0]
+    incomplete = brut.loc[encours, ['Exercice', 'Code Insee 2024 Commune']].tolist()
+    brut = brut.drop(index=encours).reset_index(drop=True)
+
+    principal = brut.index[brut['Type de budget'] == TYPE_BUDGET_PRINCIPAL]
+    defauts = {
+        'montant': principal[0],
+        'strate': principal[1],
+        'par_habitant': principal[2],
+        'ratio': principal[3],
+    }
+    brut.loc[defauts['montant'], 'Montant'] = 'n.c.'
+    brut.loc[defauts['strate'], 'Strate population 2024'] = 'NC'
+    brut.loc[defauts['par_habitant'], 'Montant en € par habitant'] = '?'
+    brut.loc[defauts['ratio'], 'Montant en € par habitant'] = '99999'
+    # Doublon : une autre ligne principale répétée en fin de fichier
+    brut = pd.concat([brut, brut.loc[[principal[4]]]], ignore_index=True)
+
+    chemin = str(tmp_path / 'ofgl-defauts.csv')
+    brut.to_csv(chemin, sep=';', index=False, encoding='utf-8')
+    return chemin, len(brut), defauts, incomplete
+
+
+def test_controles_ligne_a_ligne(fichier_defectueux):
+    chemin, nb_lignes, defauts, incomplete = fichier_defectueux
+    df, rapport = charger_fichier(chemin, departement=None)
+    valides, qualite = valider(df, rapport['pertes_conversion'])
+
+    comptes = qualite['controles'].set_index('controle')['lignes'].to_dict()
+    # Montant et montant par habitant illisibles : quarantaine ; strate illisible : seulement comptée
+    assert comptes == {'conversion': 2, 'doublon': 1, 'ratio': 1}
+    assert qualite['pertes_conversion'] == {'Montant': 1, 'Strate_population': 1, 'Montant_par_habitant': 1}
+    assert set(qualite['quarantaine']['Motif']) == {'conversion', 'doublon', 'ratio'}
+    assert (qualite['lignes_quarantaine'], len(valides)) == (4, nb_lignes - 4)
+    assert defauts['strate'] in valides.index and pd.isna(valides.loc[defauts['strate'], 'Strate_population'])
+    for nom in ('montant', 'par_habitant', 'ratio'):
+        assert defauts[nom] not in valides.index, nom
+    assert list(qualite['controles']['controle']) == list(MOTIFS_QUARANTAINE)
+
+    manquants = qualite['agregats_manquants']
+    assert len(manquants) == 1
+    assert [str(valeur) for valeur in manquants.iloc[0][['Exercice', 'Code_Commune']]] == incomplete
+    assert AGREGAT_ENCOURS in manquants.iloc[0]['Agregats_manquants']
+    assert qualite['colonnes_manquantes'] == []
+
+
+def test_colonnes_manquantes(donnees):
+    absentes = ['Population', 'Montant_par_habitant']
+    valides, qualite = valider(donnees.drop(columns=absentes))
+    assert qualite['colonnes_manquantes'] == [colonne for colonne in COLONNES_REQUISES if colonne in absentes]
+    # Sans ces colonnes, le contrôle des ratios ne s'applique pas
+    assert qualite['controles'].set_index('controle').loc['ratio', 'lignes'] == 0
+    assert len(valides) == len(donnees) - qualite['lignes_quarantaine']
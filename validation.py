@@ -0,0 +1,134 @@
+# validation.py - Contrôles vectorisés des données OFGL à l'ingestion et mise en quarantaine
+import time
+
+import numpy as np
+import pandas as pd
+
+from indicateurs import AGREGATS_INDICATEURS, TYPE_BUDGET_PRINCIPAL
+
+# ============================================
+# RÈGLES DE VALIDATION
+# ============================================
+
+# Colonnes sans lesquelles le dashboard ne peut pas fonctionner
+COLONNES_REQUISES = ['Exercice', 'Code_Departement', 'Code_Commune', 'Commune', 'Type_budget',
+                     'Agregat', 'Montant', 'Population', 'Montant_par_habitant']
+
+# Clé d'une ligne OFGL : un montant par (exercice, commune, budget, agrégat)
+CLES_LIGNE = ['Exercice', 'Code_Commune', 'Siret_Budget', 'Libelle_Budget', 'Agregat']
+
+# Colonnes dont une valeur non numérique écarte la ligne (les autres pertes sont seulement signalées)
+COLONNES_CONVERSION_BLOQUANTES = ['Montant', 'Population', 'Montant_par_habitant']
+
+# Écart toléré entre Montant_par_habitant et Montant / Population (arrondis OFGL)
+TOLERANCE_RATIO_ABSOLUE = 0.01  # €/hab
+TOLERANCE_RATIO_RELATIVE = 0.01
+
+# Motifs de quarantaine d'une ligne, dans l'ordre d'affichage
+MOTIFS_QUARANTAINE = {
+    'conversion': "Montant, population ou montant par habitant non numérique",
+    'doublon': "Clé (exercice, commune, budget, agrégat) en double",
+    'ratio': "Montant par habitant incohérent avec Montant / Population",
+}
+
+
+# ============================================
+# CONTRÔLES
+# ============================================
+
+def lignes_converties_en_nan(pertes_conversion, index, colonnes=COLONNES_CONVERSION_BLOQUANTES):
+    """Lignes dont une valeur d'une colonne bloquante est devenue NaN à la conversion"""
+    masque = np.zeros(len(index), dtype=bool)
+    for colonne in colonnes:
+        if colonne in pertes_conversion:
+            masque |= index.isin(pertes_conversion[colonne])
+    return masque
+
+
+def lignes_en_double(df):
+    """Occurrences surnuméraires d'une même clé de ligne (la première est conservée)"""
+    cles = [colonne for colonne in CLES_LIGNE if colonne in df.columns]
+    if 'Agregat' not in cles or 'Code_Commune' not in cles:
+        return np.zeros(len(df), dtype=bool)
+    return df.duplicated(cles, keep='first').to_numpy()
+
+
+def ratios_incoherents(df):
+    """Montant par habitant éloigné de Montant / Population au-delà de la tolérance"""
+    if not {'Montant', 'Population', 'Montant_par_habitant'} <= set(df.columns):
+        return np.zeros(len(df), dtype=bool)
+    population = df['Population'].to_numpy(dtype=np.float64)
+    montant = df['Montant'].to_numpy(dtype=np.float64)
+    par_habitant = df['Montant_par_habitant'].to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        attendu = montant / population
+    ecart = np.abs(par_habitant - attendu)
+    tolerance = np.maximum(TOLERANCE_RATIO_ABSOLUE, TOLERANCE_RATIO_RELATIVE * np.abs(attendu))
+    # Comparaison seulement si les trois valeurs sont disponibles et la population positive
+    return (population > 0) & np.isfinite(attendu) & np.isfinite(par_habitant) & (ecart > tolerance)
+
+
+def agregats_manquants(df, agregats=AGREGATS_INDICATEURS):
+    """(exercice, commune) dont le budget principal n'a pas tous les agrégats utilisés par les onglets"""
+    colonnes = ['Exercice', 'Code_Commune', 'Commune']
+    if not set(colonnes + ['Type_budget', 'Agregat']) <= set(df.columns):
+        return pd.DataFrame(columns=colonnes + ['Agregats_manquants'])
+    principal = df.loc[df['Type_budget'] == TYPE_BUDGET_PRINCIPAL, colonnes + ['Agregat']]
+    groupes = principal.groupby(['Exercice', 'Code_Commune'], sort=True)
+    paires = groupes.ngroup().to_numpy()
+    codes = pd.Index(agregats).get_indexer(principal['Agregat'])  # -1 : agrégat non suivi
+
+    # Matrice de présence (commune-exercice x agrégat) remplie en une affectation
+    presence = np.zeros((paires.max() + 1 if len(paires) else 0, len(agregats)), dtype=bool)
+    retenus = codes >= 0
+    presence[paires[retenus], codes[retenus]] = True
+    incompletes = np.flatnonzero(~presence.all(axis=1))
+    if not len(incompletes):
+        return pd.DataFrame(columns=colonnes + ['Agregats_manquants'])
+
+    manquants = groupes[['Commune']].first().reset_index().iloc[incompletes].reset_index(drop=True)
+    libelles = np.array(agregats, dtype=object)
+    manquants['Agregats_manquants'] = [', '.join(libelles[~ligne]) for ligne in presence[incompletes]]
+    return manquants
+
+
+# ============================================
+# VALIDATION COMPLÈTE
+# ============================================
+
+def valider(df, pertes_conversion=None):
+    """Contrôle le fichier normalisé ; renvoie les lignes valides et le rapport de qualité (quarantaine incluse)"""
+    debut = time.perf_counter()
+    pertes_conversion = pertes_conversion or {}
+    colonnes_manquantes = [colonne for colonne in COLONNES_REQUISES if colonne not in df.columns]
+
+    motifs = pd.DataFrame({
+        'conversion': lignes_converties_en_nan(pertes_conversion, df.index),
+        'doublon': lignes_en_double(df),
+        'ratio': ratios_incoherents(df),
+    }, index=df.index)
+    en_quarantaine = motifs.any(axis=1).to_numpy()
+
+    quarantaine = df[en_quarantaine].copy()
+    if len(quarantaine):
+        # Motifs concaténés ('doublon, ratio') par produit booléen x libellés
+        quarantaine.insert(0, 'Motif', motifs[en_quarantaine].dot(motifs.columns + ', ').str.rstrip(', '))
+
+    controles = pd.DataFrame({
+        'controle': list(MOTIFS_QUARANTAINE),
+        'description': list(MOTIFS_QUARANTAINE.values()),
+        'lignes': motifs.sum().reindex(list(MOTIFS_QUARANTAINE)).to_numpy(),
+    })
+    manquants = agregats_manquants(df)
+
+    qualite = {
+        'lignes_controlees': len(df),
+        'lignes_quarantaine': int(en_quarantaine.sum()),
+        'colonnes_manquantes': colonnes_manquantes,
+        'pertes_conversion': {colonne: len(etiquettes) for colonne, etiquettes in pertes_conversion.items()},
+        'controles': controles,
+        'quarantaine': quarantaine,
+        'agregats_manquants': manquants,
+        'duree_s': time.perf_counter() - debut,
+    }
+    return df[~en_quarantaine], qualite